@@ -0,0 +1,136 @@
+"""
+Frozen and duplicate clip detection.
+
+A camera whose stream has frozen, or that shows a static "stream offline"
+slate, still produces a clip on every run. The capture's FFmpeg run also writes
+a decimated copy of the video, ANALYSIS_FPS frames a second scaled to
+ANALYSIS_SIZE x ANALYSIS_SIZE grayscale, as raw bytes (about 1 KiB a frame).
+Those frames are scored in one vectorized NumPy pass:
+
+- motion: the largest mean absolute difference between consecutive frames,
+  on the 0-255 pixel scale. Below FROZEN_MAX_MOTION nothing moved: frozen.
+- a 64-bit difference hash (dHash) of the clip's mean frame, and the mean
+  frame itself, compared with the camera's previous clip. A hash within
+  DUPLICATE_MAX_DISTANCE bits and a mean frame within DUPLICATE_MAX_DIFF of
+  the previous one is a duplicate. The pixel check keeps a scene that merely
+  has the same layout, at another time of day, from counting.
+
+With FROZEN_ACTION=skip, frozen and duplicate clips aren't uploaded; with the
+default flag they are uploaded and marked in the job record.
+
+The analysis is off unless ANALYSIS_ENABLED is set, because it isn't free: the
+frames have to be decoded, so FFmpeg decodes every video frame of the clip even
+when the clip itself is stream copied. For a 15 s 720p30 H.264 clip that took
+the run from 0.02 to 1.5 CPU seconds, about a tenth of a core per capture.
+Decoding only keyframes is not an option, since -skip_frame applies to the
+input's one decoder, which also feeds a transcode and the stills.
+
+NumPy adds a good tenth of a second to the app's import time, so it is
+imported when the first clip is analysed.
+"""
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+import os
+
+if TYPE_CHECKING:
+    import numpy as np
+
+ANALYSIS_ENABLED = os.getenv("ANALYSIS_ENABLED", "false").lower() in ("1", "true", "yes")
+ANALYSIS_FPS = float(os.getenv("ANALYSIS_FPS", "2"))
+ANALYSIS_SIZE = int(os.getenv("ANALYSIS_SIZE", "32"))
+FROZEN_MAX_MOTION = float(os.getenv("FROZEN_MAX_MOTION", "0.5"))
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "4"))
+DUPLICATE_MAX_DIFF = float(os.getenv("DUPLICATE_MAX_DIFF", "1.0"))
+# flag: upload and mark frozen/duplicate clips, skip: don't upload them
+FROZEN_ACTION = os.getenv("FROZEN_ACTION", "flag")
+if FROZEN_ACTION not in ("flag", "skip"):
+    raise ValueError(f"FROZEN_ACTION must be flag or skip, got {FROZEN_ACTION!r}")
+
+
+def analysis_output_args(path: str, duration: float, fps: float = ANALYSIS_FPS, size: int = ANALYSIS_SIZE) -> list[str]:
+    """
+    FFmpeg output options writing the first duration seconds of the first input's video to path as
+    small raw grayscale frames. The clip's -t only bounds the clip, so this output needs its own;
+    without it FFmpeg would keep reading a live stream forever.
+    """
+    return ["-map", "0:v:0", "-t", f"{duration:g}", "-vf", f"fps={fps:g},scale={size}:{size},format=gray",
+            "-f", "rawvideo", path]
+
+
+def load_frames(path: str, size: int = ANALYSIS_SIZE) -> "np.ndarray":
+    """The frames FFmpeg wrote to path, as an (n, size, size) uint8 array."""
+    import numpy as np
+
+    data = np.fromfile(path, dtype=np.uint8)
+    return data[:len(data) // (size * size) * size * size].reshape(-1, size, size)
+
+
+def dhash(frame: "np.ndarray") -> int:
+    """64-bit difference hash: whether each of 8x8 cells is brighter than its right neighbour."""
+    import numpy as np
+
+    height, width = frame.shape
+    # Average down to 8 rows of 9 cells; the frame is cropped to a multiple of that grid
+    rows, cols = height // 8 * 8, width // 9 * 9
+    cells = frame[:rows, :cols].reshape(8, rows // 8, 9, cols // 9).mean(axis=(1, 3))
+    bits = (cells[:, 1:] > cells[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+@dataclass
+class ClipAnalysis:
+    frames: int
+    motion: float
+    hash: int
+    mean_frame: "np.ndarray"
+    frozen: bool
+    duplicate: bool = False
+    previous_distance: Optional[int] = None
+    previous_diff: Optional[float] = None
+
+    @property
+    def verdict(self) -> Optional[str]:
+        return "frozen" if self.frozen else "duplicate" if self.duplicate else None
+
+    def to_dict(self):
+        return {
+            "frames": self.frames,
+            "motion": round(self.motion, 3),
+            "hash": f"{self.hash:016x}",
+            "frozen": self.frozen,
+            "duplicate": self.duplicate,
+            "previous_distance": self.previous_distance,
+            "previous_diff": None if self.previous_diff is None else round(self.previous_diff, 3),
+        }
+
+
+def analyze_frames(frames: "np.ndarray", previous: Optional[ClipAnalysis] = None,
+                   frozen_max_motion: float = FROZEN_MAX_MOTION, duplicate_max_distance: int = DUPLICATE_MAX_DISTANCE,
+                   duplicate_max_diff: float = DUPLICATE_MAX_DIFF) -> ClipAnalysis:
+    """Score a clip's decimated frames, against the same camera's previous clip when there is one."""
+    import numpy as np
+
+    if len(frames) == 0:
+        raise ValueError("No frames to analyze")
+    pixels = frames.astype(np.int16)
+    motion = float(np.abs(np.diff(pixels, axis=0)).mean(axis=(1, 2)).max()) if len(frames) > 1 else 0.0
+    mean_frame = pixels.mean(axis=0)
+    result = ClipAnalysis(len(frames), motion, dhash(mean_frame), mean_frame, frozen=motion < frozen_max_motion)
+    if previous is not None and previous.mean_frame.shape == mean_frame.shape:
+        result.previous_distance = (result.hash ^ previous.hash).bit_count()
+        result.previous_diff = float(np.abs(mean_frame - previous.mean_frame).mean())
+        result.duplicate = (result.previous_distance <= duplicate_max_distance
+                            and result.previous_diff <= duplicate_max_diff)
+    return result
+
+
+class ClipAnalyzer:
+    """Analyses clips camera by camera, remembering each camera's last clip to spot duplicates."""
+    def __init__(self):
+        self.previous: dict[str, ClipAnalysis] = {}
+
+    def analyze(self, camera_id: str, path: str) -> ClipAnalysis:
+        """Analyse the frames FFmpeg wrote to path for a clip of camera_id. Blocking; call it from a thread."""
+        result = analyze_frames(load_frames(path), self.previous.get(camera_id))
+        self.previous[camera_id] = result
+        return result
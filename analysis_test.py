@@ -0,0 +1,64 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from analysis import ClipAnalyzer, analysis_output_args, analyze_frames, dhash, load_frames
+
+SIZE = 32
+
+
+def scene(seed: int, frames: int = 20, moving: bool = True) -> np.ndarray:
+    """A textured scene; when moving, each frame shifts one pixel further across."""
+    texture = np.random.default_rng(seed).integers(0, 256, (SIZE, SIZE * 2), dtype=np.uint8)
+    return np.stack([texture[:, i if moving else 0:][:, :SIZE] for i in range(frames)])
+
+
+def test_dhash_of_similar_frames_is_close():
+    """Test that a brightness shift keeps the hash while a different scene changes about half its bits."""
+    frame = scene(1, frames=1)[0]
+    brighter = np.clip(frame.astype(np.int16) + 20, 0, 255).astype(np.uint8)
+    assert (dhash(frame) ^ dhash(brighter)).bit_count() <= 4
+    assert (dhash(frame) ^ dhash(scene(2, frames=1)[0])).bit_count() > 16
+
+
+def test_frozen_and_moving_clips():
+    """Test that a still clip is frozen, even with faint noise, and a moving one isn't."""
+    still = np.minimum(scene(1, moving=False), 254)
+    noise = np.random.default_rng(3).random(still.shape) < 0.1
+    assert analyze_frames(still + noise.astype(np.uint8)).verdict == "frozen"
+    moving = analyze_frames(scene(1))
+    assert moving.verdict is None
+    assert moving.motion > 10
+
+
+def test_duplicate_needs_the_same_picture():
+    """Test that a repeat of the previous clip is a duplicate, but the same scene in other light is not."""
+    first = analyze_frames(scene(1))
+    assert analyze_frames(scene(1), first).verdict == "duplicate"
+    darker = analyze_frames(scene(1) // 2 + 10, first)
+    assert darker.previous_distance <= 4
+    assert darker.verdict is None
+    assert analyze_frames(scene(2), first).verdict is None
+
+
+def test_analyzer_compares_clips_of_the_same_camera(tmp_path):
+    """Test that raw frames load from disk and only the same camera's previous clip counts."""
+    path = tmp_path / "frames.gray"
+    scene(1).tofile(path)
+    analyzer = ClipAnalyzer()
+    assert load_frames(str(path), SIZE).shape == (20, SIZE, SIZE)
+    assert analyzer.analyze("pier", str(path)).verdict is None
+    assert analyzer.analyze("seacliff", str(path)).verdict is None
+    assert analyzer.analyze("pier", str(path)).verdict == "duplicate"
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg")
+def test_analysis_output_ends_with_the_clip_on_an_endless_source(tmp_path):
+    """Test that the analysis output stops at the clip's length, so FFmpeg exits on a live source."""
+    frames = str(tmp_path / "frames.gray")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10",
+                    "-t", "3", "-c:v", "libx264", str(tmp_path / "clip.mp4"),
+                    *analysis_output_args(frames, 3, fps=2, size=SIZE)], check=True, timeout=30)
+    assert load_frames(frames, SIZE).shape == (6, SIZE, SIZE)
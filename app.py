@@ -1,53 +1,166 @@
 import json
-from collections import UserDict
-from datetime import datetime
-from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.responses import JSONResponse
-from google.cloud import storage
-from typing import Optional
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from fastapi import FastAPI, Query, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import JSONResponse, Response
+from typing import Optional, Sequence
+import analysis
+from backend import make_backend
+from broadcast import Broadcaster, ChannelHub
+from catalog import ClipCatalog, clip_entry
+from cameras import CAMERAS_FILE, DEFAULT_CAMERA, ENCODE_MODES, Camera, CameraRegistry, normalize_youtube_url
+from history import JobHistory
+from jobs import JobState, JobStore, TERMINAL_STATES
+import logs
+from logs import LogSampler, log_context
+import metrics
+from scheduler import CaptureScheduler, ScheduledCapture
+from quality import QualityCapture, QualityPolicy
+from session import Session, SegmentListSink
+from spool import ClipSpool, SpoolEntry, SpoolUploader
+import stills
+from sun_schedule import SUN_SCHEDULER_ENABLED, SunEventPlanner
+from uploader import GcsUploader, make_storage_client
 import asyncio
+import dataclasses
 import logging
+import math
 import os
-import subprocess
+import re
+import shutil
+import threading
+import time
 import traceback
 import uuid
 import urllib.request
 
-app = FastAPI()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await state_backend.start(handle_replica_event)
+    worker_pool.start()
+    egress_monitor.start()
+    job_history.start()
+    await asyncio.to_thread(clip_spool.recover)
+    spool_uploader.start()
+    readiness.start()
+    capture_scheduler.start()
+    if SUN_SCHEDULER_ENABLED:
+        sun_planner.start()
+    yield
+    await readiness.stop()
+    await sun_planner.stop()
+    await capture_scheduler.stop()
+    await spool_uploader.stop()
+    await job_history.stop()
+    clip_catalog.close()
+    await state_backend.stop()
+    await egress_monitor.stop()
+    await worker_pool.stop()
+    await latest_video_manager.close()
+    await manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Configure logging; records are written by a background thread, see logs.py
+logs.setup_logging()
 
 BUILD_TIME = os.getenv("BUILD_TIME")
 SERVER_START_TIME = datetime.now().isoformat()
 
 BUCKET_NAME = os.getenv("BUCKET_NAME", "fogcat-webcam")
 SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE", "/app/service-account-key.json")
-DEFAULT_YOUTUBE_URL = os.getenv("DEFAULT_YOUTUBE_URL", "https://www.youtube.com/watch?v=hXtYKDio1rQ")
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "10"))
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "60"))
+STREAM_CACHE_TTL_SECONDS = float(os.getenv("STREAM_CACHE_TTL_SECONDS", "3600"))
+STREAM_CACHE_MAX_ENTRIES = int(os.getenv("STREAM_CACHE_MAX_ENTRIES", "32"))
+# Re-resolve a little before a signed stream URL actually expires
+STREAM_EXPIRY_MARGIN_SECONDS = 60
+# Clip length for cameras that don't set their own capture_seconds
+CAPTURE_SECONDS = 15
+# Clips are written under a per-job directory here before upload
+CLIP_DIR = os.getenv("CLIP_DIR", "/app")
+# Wall-clock limits for each subprocess; they are killed when exceeded
+RESOLVE_TIMEOUT_SECONDS = float(os.getenv("RESOLVE_TIMEOUT_SECONDS", "60"))
+PROBE_TIMEOUT_SECONDS = float(os.getenv("PROBE_TIMEOUT_SECONDS", "30"))
+CAPTURE_TIMEOUT_SECONDS = float(os.getenv("CAPTURE_TIMEOUT_SECONDS", "120"))
+EGRESS_CHECK_URL = os.getenv("EGRESS_CHECK_URL", "https://ifconfig.me")
+EGRESS_CHECK_INTERVAL_SECONDS = float(os.getenv("EGRESS_CHECK_INTERVAL_SECONDS", "60"))
+EGRESS_CHECK_TIMEOUT_SECONDS = float(os.getenv("EGRESS_CHECK_TIMEOUT_SECONDS", "5"))
+# Consecutive failed checks before egress is considered down
+EGRESS_MAX_FAILURES = int(os.getenv("EGRESS_MAX_FAILURES", "3"))
+# Delay before retrying a failed startup warmup (e.g. unreadable credentials)
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+# Comma-separated VPN exit addresses; when set, any other egress address means the VPN is down
+EXPECTED_EGRESS_IPS = {ip.strip() for ip in os.getenv("EXPECTED_EGRESS_IPS", "").split(",") if ip.strip()}
+# Default for cameras without an encode_mode; see cameras.ENCODE_MODES
+ENCODE_MODE = os.getenv("ENCODE_MODE", "auto")
+if ENCODE_MODE not in ENCODE_MODES:
+    raise ValueError(f"ENCODE_MODE must be one of {ENCODE_MODES}, got {ENCODE_MODE!r}")
+# Codecs that can go into the mp4 container untouched
+COPY_COMPATIBLE_CODECS = ("avc1", "h264", "mp4a", "aac")
+# file: write the clip to local disk and upload it afterwards, stream: upload ffmpeg's output as it is produced
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "file")
+
+
+def available_cpus():
+    """
+    Number of CPUs this process may use, honouring the cgroup quota from the k8s cpu limit.
+    """
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return os.cpu_count() or 1
+
+
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", available_cpus()))
+# Scheduled captures started at once across all cameras; the rest wait for a slot
+CAPTURE_BUDGET = int(os.getenv("CAPTURE_BUDGET", MAX_CONCURRENT_JOBS))
+
+# The original camera, used by /collection/start and for stream URLs that aren't registered
+camera_registry = CameraRegistry.load(CAMERAS_FILE, default=DEFAULT_CAMERA)
 
 
 # WebSocket connection manager for job-specific updates
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+        self.hub = ChannelHub()
+        # Jobs send an update for every progress change
+        self.send_log_sampler = LogSampler()
 
     async def connect(self, websocket: WebSocket, job_id: str):
         await websocket.accept()
-        self.active_connections[job_id] = websocket
+        self.hub.subscribe(job_id, websocket)
         logging.info(f"WebSocket connection established for Job ID: {job_id}")
 
-    def disconnect(self, job_id: str):
-        if job_id in self.active_connections:
-            del self.active_connections[job_id]
-            logging.info(f"WebSocket connection closed for Job ID: {job_id}")
+    def disconnect(self, websocket: WebSocket, job_id: str):
+        self.hub.unsubscribe(job_id, websocket)
+        logging.info(f"WebSocket connection closed for Job ID: {job_id}")
 
     async def send_message(self, job_id: str, message: str):
-        if job_id in self.active_connections:
-            try:
-                await self.active_connections[job_id].send_text(message)
-                logging.info(f"Message sent to Job ID {job_id}: {message}")
-            except Exception as e:
-                logging.error(f"Failed to send message to Job ID {job_id}: {str(e)}")
+        """Send to every subscriber of the job and keep the message for ones that connect later."""
+        with metrics.BROADCAST_SECONDS.labels("job").time():
+            reached = self.hub.publish(job_id, message)
+        skipped = self.send_log_sampler.sample()
+        if skipped is not None:
+            logging.info(f"Message sent to {reached} subscriber(s) of Job ID {job_id}: {message}",
+                         extra={"job_id": job_id, "stage": "websocket", "sampled_out": skipped})
+
+    def finish(self, job_id: str):
+        """Close the job's websockets once their pending messages are delivered."""
+        self.hub.finish(job_id)
+
+    async def close(self):
+        await self.hub.close()
+
+    def stats(self):
+        return self.hub.stats()
 
 
 manager = ConnectionManager()
@@ -56,93 +169,575 @@ manager = ConnectionManager()
 # WebSocket connection manager for broadcasting latest video updates
 class LatestVideoConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.broadcaster = Broadcaster()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.broadcaster.subscribe(websocket)
         logging.info("WebSocket client connected for latest video updates.")
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.broadcaster.clients.get(id(websocket))
+        if client:
+            self.broadcaster.unsubscribe(client)
             logging.info("WebSocket client disconnected from latest video updates.")
 
     async def broadcast(self, message: str):
-        logging.info(f"Broadcasting message to {len(self.active_connections)} clients: {message}")
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logging.error(f"Error sending message to WebSocket client: {e}")
-                self.disconnect(connection)
+        """Queue the message for every client; slow clients are never awaited."""
+        with metrics.BROADCAST_SECONDS.labels("latest").time():
+            reached = self.broadcaster.publish(message)
+        logging.info(f"Broadcasting message to {reached} clients: {message}")
+
+    async def close(self):
+        await self.broadcaster.close()
+
+    def stats(self):
+        return self.broadcaster.stats()
 
 
 latest_video_manager = LatestVideoConnectionManager()
 
 
-class ThreadSafeJobs(UserDict):
-    def __init__(self):
-        super().__init__()
-        self._lock = asyncio.Lock()
+state_backend = make_backend()
+
+
+async def publish_job_event(job_id: str, message: str):
+    """
+    Send a job event to this replica's subscribers, to the other replicas' subscribers, and keep
+    the job's shared status current so any replica can answer for it.
+    """
+    await manager.send_message(job_id, message)
+    try:
+        await state_backend.publish("job", {"job_id": job_id, "text": message})
+        record = active_jobs.get_record(job_id)
+        if record:
+            await state_backend.put_job(job_id, record.view())
+    except Exception as e:
+        logging.warning(f"Could not share event for Job ID {job_id}: {e}")
+
+
+async def handle_replica_event(channel: str, message: dict):
+    """
+    Deliver an event published by another replica to the websocket clients connected here.
+    """
+    if channel == "job":
+        await manager.send_message(message["job_id"], message["text"])
+    elif channel == "job_finished":
+        manager.finish(message["job_id"])
+    elif channel == "coalesced_event":
+        await record_coalesced_event(message["job_id"], message["key"])
+    elif channel == "latest":
+        await latest_video_manager.broadcast(message["text"])
+
+
+async def record_coalesced_event(job_id: str, key: str):
+    """
+    Record a scheduled event whose capture attached to the job, so the planner finds it in the
+    history like the job's own scheduled_event. Does nothing unless the job is active here.
+    """
+    job_info = await active_jobs.get_job(job_id)
+    if job_info:
+        await active_jobs.update_job(job_id, coalesced_events=[*job_info.get("coalesced_events", []), key])
+
+
+active_jobs = JobStore(notify=publish_job_event, on_delete=manager.finish)
+job_history = JobHistory()
+clip_catalog = ClipCatalog()
+
+
+async def finish_job(job_id: str, state: JobState):
+    """
+    Record a job's final state, move it from the active jobs to the durable history and close its channel.
+    """
+    await active_jobs.set_status(job_id, state)
+    metrics.JOBS.labels(state.value).inc()
+    job_info = await active_jobs.get_job(job_id)
+    logging.info(f"Job ID {job_id} finished: {state.value}",
+                 extra={"job_id": job_id, "stage": "finish", "duration": (job_info or {}).get("total_seconds")})
+    if job_info:
+        job_history.record(job_id, job_info)
+    await active_jobs.delete_job(job_id)
+    capture_scheduler.job_finished(job_id)
+    try:
+        await state_backend.publish("job_finished", {"job_id": job_id})
+        if job_info and job_info.get("youtube_url"):
+            await state_backend.release_lease(inflight_lease(job_info["youtube_url"]), job_id)
+    except Exception as e:
+        logging.warning(f"Could not share completion of Job ID {job_id}: {e}")
+
+# Normalized stream URL -> (job_id, monotonic time queued) for jobs that have not finished yet
+inflight_jobs: dict[str, tuple[str, float]] = {}
+
+
+def release_inflight(job_id: str, youtube_url: str):
+    """
+    Stop coalescing new requests for youtube_url onto job_id.
+    """
+    key = normalize_youtube_url(youtube_url)
+    if inflight_jobs.get(key, (None,))[0] == job_id:
+        del inflight_jobs[key]
+
+
+def inflight_lease(youtube_url: str) -> str:
+    """
+    Name of the lease a replica holds while it has a job in flight for a stream.
+    """
+    return f"inflight:{normalize_youtube_url(youtube_url)}"
+
+
+def event_lease(key: str) -> str:
+    """
+    Name of the lease the replica capturing a scheduled event holds, so the other replicas, which
+    plan the same sun events, don't capture it too.
+    """
+    return f"event:{key}"
+
+
+# The uploader shares one Google Cloud Storage client across jobs, built by the startup warmup
+gcs_uploader = GcsUploader(lambda: make_storage_client(SERVICE_ACCOUNT_FILE), BUCKET_NAME)
+
+
+def lookup_external_ip(timeout: float = EGRESS_CHECK_TIMEOUT_SECONDS):
+    return urllib.request.urlopen(EGRESS_CHECK_URL, timeout=timeout).read().decode('utf8').strip()
+
+
+class EgressUnavailableError(RuntimeError):
+    """Egress (the VPN) is known to be down, so a capture would fail or leak the pod's own address."""
+
+
+class EgressMonitor:
+    """
+    Checks the external address in the background so jobs can read it without a network round trip.
+    """
+    def __init__(self, interval: float, expected_ips: set[str], max_failures: int):
+        self.interval = interval
+        self.expected_ips = expected_ips
+        self.max_failures = max_failures
+        self.external_ip: Optional[str] = None
+        self.checked_at: Optional[str] = None
+        self.check_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.consecutive_failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self):
+        started = time.monotonic()
+        try:
+            self.external_ip = await asyncio.to_thread(lookup_external_ip)
+            self.consecutive_failures = 0
+            self.last_error = None
+        except Exception as e:
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            logging.warning(f"External address check failed ({self.consecutive_failures} in a row): {e}")
+        self.check_seconds = round(time.monotonic() - started, 3)
+        self.checked_at = datetime.now().isoformat()
+        if self.problem():
+            logging.error(f"Egress unhealthy: {self.problem()}")
+
+    async def _run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def problem(self) -> Optional[str]:
+        """Why egress is known to be bad, or None when it is healthy or not yet checked."""
+        if self.consecutive_failures >= self.max_failures:
+            return f"{self.consecutive_failures} consecutive address checks failed: {self.last_error}"
+        if self.expected_ips and self.external_ip and self.external_ip not in self.expected_ips:
+            return f"external address {self.external_ip} is not an expected VPN exit"
+        return None
+
+    def require_healthy(self):
+        """Return the cached external address, raising EgressUnavailableError when egress is known bad."""
+        problem = self.problem()
+        if problem:
+            raise EgressUnavailableError(f"Egress unavailable: {problem}")
+        return self.external_ip
+
+    def status(self):
+        problem = self.problem()
+        return {
+            "healthy": problem is None,
+            "problem": problem,
+            "external_ip": self.external_ip,
+            "checked_at": self.checked_at,
+            "check_seconds": self.check_seconds,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+egress_monitor = EgressMonitor(EGRESS_CHECK_INTERVAL_SECONDS, EXPECTED_EGRESS_IPS, EGRESS_MAX_FAILURES)
+
+
+class StreamResolutionCache:
+    """
+    Resolved media URLs per stream and yt-dlp format selection, so warm jobs can skip yt-dlp's
+    webpage/player API/m3u8 extraction. Whether each stream could be stream copied is kept past
+    its entries, so the next capture knows before resolving whether it will transcode.
+    """
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[str, dict] = {}
+        self._copy_compatible: dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(youtube_url: str, format_selector: Optional[str] = None) -> str:
+        key = normalize_youtube_url(youtube_url)
+        return f"{key} -f {format_selector}" if format_selector else key
 
-    async def set_status(self, job_id: str, status: str):
-        """Safely set the status of a job."""
-        async with self._lock:
-            if job_id in self.data:
-                self.data[job_id]["status"] = status
-        await manager.send_message(job_id,
-                                   json.dumps({"job_id": job_id,
-                                               "status": status}))
+    def get(self, youtube_url: str, format_selector: Optional[str] = None) -> Optional[dict]:
+        key = self.key(youtube_url, format_selector)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["expires_at"] <= time.time():
+                del self._entries[key]
+                return None
+            return entry
 
-    async def set_job(self, job_id: str, job_info: dict):
-        async with self._lock:
-            self.data[job_id] = job_info
-        await manager.send_message(job_id,
-                                   json.dumps({"job_id": job_id,
-                                               "job_info": job_info}))
+    def put(self, youtube_url: str, entry: dict, format_selector: Optional[str] = None):
+        with self._lock:
+            self._entries[self.key(youtube_url, format_selector)] = entry
+            while len(self._entries) > self.max_entries:
+                # Evict whichever entry would go stale first
+                soonest = min(self._entries, key=lambda k: self._entries[k]["expires_at"])
+                del self._entries[soonest]
 
-    async def get_job(self, job_id: str):
-        async with self._lock:
-            return self.data.get(job_id)
+    def invalidate(self, youtube_url: str, format_selector: Optional[str] = None):
+        with self._lock:
+            self._entries.pop(self.key(youtube_url, format_selector), None)
 
-    async def delete_job(self, job_id: str):
-        async with self._lock:
-            if job_id in self.data:
-                del self.data[job_id]
+    def copy_compatible(self, youtube_url: str) -> Optional[bool]:
+        """Whether the stream could be stream copied last time it was captured, None if not known yet."""
+        return self._copy_compatible.get(normalize_youtube_url(youtube_url))
 
-    async def get_all_jobs(self):
-        async with self._lock:
-            return {job_id: job_info for job_id, job_info in self.data.items()}
+    def set_copy_compatible(self, youtube_url: str, compatible: bool):
+        self._copy_compatible[normalize_youtube_url(youtube_url)] = compatible
 
-active_jobs = ThreadSafeJobs()
 
-# Initialize Google Cloud Storage client
-storage_client = storage.Client.from_service_account_json(SERVICE_ACCOUNT_FILE)
+stream_cache = StreamResolutionCache(STREAM_CACHE_TTL_SECONDS, STREAM_CACHE_MAX_ENTRIES)
+quality_policy = QualityPolicy(available_cpus())
 
 
-def lookup_external_ip():
-    return urllib.request.urlopen('https://ifconfig.me').read().decode('utf8')
+# ffmpeg -progress output is key=value lines; anything else on stderr is a log message
+PROGRESS_LINE = re.compile(rb"^\w+=\S*\s*$")
+STDOUT_READ_SIZE = 64 * 1024
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
 
 
-def run_subprocess_blocking(youtube_url, output_path):
+class StreamForbiddenError(RuntimeError):
+    """The media server rejected a resolved stream URL, usually because its signature expired."""
+
+
+def process_usage(pid):
+    """
+    CPU seconds and resident memory of a running child process from /proc, or None off Linux
+    or once the process has exited.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rpartition(")")[2].split()
+    except OSError:
+        return None
+    # fields[0] is the state (field 3 of the man page), so utime/stime/rss are fields 14/15/24
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE
+
+
+subprocesses = metrics.SubprocessCollector(process_usage)
+metrics.REGISTRY.register(subprocesses)
+
+
+async def stop_process(process):
+    """
+    Terminate a child process if it is still running, killing it if it ignores SIGTERM.
+    """
+    if process.returncode is None:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def run_command(cmd, timeout):
+    """
+    Run a command to completion, returning (returncode, stdout, stderr). The process is
+    killed if it exceeds timeout seconds or the caller is cancelled.
+    """
+    logging.info("command: " + " ".join(cmd))
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    subprocesses.add(process, cmd)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"{cmd[0]} timed out after {timeout}s")
+    finally:
+        await stop_process(process)
+        subprocesses.remove(process)
+    return process.returncode, stdout, stderr
+
+
+async def resolve_stream(youtube_url, format_selector: Optional[str] = None):
+    """
+    Run yt-dlp extraction once and return the media URLs ffmpeg should read, with their expiry
+    and total bitrate. format_selector is yt-dlp's -f; by default yt-dlp picks the best format.
+    """
+    cmd = ["yt-dlp", "--dump-single-json", "--no-warnings",
+           *(["-f", format_selector] if format_selector else []), youtube_url]
+    returncode, stdout, stderr = await run_command(cmd, RESOLVE_TIMEOUT_SECONDS)
+    if returncode != 0:
+        raise RuntimeError(f"yt-dlp error: {stderr.decode()}")
+    info = json.loads(stdout)
+
+    # Separate video and audio formats show up as requested_formats, a pre-merged one as the top level
+    formats = info.get("requested_formats") or [info]
+    urls = [f["url"] for f in formats]
+    # None marks a codec yt-dlp could not name (e.g. the audio-only HLS formats); "none" means no such track
+    codecs = [f.get(key) for f in formats for key in ("vcodec", "acodec") if f.get(key) != "none"]
+    expires_at = time.time() + stream_cache.ttl
+    for url in urls:
+        # googlevideo URLs are signed until .../expire/<unix time>/... or ?expire=<unix time>
+        match = re.search(r"[/?&]expire[/=](\d+)", url)
+        if match:
+            expires_at = min(expires_at, int(match.group(1)) - STREAM_EXPIRY_MARGIN_SECONDS)
+    return {
+        "urls": urls,
+        "format_id": info.get("format_id"),
+        "codecs": codecs,
+        "bitrate_kbps": sum(f.get("tbr") or 0 for f in formats) or None,
+        "http_headers": formats[0].get("http_headers", {}),
+        "expires_at": expires_at,
+    }
+
+
+def header_args(stream):
     """
-    Runs the blocking subprocess operations for yt-dlp and FFmpeg.
+    FFmpeg/ffprobe -headers option carrying the HTTP headers yt-dlp used for a resolved stream.
     """
-    ffmpeg_process = None
-    yt_dlp_process = None
+    headers = "".join(f"{k}: {v}\r\n" for k, v in stream["http_headers"].items())
+    return ["-headers", headers] if headers else []
 
-    # FFmpeg command to capture 15 seconds
-    ffmpeg_cmd = [
+
+async def probe_codecs(stream):
+    """
+    Ask ffprobe which codecs the inputs of a resolved stream carry.
+    """
+    codecs = []
+    for url in stream["urls"]:
+        cmd = ["ffprobe", "-v", "error", *header_args(stream),
+               "-show_entries", "stream=codec_name", "-of", "json", url]
+        returncode, stdout, stderr = await run_command(cmd, PROBE_TIMEOUT_SECONDS)
+        if returncode != 0:
+            raise RuntimeError(f"ffprobe error: {stderr.decode()}")
+        codecs += [s.get("codec_name") for s in json.loads(stdout).get("streams", [])]
+    return codecs
+
+
+async def can_stream_copy(stream):
+    """
+    Whether a resolved stream is already H.264/AAC and can be remuxed into mp4 without re-encoding.
+    The answer is kept on the cache entry so each resolution is probed at most once.
+    """
+    if "copy_compatible" not in stream:
+        codecs = stream.get("codecs", [])
+        if not codecs or None in codecs:
+            try:
+                codecs = await probe_codecs(stream)
+            except Exception as e:
+                logging.warning(f"Could not probe stream codecs, will transcode: {e}")
+                codecs = []
+        stream["copy_compatible"] = bool(codecs) and all(c and c.startswith(COPY_COMPATIBLE_CODECS) for c in codecs)
+    return stream["copy_compatible"]
+
+
+def build_ffmpeg_cmd(inputs, output_path, copy=False, to_stdout=False, duration=CAPTURE_SECONDS, preset=None,
+                     crf=None, segment_times=None, extra_outputs=()):
+    """
+    FFmpeg command to capture duration seconds from the given inputs, reporting progress on stderr.
+    With copy the source packets are remuxed instead of re-encoded. Stream copy drops the non-key
+    frames ahead of the first keyframe, so the capture window starts on a keyframe. preset and crf
+    tune libx264 when transcoding.
+    With to_stdout the clip is written to stdout as fragmented MP4 instead of to output_path.
+    With segment_times the capture is split at those offsets into numbered files named by the
+    output_path pattern (e.g. clip-%03d.mp4), and stdout carries the CSV list of closed segments.
+    extra_outputs are further output options and files, e.g. stills, written by the same run.
+    """
+    if copy:
+        codec_args = ["-c", "copy", "-avoid_negative_ts", "make_zero"]
+    else:
+        codec_args = ["-c:v", "libx264", "-c:a", "aac"]
+        if preset:
+            codec_args += ["-preset", preset]
+        if crf is not None:
+            codec_args += ["-crf", str(crf)]
+    if segment_times:
+        times = ",".join(f"{t:g}" for t in segment_times)
+        if not copy:
+            # Segments can only start on a keyframe; stream copy has to wait for the source's next one
+            codec_args += ["-force_key_frames", times]
+        # The delta lets a forced keyframe that lands a frame off the cut time still start the segment
+        output_args = ["-f", "segment", "-segment_times", times, "-segment_time_delta", "0.05",
+                       "-reset_timestamps", "1", "-segment_format", "mp4",
+                       "-segment_format_options", "movflags=+faststart",
+                       "-segment_list", "pipe:1", "-segment_list_type", "csv", output_path]
+    elif to_stdout:
+        # +faststart needs a seekable file; fragments with an empty moov can be written front to back
+        output_args = ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4", "pipe:1"]
+    else:
+        output_args = ["-movflags", "+faststart", output_path]
+    return [
         "ffmpeg",
-        "-i", "pipe:0",  # Input from stdin
-        "-t", "15",      # Limit duration to 15 seconds
-        "-c:v", "libx264",
-        "-c:a", "aac",
-        "-movflags", "+faststart",
-        output_path
+        "-loglevel", "error",
+        "-nostats",
+        "-progress", "pipe:2",  # key=value progress blocks, used for first frame and percent done
+        *inputs,
+        "-t", str(duration),  # Limit the capture duration
+        *codec_args,
+        *output_args,
+        *extra_outputs,
     ]
+
+
+async def run_ffmpeg(ffmpeg_cmd, stdin=asyncio.subprocess.DEVNULL, output_sink=None, on_progress=None,
+                     timeout=None, duration=CAPTURE_SECONDS):
+    """
+    Run FFmpeg to completion. Returns the monotonic time it reported its first frame, its wall-clock
+    run time and the CPU seconds it used. When output_sink is given, FFmpeg's stdout is copied
+    into it as it is produced. on_progress is awaited with the percentage of the duration-second
+    capture written each time FFmpeg reports progress. FFmpeg is killed after timeout seconds or
+    on cancellation.
+    """
     logging.info("command: " + " ".join(ffmpeg_cmd))
+    first_frame_at = None
+    usage = None
+    errors = []
+    started = time.monotonic()
+    ffmpeg_process = await asyncio.create_subprocess_exec(
+        *ffmpeg_cmd,
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE if output_sink else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    subprocesses.add(ffmpeg_process, ffmpeg_cmd)
+
+    async def read_progress():
+        nonlocal first_frame_at, usage
+        last_percent = None
+        async for line in ffmpeg_process.stderr:
+            key, _, value = line.strip().partition(b"=")
+            if not PROGRESS_LINE.match(line):
+                errors.append(line.decode(errors="replace"))
+            elif key == b"frame":
+                if first_frame_at is None and value not in (b"", b"0"):
+                    first_frame_at = time.monotonic()
+            elif key == b"out_time_us" and value.isdigit():
+                percent = min(100, int(value) // 10_000 // duration)
+                if on_progress and percent != last_percent:
+                    last_percent = percent
+                    await on_progress(percent)
+            elif key == b"progress":
+                # Sample at the end of each progress block; /proc is gone once FFmpeg exits
+                usage = process_usage(ffmpeg_process.pid) or usage
+
+    async def copy_output():
+        while chunk := await ffmpeg_process.stdout.read(STDOUT_READ_SIZE):
+            # The sink may block on network I/O, keep that off the event loop
+            await asyncio.to_thread(output_sink.write, chunk)
+
+    try:
+        readers = [read_progress()] + ([copy_output()] if output_sink else [])
+        await asyncio.wait_for(asyncio.gather(*readers), timeout or CAPTURE_TIMEOUT_SECONDS)
+        await ffmpeg_process.wait()
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"FFmpeg timed out after {timeout or CAPTURE_TIMEOUT_SECONDS}s")
+    finally:
+        await stop_process(ffmpeg_process)
+        subprocesses.remove(ffmpeg_process)
+
+    # Check FFmpeg's return code
+    if ffmpeg_process.returncode != 0:
+        stderr = "".join(errors)
+        if "403" in stderr:
+            raise StreamForbiddenError(f"FFmpeg error: {stderr}")
+        raise RuntimeError(f"FFmpeg error: {stderr}")
+    return first_frame_at, time.monotonic() - started, usage[0] if usage else None
+
+
+def capture_duration(camera: Optional[Camera] = None, session: Optional[Session] = None) -> float:
+    """Seconds of stream a capture reads: the whole session, or one clip of the camera."""
+    return session.duration if session else camera.capture_seconds if camera else CAPTURE_SECONDS
+
+
+async def capture_stream(youtube_url, output_path, encode_mode=ENCODE_MODE, output_sink=None, on_progress=None,
+                         camera: Optional[Camera] = None, session: Optional[Session] = None,
+                         still_images: Sequence[stills.Still] = (), analysis_path: Optional[str] = None):
+    """
+    Runs the yt-dlp and FFmpeg subprocesses for one capture at the quality level the adaptive
+    policy picks for the node's load, and lets the policy learn from how the capture went.
+    The level is only held to the CPU left for transcodes when the capture will transcode: in
+    auto mode, when the stream couldn't be stream copied last time. See capture_at_quality for
+    the arguments and the stats returned.
+    """
+    floor = camera.min_quality if camera else None
+    transcode = encode_mode == "transcode" or (
+        encode_mode == "auto" and stream_cache.copy_compatible(youtube_url) is False)
+    with quality_policy.capture(floor, transcode=transcode) as quality:
+        if quality.level:
+            metrics.CAPTURE_QUALITY.labels(quality.level.name).inc()
+        stats = await capture_at_quality(youtube_url, output_path, quality, encode_mode, output_sink, on_progress,
+                                         camera, session, still_images, analysis_path)
+        if "ingest_seconds" in stats:
+            quality_policy.observe(quality, capture_duration(camera, session), stats["ingest_seconds"],
+                                   stats.get("encode_cpu_seconds"), stats["encode_mode"] == "transcode")
+            metrics.BANDWIDTH_ESTIMATE_KBPS.set(quality_policy.bandwidth_kbps or 0)
+    return stats
+
+
+async def capture_at_quality(youtube_url, output_path, quality: Optional[QualityCapture] = None,
+                             encode_mode=ENCODE_MODE, output_sink=None, on_progress=None,
+                             camera: Optional[Camera] = None, session: Optional[Session] = None,
+                             still_images: Sequence[stills.Still] = (), analysis_path: Optional[str] = None):
+    """
+    Runs the yt-dlp and FFmpeg subprocesses for one capture.
+    Returns per-job timing: where the stream came from, how long it took to get the first frame,
+    the wall-clock and CPU time spent in FFmpeg for the encode mode used, and the time from the
+    first frame to the end.
+    With output_sink the clip is streamed into it as fragmented MP4 and output_path is not written.
+    camera sets the clip length and the libx264 preset/CRF. quality's level caps the format yt-dlp
+    picks and sets the preset/CRF the camera doesn't. With a session the whole session is
+    captured in one run, segmented into files named by the output_path pattern, and output_sink
+    receives FFmpeg's segment list. still_images, and with analysis_path the decimated frames
+    for frozen clip detection, are written by the same FFmpeg run.
+    """
+    job_started = time.monotonic()
+    stats = {}
+    duration = capture_duration(camera, session)
+    level = quality.level if quality else None
+    format_selector = level.format_selector() if level else None
+    if level:
+        stats["quality"] = level.name
+    encode_options = {"duration": duration,
+                      "preset": (camera.preset if camera else None) or (level.preset if level else None),
+                      "crf": camera.crf if camera and camera.crf is not None else level.crf if level else None,
+                      "segment_times": session.segment_times() if session else None,
+                      "extra_outputs": stills.still_output_args(still_images, duration)
+                      + (analysis.analysis_output_args(analysis_path, duration) if analysis_path else [])}
+    timeout = CAPTURE_TIMEOUT_SECONDS + duration if session else None
 
     # get available formats with --list-formats
     # $ yt-dlp -f best -o foo 'https://www.youtube.com/watch?v=hXtYKDio1rQ' --list-formats
@@ -166,109 +761,772 @@ def run_subprocess_blocking(youtube_url, output_path):
     # 232 mp4 1280x720    30 │ 2448k m3u8  │ avc1.4D401F 2448k video only
     # cmd = ["yt-dlp", "-f", "best", "-o", "-", youtube_url]
 
-    external_ip = lookup_external_ip()
+    external_ip = egress_monitor.require_healthy()
     logging.info(f'external address: {external_ip}')
-
-    cmd = ["yt-dlp", "-o", "-", youtube_url]
-    logging.info("command: " + " ".join(cmd))
-
-    try:
-        # Start FFmpeg in a subprocess
-        ffmpeg_process = subprocess.Popen(
-            ffmpeg_cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        # Start yt-dlp and pipe its output to FFmpeg
-        yt_dlp_process = subprocess.Popen(
-            cmd,
-            stdout=ffmpeg_process.stdin,
-            stderr=subprocess.PIPE
-        )
-
-        # Wait for FFmpeg to finish processing
-        ffmpeg_process.communicate()  # Block until FFmpeg is done
-
-        # Terminate yt-dlp after FFmpeg finishes its duration
-        yt_dlp_process.terminate()
-        yt_dlp_process.wait()
-
-        # Check FFmpeg's return code
-        if ffmpeg_process.returncode != 0:
-            stderr = ffmpeg_process.stderr.read().decode()
-            raise RuntimeError(f"FFmpeg error: {stderr}")
-    finally:
-        # Ensure FFmpeg and yt-dlp are terminated
-        if ffmpeg_process and ffmpeg_process.poll() is None:
-            ffmpeg_process.terminate()
-        if yt_dlp_process and yt_dlp_process.poll() is None:
-            yt_dlp_process.terminate()
-
-
-def upload_to_gcs(video_path: str):
+    stats["egress_ip"] = external_ip
+
+    stream = stream_cache.get(youtube_url, format_selector)
+    stats["stream_source"] = "cache" if stream else "resolved"
+    if not stream:
+        try:
+            stream = await resolve_stream(youtube_url, format_selector)
+            stream_cache.put(youtube_url, stream, format_selector)
+        except Exception as e:
+            metrics.FAILURES.labels("resolve").inc()
+            logging.warning(f"Stream resolution failed for {youtube_url}, falling back to yt-dlp download: {e}")
+        stats["resolve_seconds"] = round(time.monotonic() - job_started, 3)
+
+    first_frame_at = None
+    if stream:
+        stats["format_id"] = stream.get("format_id")
+        if quality:
+            quality.stream_kbps = stream.get("bitrate_kbps")
+        inputs = []
+        for url in stream["urls"]:
+            inputs += [*header_args(stream), "-i", url]
+        copy = encode_mode == "copy" or (encode_mode == "auto" and await can_stream_copy(stream))
+        stats["encode_mode"] = "copy" if copy else "transcode"
+        if encode_mode == "auto":
+            stream_cache.set_copy_compatible(youtube_url, copy)
+        if quality:
+            # Running transcodes count against the CPU left for the next capture's level
+            quality.transcode = not copy
+        try:
+            first_frame_at, encode_seconds, encode_cpu_seconds = await run_ffmpeg(
+                build_ffmpeg_cmd(inputs, output_path, copy=copy, to_stdout=bool(output_sink), **encode_options),
+                output_sink=output_sink, on_progress=on_progress, timeout=timeout, duration=duration)
+        except StreamForbiddenError:
+            metrics.FAILURES.labels("stream_forbidden").inc()
+            if output_sink and output_sink.bytes_written:
+                # Part of the clip is already uploaded, a second capture can't be appended to it
+                raise
+            logging.warning(f"Resolved stream for {youtube_url} was rejected (403), falling back to yt-dlp download")
+            stream_cache.invalidate(youtube_url, format_selector)
+            stream = None
+            for path in [output_path, *(still.path for still in still_images), analysis_path]:
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    if not stream:
+        stats["stream_source"] = "yt-dlp"
+        # Nothing to inspect ahead of a piped download, so auto plays safe and transcodes
+        copy = encode_mode == "copy"
+        stats["encode_mode"] = "copy" if copy else "transcode"
+        if quality:
+            quality.transcode = not copy
+        cmd = ["yt-dlp", *(["-f", level.format_selector(merged=True)] if level else []), "-o", "-", youtube_url]
+        logging.info("command: " + " ".join(cmd))
+        # yt-dlp writes straight into FFmpeg's stdin through an OS pipe, no copying through Python
+        read_fd, write_fd = os.pipe()
+        yt_dlp_process = None
+        try:
+            # Start yt-dlp and pipe its output to FFmpeg
+            yt_dlp_process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=write_fd,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            subprocesses.add(yt_dlp_process, cmd)
+            os.close(write_fd)
+            write_fd = None
+            first_frame_at, encode_seconds, encode_cpu_seconds = await run_ffmpeg(
+                build_ffmpeg_cmd(["-i", "pipe:0"], output_path, copy=copy, to_stdout=bool(output_sink),
+                                 **encode_options),
+                stdin=read_fd, output_sink=output_sink, on_progress=on_progress, timeout=timeout, duration=duration)
+        finally:
+            os.close(read_fd)
+            if write_fd is not None:
+                os.close(write_fd)
+            # Terminate yt-dlp after FFmpeg finishes its duration
+            if yt_dlp_process:
+                await stop_process(yt_dlp_process)
+                subprocesses.remove(yt_dlp_process)
+
+    if first_frame_at is not None:
+        stats["first_frame_seconds"] = round(first_frame_at - job_started, 3)
+        stats["ingest_seconds"] = round(time.monotonic() - first_frame_at, 3)
+    stats["encode_seconds"] = round(encode_seconds, 3)
+    if encode_cpu_seconds is not None:
+        stats["encode_cpu_seconds"] = round(encode_cpu_seconds, 3)
+    logging.info(f"Captured {youtube_url} in {stats['encode_seconds']}s",
+                 extra={"stage": "capture", "duration": stats["encode_seconds"],
+                        "encode_mode": stats.get("encode_mode"), "quality": stats.get("quality")})
+    return stats
+
+
+def upload_to_gcs(video_path: str, blob_name: str):
     """
-    Uploads a video to Google Cloud Storage.
+    Uploads a video to Google Cloud Storage. Returns the blob name and upload stats.
     """
-    bucket = storage_client.bucket(BUCKET_NAME)
-    timestamp_path = datetime.now().strftime("%Y/%m")
-    video_name = os.path.basename(video_path)
-    blob_name = f"{timestamp_path}/{video_name}"
-    blob = bucket.blob(blob_name)
-
     logging.info(f"Uploading {video_path} to {blob_name} in bucket {BUCKET_NAME}...")
-    blob.upload_from_filename(video_path)
-    logging.info(f"File uploaded to GCS successfully at {blob_name}.")
+    upload_stats = gcs_uploader.upload_file(video_path, blob_name)
+    logging.info(f"File uploaded to GCS successfully at {blob_name}.",
+                 extra={"stage": "upload", "duration": upload_stats.get("upload_seconds")})
+    return blob_name, upload_stats
 
 
-async def notify_latest_video():
+async def stream_capture_to_gcs(youtube_url: str, output_path: str, blob_name: str, on_progress=None,
+                               camera: Optional[Camera] = None, still_images: Sequence[stills.Still] = (),
+                               analysis_path: Optional[str] = None):
+    """
+    Capture a clip straight into GCS with no local file. Returns the blob name and capture stats.
+    """
+    upload = gcs_uploader.open_stream(blob_name)
+    logging.info(f"Streaming capture of {youtube_url} to {blob_name} in bucket {BUCKET_NAME}...")
+    try:
+        stats = await capture_stream(youtube_url, output_path, encode_mode=camera_encode_mode(camera),
+                                     output_sink=upload, on_progress=on_progress, camera=camera,
+                                     still_images=still_images, analysis_path=analysis_path)
+    except BaseException:
+        await asyncio.to_thread(upload.abort)
+        raise
+    finalize_started = time.monotonic()
+    stats.update(await asyncio.to_thread(gcs_uploader.finish_stream, upload))
+    stats["upload_finalize_seconds"] = round(time.monotonic() - finalize_started, 3)
+    logging.info(f"File uploaded to GCS successfully at {blob_name}.",
+                 extra={"stage": "upload", "duration": stats["upload_finalize_seconds"]})
+    return blob_name, stats
+
+
+def upload_stills(still_images: Sequence[stills.Still], clip_blob_name: str, camera: Camera, latest: bool = True):
     """
-    Notify all WebSocket clients about the latest video URL.
+    Upload the stills FFmpeg wrote for a clip beside it, and its poster as the camera's latest unless
+    latest is False. Returns their blob names; a still that is missing or fails to upload is logged and
+    left out.
+    """
+    blobs = {}
+    for still in still_images:
+        if not os.path.exists(still.path):
+            logging.warning(f"FFmpeg wrote no {still.kind} for {clip_blob_name}")
+            continue
+        blob_name = still.blob_name(clip_blob_name)
+        try:
+            gcs_uploader.upload_file(still.path, blob_name, still.content_type, stills.STILL_CACHE_CONTROL)
+            if still.kind == "poster" and latest:
+                gcs_uploader.upload_file(still.path, f"{camera.prefix}latest.{still.image_format}",
+                                         still.content_type, stills.LATEST_POSTER_CACHE_CONTROL)
+        except Exception as e:
+            metrics.FAILURES.labels("stills").inc()
+            logging.warning(f"Could not upload the {still.kind} of {clip_blob_name}: {e}")
+            continue
+        blobs[f"{still.kind}_blob"] = blob_name
+    return blobs
+
+
+async def notify_latest_video(poster_blob: Optional[str] = None, blob_name: Optional[str] = None):
+    """
+    Notify all WebSocket clients about the latest video URL, with the clip's blob name and its poster
+    image when there is one.
     """
     latest_video_url = "https://weather.fogcat5.com/collector/video_latest"
-    message = json.dumps({"latest_video_url": latest_video_url})
+    message = {"latest_video_url": latest_video_url}
+    if blob_name:
+        message["blob_name"] = blob_name
+    if poster_blob:
+        message["poster_blob"] = poster_blob
+    message = json.dumps(message)
     await latest_video_manager.broadcast(message)
+    try:
+        await state_backend.publish("latest", {"text": message})
+    except Exception as e:
+        logging.warning(f"Could not share latest video notification: {e}")
+
+
+async def catalog_clip(blob_name: str, camera: Camera, captured_at: datetime, duration: float, upload_stats: dict,
+                       poster_blob: Optional[str] = None, suspect: Optional[str] = None):
+    """Record an uploaded clip in the catalog. A failure is logged; the clip is in the bucket either way."""
+    entry = clip_entry(blob_name, camera.id, captured_at.astimezone(camera.tz), duration,
+                       upload_stats.get("upload_bytes"), upload_stats.get("upload_crc32c"), poster_blob, suspect)
+    try:
+        await asyncio.to_thread(clip_catalog.add, entry)
+    except Exception as e:
+        metrics.FAILURES.labels("catalog").inc()
+        logging.warning(f"Could not add {blob_name} to the clip catalog: {e}")
 
 
-async def collect_and_upload_video(job_id: str, youtube_url: str):
+def spool_clip(entry_id: str, job_id: str, camera: Camera, clip_path: str, blob_name: str, captured_at: datetime,
+               duration: float, still_images: Sequence[stills.Still] = (), suspect: Optional[str] = None) -> SpoolEntry:
     """
-    Asynchronously collect and upload video by offloading blocking tasks.
+    Move a captured clip and its stills into the upload spool, claimed by the caller, who uploads it
+    next. Blocking; call it from a thread.
     """
-    await active_jobs.set_status(job_id, "in progress")
-    local_time = datetime.now().astimezone()
-    timestamp = local_time.strftime('%Y-%m-%dT%H:%M-%S%z')
-    output_path = f"/app/seacliff-{timestamp}.mp4"
+    manifest = {
+        "job_id": job_id,
+        "camera": dataclasses.asdict(camera),
+        "blob_name": blob_name,
+        "clip": os.path.basename(clip_path),
+        "captured_at": captured_at.isoformat(),
+        "duration": duration,
+        "stills": [{"kind": still.kind, "file": os.path.basename(still.path), "image_format": still.image_format}
+                   for still in still_images],
+        "suspect": suspect,
+    }
+    return clip_spool.add(entry_id, [clip_path, *(still.path for still in still_images)], manifest)
+
+
+async def upload_spooled_clip(entry: SpoolEntry):
+    """
+    Upload a clip the spool uploader took from the spool, with its stills, catalog and announce it, and
+    add the upload to its job's history. A clip older than the camera's latest in the catalog doesn't
+    replace its latest poster or get announced.
+    """
+    manifest = entry.manifest
+    camera = Camera(**manifest["camera"])
+    captured_at = datetime.fromisoformat(manifest["captured_at"])
+    blob_name, upload_stats = await asyncio.to_thread(upload_to_gcs, entry.file(manifest["clip"]),
+                                                      manifest["blob_name"])
+    # Before the next await, so an upload cancelled from here on isn't retried and announced twice
+    clip_spool.mark_uploaded(entry)
+    metrics.observe_job_stats(upload_stats, "spool")
+    newest = await asyncio.to_thread(clip_catalog.latest, camera.id)
+    is_latest = newest is None or datetime.fromisoformat(newest["captured_at"]) <= captured_at
+    still_images = [stills.Still(still["kind"], entry.file(still["file"]), still["image_format"])
+                    for still in manifest["stills"]]
+    still_blobs = await asyncio.to_thread(upload_stills, still_images, blob_name, camera, is_latest)
+    await catalog_clip(blob_name, camera, captured_at, manifest["duration"], upload_stats,
+                       still_blobs.get("poster_blob"), manifest.get("suspect"))
+    if is_latest:
+        await notify_latest_video(still_blobs.get("poster_blob"), blob_name=blob_name)
+    job_info = job_history.get_recent(manifest["job_id"]) or await asyncio.to_thread(job_history.lookup,
+                                                                                      manifest["job_id"])
+    if job_info:
+        uploads = [*job_info.get("spool_uploads", []), {"blob_name": blob_name, **upload_stats, **still_blobs}]
+        job_history.record(manifest["job_id"], {**job_info, "spool_uploads": uploads}, job_info["finished_at"])
+    logging.info(f"Uploaded {blob_name} from the spool after {entry.attempts} failed attempt(s).")
+
+
+clip_spool = ClipSpool(on_evict=lambda entry, reason: metrics.SPOOL_EVICTIONS.labels(reason).inc())
+spool_uploader = SpoolUploader(clip_spool, upload_spooled_clip)
+metrics.SPOOL_BYTES.set_function(lambda: clip_spool.bytes)
+metrics.LOG_RECORDS_DROPPED.set_function(lambda: logs.stats()["dropped"])
+
+
+clip_analyzer = analysis.ClipAnalyzer()
+
+
+async def analyze_clip(job_id: str, camera: Camera, frames_path: Optional[str]) -> Optional[str]:
+    """
+    Check a captured clip's decimated frames for a frozen stream or a repeat of the camera's last
+    clip, recording the scores with the job. Returns "frozen", "duplicate" or None. A clip that
+    can't be analysed is treated as fine.
+    """
+    if not frames_path:
+        return None
     try:
-        # Offload the blocking subprocess call to a separate thread
-        await asyncio.to_thread(run_subprocess_blocking, youtube_url, output_path)
+        result = await asyncio.to_thread(clip_analyzer.analyze, camera.id, frames_path)
+    except Exception as e:
+        logging.warning(f"Could not analyse the clip of Job ID {job_id}: {e}")
+        return None
+    await active_jobs.update_job(job_id, analysis=result.to_dict())
+    if result.verdict:
+        action = analysis.FROZEN_ACTION if UPLOAD_MODE == "file" else "flag"
+        metrics.SUSPECT_CLIPS.labels(result.verdict, action).inc()
+        logging.warning(f"Clip of {camera.id} for Job ID {job_id} looks {result.verdict} "
+                        f"(motion {result.motion:.2f}), {'not uploading' if action == 'skip' else 'flagging'} it.")
+    return result.verdict
 
-        # Upload the video to GCS
-        await active_jobs.set_status(job_id, "uploading to gcs")
-        await asyncio.to_thread(upload_to_gcs, output_path)
+
+def camera_encode_mode(camera: Optional[Camera]):
+    return (camera.encode_mode if camera else None) or ENCODE_MODE
+
+
+async def collect_and_upload_video(job_id: str, youtube_url: str, camera: Optional[Camera] = None):
+    """
+    Asynchronously collect and upload video; the subprocesses run on the event loop and only
+    blocking GCS calls are offloaded to threads. The camera decides the clip's name, length and
+    encoding; by default it is the registered camera for youtube_url.
+    """
+    camera = camera or camera_registry.for_url(youtube_url)
+    await active_jobs.set_status(job_id, JobState.IN_PROGRESS, progress=0)
+    captured_at = datetime.now().astimezone()
+    blob_name = camera.blob_name(captured_at)
+    # Jobs started in the same second share a clip name, so each captures into its own directory
+    job_dir = os.path.join(CLIP_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    output_path = os.path.join(job_dir, camera.clip_name(captured_at))
+    still_images = stills.plan_stills(output_path)
+    frames_path = os.path.join(job_dir, "frames.gray") if analysis.ANALYSIS_ENABLED else None
+    job_started = time.monotonic()
+    final_state = JobState.COMPLETED
+    stage = "capture"
+    spooled = None
+
+    async def report_progress(percent):
+        await active_jobs.set_status(job_id, JobState.IN_PROGRESS, progress=percent)
+
+    try:
+        if UPLOAD_MODE == "stream":
+            # Capture and upload overlap; output_path only names the blob
+            blob_name, capture_stats = await stream_capture_to_gcs(youtube_url, output_path, blob_name,
+                                                                   report_progress, camera, still_images,
+                                                                   frames_path)
+            await active_jobs.update_job(job_id, **capture_stats)
+            # Already uploaded, so a frozen clip can only be flagged
+            verdict = await analyze_clip(job_id, camera, frames_path)
+        else:
+            capture_stats = await capture_stream(youtube_url, output_path, encode_mode=camera_encode_mode(camera),
+                                                 on_progress=report_progress, camera=camera,
+                                                 still_images=still_images, analysis_path=frames_path)
+            await active_jobs.update_job(job_id, **capture_stats)
+            verdict = await analyze_clip(job_id, camera, frames_path)
+            if verdict and analysis.FROZEN_ACTION == "skip":
+                capture_stats["total_seconds"] = round(time.monotonic() - job_started, 3)
+                await active_jobs.update_job(job_id, skipped=verdict, total_seconds=capture_stats["total_seconds"])
+                metrics.observe_job_stats(capture_stats, UPLOAD_MODE)
+                return
+
+            # Upload the video to GCS. The clip waits in the spool until it is in the bucket, so if the
+            # upload fails, or the process stops first, the spool uploader retries it later
+            stage = "upload"
+            await active_jobs.set_status(job_id, JobState.UPLOADING)
+            spooled = await asyncio.to_thread(spool_clip, job_id, job_id, camera, output_path, blob_name,
+                                              captured_at, camera.capture_seconds, still_images, verdict)
+            still_images = [dataclasses.replace(still, path=spooled.file(os.path.basename(still.path)))
+                            for still in still_images]
+            try:
+                blob_name, upload_stats = await asyncio.to_thread(
+                    upload_to_gcs, spooled.file(os.path.basename(output_path)), blob_name)
+            except Exception as e:
+                metrics.FAILURES.labels("upload").inc()
+                logging.warning(f"Upload of {blob_name} failed, leaving it in the spool: {e}")
+                await asyncio.to_thread(clip_spool.release, spooled, str(e))
+                spool_uploader.wake()
+                capture_stats["total_seconds"] = round(time.monotonic() - job_started, 3)
+                await active_jobs.update_job(job_id, spooled=True, upload_error=str(e),
+                                             total_seconds=capture_stats["total_seconds"])
+                metrics.observe_job_stats(capture_stats, UPLOAD_MODE)
+                return
+            # Before the next await, so a job cancelled from here on doesn't leave the clip to be uploaded again
+            clip_spool.mark_uploaded(spooled)
+            await active_jobs.update_job(job_id, **upload_stats)
+            capture_stats.update(upload_stats)
+        capture_stats["total_seconds"] = round(time.monotonic() - job_started, 3)
+        await active_jobs.update_job(job_id, blob_name=blob_name, total_seconds=capture_stats["total_seconds"])
+        metrics.observe_job_stats(capture_stats, UPLOAD_MODE)
+        still_blobs = await asyncio.to_thread(upload_stills, still_images, blob_name, camera)
+        if still_blobs:
+            await active_jobs.update_job(job_id, **still_blobs)
+        if spooled:
+            await asyncio.to_thread(clip_spool.remove, spooled)
+        await catalog_clip(blob_name, camera, captured_at, camera.capture_seconds, capture_stats,
+                           still_blobs.get("poster_blob"), verdict)
 
         # Notify WebSocket clients about the latest video
-        await notify_latest_video()
+        stage = "notify"
+        await notify_latest_video(still_blobs.get("poster_blob"), blob_name=blob_name)
 
+    except asyncio.CancelledError:
+        logging.warning(f"Collection cancelled for Job ID: {job_id}")
+        final_state = JobState.CANCELLED
+        raise
     except Exception as e:
         tb = traceback.format_exc()
         error_message = f"{str(e)}{tb}"
         logging.error(f"Error during video collection: {error_message}")
-        await active_jobs.set_status(job_id, "error")
+        metrics.FAILURES.labels("egress" if isinstance(e, EgressUnavailableError) else stage).inc()
+        final_state = JobState.ERROR
+        await active_jobs.update_job(job_id, error=str(e))
         raise RuntimeError(f"Error during video collection: {error_message}")
     finally:
+        release_inflight(job_id, youtube_url)
+        if spooled and spooled.claimed:
+            # Interrupted before the upload finished, the spool uploader takes over; or after it, and
+            # releasing the entry removes it
+            clip_spool.release(spooled)
+            spool_uploader.wake()
         # Clean up the local output file
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        await active_jobs.set_status(job_id, "completed")
+        shutil.rmtree(job_dir, ignore_errors=True)
+        await finish_job(job_id, final_state)
+
+
+async def collect_session(job_id: str, youtube_url: str, camera: Optional[Camera], session: Session):
+    """
+    Capture a session's clips from one stream connection, uploading each clip as soon as FFmpeg
+    closes its segment while the next is still being captured. Each clip is stored under the time
+    it started; gap segments between clips are deleted. A clip whose upload fails is left in the
+    spool for the spool uploader. The job fails if the capture does, keeping the clips that were
+    uploaded or spooled.
+    """
+    camera = camera or camera_registry.for_url(youtube_url)
+    await active_jobs.set_status(job_id, JobState.IN_PROGRESS, progress=0)
+    captured_at = datetime.now().astimezone()
+    job_dir = os.path.join(CLIP_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    sink = SegmentListSink(job_dir, asyncio.get_running_loop())
+    job_started = time.monotonic()
+    final_state = JobState.COMPLETED
+    clips, failed_uploads = [], []
+
+    async def report_progress(percent):
+        await active_jobs.set_status(job_id, JobState.IN_PROGRESS, progress=percent)
+
+    async def upload_segments():
+        while (entry := await sink.queue.get()) is not None:
+            segment, path = entry
+            clip = session.clip_for_segment(segment)
+            if clip is None or clip >= session.clips:
+                os.remove(path)
+                continue
+            clip_captured_at = captured_at + timedelta(seconds=session.clip_start(clip))
+            blob_name = camera.blob_name(clip_captured_at)
+            try:
+                blob_name, upload_stats = await asyncio.to_thread(upload_to_gcs, path, blob_name)
+            except Exception as e:
+                metrics.FAILURES.labels("upload").inc()
+                logging.warning(f"Upload of clip {clip} of session {job_id} failed, leaving it in the spool: {e}")
+                try:
+                    spooled = await asyncio.to_thread(spool_clip, f"{job_id}-{clip}", job_id, camera, path,
+                                                      blob_name, clip_captured_at, session.clip_seconds)
+                    await asyncio.to_thread(clip_spool.release, spooled, str(e))
+                    spool_uploader.wake()
+                except Exception as spool_error:
+                    logging.error(f"Could not spool clip {clip} of session {job_id}: {spool_error}")
+                    failed_uploads.append(clip)
+                    continue
+                clips.append({"clip": clip, "blob_name": blob_name, "spooled": True, "upload_error": str(e)})
+                await active_jobs.update_job(job_id, clips=clips)
+                continue
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+            metrics.observe_job_stats(upload_stats, "session")
+            clips.append({"clip": clip, "blob_name": blob_name, **upload_stats})
+            await active_jobs.update_job(job_id, clips=clips)
+            await catalog_clip(blob_name, camera, clip_captured_at, session.clip_seconds, upload_stats)
+            await notify_latest_video(blob_name=blob_name)
+
+    uploads = asyncio.create_task(upload_segments())
+    try:
+        capture_stats = await capture_stream(youtube_url, os.path.join(job_dir, f"{camera.id}-%03d.mp4"),
+                                             encode_mode=camera_encode_mode(camera), output_sink=sink,
+                                             on_progress=report_progress, camera=camera, session=session)
+        sink.close()
+        await uploads
+        capture_stats["total_seconds"] = round(time.monotonic() - job_started, 3)
+        await active_jobs.update_job(job_id, **capture_stats)
+        metrics.observe_job_stats(capture_stats, "session")
+        if failed_uploads:
+            raise RuntimeError(f"Upload failed for clip(s) {failed_uploads}")
+    except asyncio.CancelledError:
+        logging.warning(f"Session cancelled for Job ID: {job_id}")
+        final_state = JobState.CANCELLED
+        raise
+    except Exception as e:
+        logging.error(f"Error during session capture: {e}\n{traceback.format_exc()}")
+        # Segments that closed before the failure are complete clips, still worth uploading
+        sink.close()
+        await asyncio.gather(uploads, return_exceptions=True)
+        if not failed_uploads:
+            metrics.FAILURES.labels("egress" if isinstance(e, EgressUnavailableError) else "capture").inc()
+        final_state = JobState.ERROR
+        await active_jobs.update_job(job_id, error=str(e))
+        raise RuntimeError(f"Error during session capture: {e}")
+    finally:
+        uploads.cancel()
+        await asyncio.gather(uploads, return_exceptions=True)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        await finish_job(job_id, final_state)
+
+
+class CollectionWorkerPool:
+    """
+    Fixed-size pool of workers draining a bounded FIFO queue of collection jobs.
+    """
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self.busy = 0
+        self.wait_times = deque(maxlen=100)
+        self.queued: set[str] = set()
+        self.cancelled: set[str] = set()
+        self.running: dict[str, asyncio.Task] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def started(self):
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker tasks on the running event loop."""
+        if self._tasks:
+            return
+        # Rebuild the queue so it binds to the current loop, keeping anything submitted before startup
+        pending, self.queue = self.queue, asyncio.Queue(maxsize=self.queue.maxsize)
+        while not pending.empty():
+            self.queue.put_nowait(pending.get_nowait())
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logging.info(f"Started {self.workers} collection workers (queue capacity {self.queue.maxsize}).")
+
+    async def stop(self):
+        """Cancel the worker tasks, interrupting any running collection."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, job_id: str, youtube_url: str, camera: Optional[Camera] = None,
+               session: Optional[Session] = None):
+        """Queue a job, raising asyncio.QueueFull when the queue is at capacity."""
+        self.queue.put_nowait((job_id, youtube_url, camera, time.monotonic(), session))
+        self.queued.add(job_id)
+
+    def cancel(self, job_id: str):
+        """
+        Cancel a queued or running job. Returns "queued" or "running" for the state it was
+        cancelled in, or None if the pool doesn't know the job.
+        """
+        if job_id in self.running:
+            self.running[job_id].cancel()
+            return "running"
+        if job_id in self.queued:
+            # Left in the queue to keep FIFO order; the worker drops it when it comes up
+            self.cancelled.add(job_id)
+            return "queued"
+        return None
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job_id, youtube_url, camera, enqueued_at, session = await self.queue.get()
+            self.queued.discard(job_id)
+            if job_id in self.cancelled:
+                self.cancelled.discard(job_id)
+                self.queue.task_done()
+                continue
+            wait = time.monotonic() - enqueued_at
+            self.wait_times.append(wait)
+            metrics.QUEUE_WAIT_SECONDS.observe(wait)
+            camera_id = (camera or camera_registry.for_url(youtube_url)).id
+            logging.info(f"Worker {worker_id} picked up Job ID {job_id} after {wait:.2f}s in queue.",
+                         extra={"job_id": job_id, "camera": camera_id, "stage": "queue", "duration": round(wait, 3)})
+            self.busy += 1
+            if session:
+                collection = collect_session(job_id, youtube_url, camera, session)
+            else:
+                collection = collect_and_upload_video(job_id, youtube_url, camera)
+            # The job's task, and the threads it starts, log with its job_id and camera
+            with log_context(job_id=job_id, camera=camera_id):
+                self.running[job_id] = asyncio.create_task(collection)
+            try:
+                await self.running[job_id]
+            except asyncio.CancelledError:
+                # Only the job was cancelled, not this worker
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                logging.error(f"Job ID {job_id} failed: {e}")
+            finally:
+                del self.running[job_id]
+                self.busy -= 1
+                self.queue.task_done()
+
+    def stats(self):
+        waits = list(self.wait_times)
+        return {
+            "workers": self.workers,
+            "busy_workers": self.busy,
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "avg_wait_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "max_wait_seconds": round(max(waits), 3) if waits else 0.0,
+        }
+
+
+worker_pool = CollectionWorkerPool(MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS)
+metrics.QUEUE_DEPTH.set_function(lambda: worker_pool.queue.qsize())
+metrics.BUSY_WORKERS.set_function(lambda: worker_pool.busy)
+metrics.WEBSOCKET_CLIENTS.labels("job").set_function(lambda: manager.stats()["subscribers"])
+metrics.WEBSOCKET_CLIENTS.labels("latest").set_function(lambda: len(latest_video_manager.broadcaster.clients))
+
+
+class Readiness:
+    """
+    Startup warmup and the state /health/ready reports. Cloud clients are built in the
+    background after startup instead of at import, and the replica only takes traffic
+    once they are ready and the workers are running.
+    """
+    def __init__(self, retry_interval: float):
+        self.retry_interval = retry_interval
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.shutting_down = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def warmup(self):
+        """Build the GCS client, retrying until it succeeds."""
+        while True:
+            try:
+                await asyncio.to_thread(gcs_uploader.warmup)
+                break
+            except Exception as e:
+                self.last_error = str(e)
+                logging.error(f"Startup warmup failed, retrying in {self.retry_interval}s: {e}")
+                await asyncio.sleep(self.retry_interval)
+        self.last_error = None
+        self.warmup_seconds = round(time.monotonic() - self.started_at, 3)
+        self.ready_at = datetime.now().isoformat()
+        metrics.WARMUP_SECONDS.set(self.warmup_seconds)
+        logging.info(f"Warmup finished in {self.warmup_seconds}s, ready for traffic.")
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.shutting_down = False
+        if not self._task:
+            self._task = asyncio.create_task(self.warmup())
+
+    async def stop(self):
+        self.shutting_down = True
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def problems(self) -> list[str]:
+        """Why this replica should not get traffic; empty when it is ready."""
+        problems = []
+        if self.shutting_down:
+            problems.append("shutting down")
+        if not gcs_uploader.ready:
+            problems.append(f"GCS client not ready: {self.last_error}" if self.last_error else "warming up")
+        if not worker_pool.started:
+            problems.append("collection workers not started")
+        return problems
+
+    def status(self):
+        problems = self.problems()
+        return {
+            "ready": not problems,
+            "problems": problems,
+            "ready_at": self.ready_at,
+            "warmup_seconds": self.warmup_seconds,
+            "gcs_client_init_seconds": gcs_uploader.client_init_seconds,
+        }
+
+
+readiness = Readiness(WARMUP_RETRY_SECONDS)
+
+
+async def enqueue_collection(youtube_url: str, camera: Optional[Camera] = None, scheduled_event: Optional[str] = None,
+                             session: Optional[Session] = None, job_id: Optional[str] = None):
+    """
+    Register a new job and hand it to the worker pool, rejecting it with 429 when the queue is full.
+    A request for a stream that already has a job in flight within COALESCE_WINDOW_SECONDS attaches
+    to that job instead of starting another download. A session always gets a job of its own, and
+    isn't attached to. scheduled_event is stored with a new job, or with the job attached to, on
+    whichever replica runs it, so the sun planner can find it in the history. Returns the response
+    body; remote is set when the job attached to runs on another replica. job_id is the ID a new job
+    gets, a fresh one by default.
+    """
+    camera = camera or camera_registry.for_url(youtube_url)
+    key = normalize_youtube_url(youtube_url)
+    job_id = job_id or str(uuid.uuid4())
+    if session is None:
+        inflight = inflight_jobs.get(key)
+        if inflight and time.monotonic() - inflight[1] < COALESCE_WINDOW_SECONDS:
+            job_info = await active_jobs.get_job(inflight[0])
+            if job_info:
+                await active_jobs.update_job(inflight[0], coalesced_requests=job_info.get("coalesced_requests", 0) + 1)
+                if scheduled_event:
+                    await record_coalesced_event(inflight[0], scheduled_event)
+                logging.info(f"Coalescing request for {youtube_url} onto Job ID: {inflight[0]}")
+                return {"job_id": inflight[0],
+                        "status": job_info["status"],
+                        "coalesced": True,
+                        "message": f"Attached to in-flight collection with Job ID {inflight[0]}"}
+
+        # Another replica may already be capturing this stream; a window of 0 turns coalescing off
+        holder = job_id
+        if COALESCE_WINDOW_SECONDS > 0:
+            holder = await state_backend.acquire_lease(inflight_lease(youtube_url), job_id, COALESCE_WINDOW_SECONDS)
+        if holder != job_id:
+            job_info = await state_backend.get_job(holder)
+            if job_info and job_info["status"] not in TERMINAL_STATES:
+                logging.info(f"Coalescing request for {youtube_url} onto Job ID {holder} on another replica")
+                if scheduled_event:
+                    await state_backend.publish("coalesced_event", {"job_id": holder, "key": scheduled_event})
+                return {"job_id": holder,
+                        "status": job_info["status"],
+                        "coalesced": True,
+                        "remote": True,
+                        "message": f"Attached to in-flight collection with Job ID {holder}"}
+        inflight_jobs[key] = (job_id, time.monotonic())
+    job_info = {"status": JobState.QUEUED, "youtube_url": youtube_url, "camera": camera.id,
+                "start_time": datetime.now().isoformat()}
+    if scheduled_event:
+        job_info["scheduled_event"] = scheduled_event
+    if session:
+        job_info["session"] = session.to_dict()
+    await active_jobs.set_job(job_id, job_info)
+    try:
+        worker_pool.submit(job_id, youtube_url, camera, session)
+    except asyncio.QueueFull:
         await active_jobs.delete_job(job_id)
+        if session is None:
+            del inflight_jobs[key]
+            await state_backend.release_lease(inflight_lease(youtube_url), job_id)
+        logging.warning(f"Collection queue full, rejecting request for {youtube_url}")
+        raise HTTPException(status_code=429, detail="Collection queue is full.", headers={"Retry-After": "15"})
+    logging.info(f"Collection queued with Job ID: {job_id}")
+    return {"job_id": job_id,
+            "status": "queued",
+            "camera": camera.id,
+            "queue_position": worker_pool.queue.qsize(),
+            "message": f"Collection started with Job ID {job_id}"}
+
+
+async def launch_scheduled_capture(capture: ScheduledCapture) -> str:
+    """
+    Start a capture the scheduler has found a slot for; returns its job ID. A capture attached to a
+    job on another replica is marked remote, so it doesn't hold the slot.
+    Every replica plans the same sun events, and sessions aren't coalesced, so a capture with an
+    event key first takes the event's lease until the event is past its max delay, when no replica
+    would start it any more. If another replica holds it, that replica captures the event.
+    """
+    camera = camera_registry.get(capture.camera_id)
+    if camera is None:
+        raise ValueError(f"Camera {capture.camera_id!r} is no longer registered")
+    job_id = str(uuid.uuid4())
+    if capture.key:
+        ttl = max(1.0, capture.due + capture.max_delay - time.time())
+        holder = await state_backend.acquire_lease(event_lease(capture.key), job_id, ttl)
+        if holder != job_id:
+            logging.info(f"{capture.reason or 'Scheduled'} capture of {camera.id} is taken by Job ID {holder} "
+                         f"on another replica")
+            capture.remote = True
+            return holder
+    try:
+        response = await enqueue_collection(camera.url, camera, capture.key, capture.session, job_id)
+    except Exception:
+        if capture.key:
+            # Let another replica, or the next planning pass here, capture the event
+            await state_backend.release_lease(event_lease(capture.key), job_id)
+        raise
+    capture.remote = response.get("remote", False)
+    return response["job_id"]
+
 
-        @app.get("/health")
-        async def health_check():
-            """
-            Health check endpoint to verify the API is running.
-            """
-            return JSONResponse({"status": "ok", "message": "Service is healthy."})
+capture_scheduler = CaptureScheduler(launch_scheduled_capture, CAPTURE_BUDGET)
+
+
+def completed_sun_events(since: float) -> set[str]:
+    """
+    Keys of the scheduled events with a job that completed after since, so a restarted
+    process doesn't capture them again. Blocking; the planner calls it from a thread.
+    """
+    keys, cursor = set(), None
+    while True:
+        page = job_history.query(JobState.COMPLETED.value, since=since, limit=500, cursor=cursor)
+        for job in page["jobs"]:
+            keys.update(job.get("coalesced_events", []))
+            if job.get("scheduled_event"):
+                keys.add(job["scheduled_event"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            return keys
+
+
+sun_planner = SunEventPlanner(camera_registry, capture_scheduler, completed=completed_sun_events)
 
 
 @app.get("/")
@@ -276,18 +1534,34 @@ async def root():
     version_info = ("BUILD_TIME: " + BUILD_TIME) if BUILD_TIME else ("SERVER_START_TIME: " + SERVER_START_TIME)
     return JSONResponse({"message": "Camera Collector API is running!", "version": version_info})
 
+@app.get("/health")
+@app.get("/health/live")
+async def liveness():
+    """
+    Liveness: the process is up and its event loop is answering. Doesn't depend on GCS or egress.
+    """
+    return JSONResponse({"status": "ok", "message": "Service is healthy."})
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness: warmup has finished and the collection workers are running.
+    """
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
 @app.post("/collection/start/{youtube_url:path}")
-async def start_collection(youtube_url: Optional[str] = None):
+async def start_collection(request: Request, youtube_url: Optional[str] = None):
     """
     Starts a new collection job using the given YouTube URL or the default URL.
     """
-    youtube_url = youtube_url or DEFAULT_YOUTUBE_URL
-
-    job_id = str(uuid.uuid4())
-    asyncio.create_task(collect_and_upload_video(job_id, youtube_url))
-    await active_jobs.set_job(job_id, {"status": "started", "youtube_url": youtube_url, "start_time": datetime.now().isoformat()})
-    logging.info(f"Collection started with Job ID: {job_id}")
-    return JSONResponse({"job_id": job_id, "message": f"Collection started with Job ID {job_id}"})
+    # The ?v=... of a watch URL arrives as this request's query string, not as part of the path
+    if youtube_url and request.url.query:
+        youtube_url = f"{youtube_url}?{request.url.query}"
+    youtube_url = youtube_url or camera_registry.default.url
+    return await enqueue_collection(youtube_url)
 
 
 @app.post("/collection/start")
@@ -295,29 +1569,174 @@ async def start_collection_root(request: Request, youtube_url: Optional[str] = N
     """
     Redirects to the /collection/start/{youtube_url:path} with the default YouTube URL if none is provided.
     """
-    youtube_url = DEFAULT_YOUTUBE_URL
+    return await enqueue_collection(camera_registry.default.url, camera_registry.default)
 
-    job_id = str(uuid.uuid4())
-    asyncio.create_task(collect_and_upload_video(job_id, youtube_url))
-    await active_jobs.set_job(job_id, {"status": "started", "youtube_url": youtube_url, "start_time": datetime.now().isoformat()})
-    logging.info(f"Collection started with Job ID: {job_id}")
-    return JSONResponse({"job_id": job_id, "message": f"Collection started with Job ID {job_id}"})
 
+@app.get("/cameras")
+async def list_cameras():
+    """
+    The registered cameras and which one /collection/start uses.
+    """
+    return JSONResponse({"default": camera_registry.default.id,
+                         "cameras": [camera.to_dict() for camera in camera_registry]})
+
+
+def get_camera(camera_id: str) -> Camera:
+    camera = camera_registry.get(camera_id)
+    if camera is None:
+        raise HTTPException(status_code=404, detail="Camera not found.")
+    return camera
+
+
+@app.post("/cameras/{camera_id}/collect")
+async def collect_camera(camera_id: str):
+    """
+    Start a collection from a registered camera now, with its own clip length, encoding and bucket prefix.
+    """
+    camera = get_camera(camera_id)
+    return await enqueue_collection(camera.url, camera)
+
+
+def make_session(camera: Camera, clips: int, interval: float, clip_seconds: Optional[float]) -> Session:
+    try:
+        return Session(clips, clip_seconds or camera.capture_seconds, interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/cameras/{camera_id}/session")
+async def collect_camera_session(camera_id: str, clips: int, interval: float = 0,
+                                 clip_seconds: Optional[float] = None):
+    """
+    Start a session: clips clips from one connection to the camera's stream, each clip_seconds long
+    (the camera's clip length by default) and interval seconds apart (0 for back to back). Each clip
+    is uploaded as soon as it is captured.
+    """
+    camera = get_camera(camera_id)
+    return await enqueue_collection(camera.url, camera, session=make_session(camera, clips, interval, clip_seconds))
+
+
+@app.post("/schedule/{camera_id}")
+async def schedule_capture(camera_id: str, at: Optional[datetime] = None, reason: str = "",
+                           max_delay: Optional[float] = None, clips: int = 1, interval: float = 0):
+    """
+    Schedule a capture of a camera at the given time (now by default). Scheduled captures start in
+    time order within CAPTURE_BUDGET concurrent captures; one that can't start within max_delay
+    seconds of its time is dropped as missed. With clips above 1 it is captured as a session.
+    """
+    camera = get_camera(camera_id)
+    session = make_session(camera, clips, interval, None) if clips > 1 else None
+    due = at.timestamp() if at else time.time()
+    capture = capture_scheduler.schedule(camera_id, due, reason, max_delay, session=session)
+    return JSONResponse(capture.to_dict())
+
+
+@app.get("/schedule")
+async def get_schedule(limit: int = 50):
+    """
+    The scheduler's budget and counters, the sun event planner and the next scheduled captures.
+    """
+    return JSONResponse({**capture_scheduler.stats(), "sun": sun_planner.stats(),
+                         "upcoming": capture_scheduler.upcoming(limit)})
+
+
+@app.post("/collection/cancel/{job_id}")
+async def cancel_collection(job_id: str):
+    """
+    Cancel a queued or running collection job; running subprocesses are stopped.
+    """
+    job_info = await active_jobs.get_job(job_id)
+    state = worker_pool.cancel(job_id) if job_info else None
+    if not state:
+        raise HTTPException(status_code=404, detail="Job ID not found.")
+    if state == "queued":
+        release_inflight(job_id, job_info["youtube_url"])
+        await finish_job(job_id, JobState.CANCELLED)
+    logging.info(f"Cancelled {state} Job ID: {job_id}")
+    return JSONResponse({"job_id": job_id, "message": f"Cancelled {state} collection with Job ID {job_id}"})
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus metrics: stage latencies, failures by stage, queue, websocket and subprocess gauges.
+    """
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+@app.get("/egress")
+async def egress_status():
+    """
+    Latest result of the background external address / VPN check.
+    """
+    status = egress_monitor.status()
+    return JSONResponse(status, status_code=200 if status["healthy"] else 503)
 
 
 @app.get("/collection/status/{job_id}")
 async def collection_status(job_id: str):
     """
-    Retrieve the status of a specific job ID.
+    Retrieve the status of a specific job ID, from the active jobs or, once finished, the job history.
     """
-    job_info = await active_jobs.get_job(job_id)
+    job_info = await active_jobs.get_job(job_id) or job_history.get_recent(job_id)
+    if not job_info:
+        # Running or recently finished on another replica
+        job_info = await state_backend.get_job(job_id)
+    if not job_info:
+        job_info = await asyncio.to_thread(job_history.lookup, job_id)
     if not job_info:
         logging.warning(f"Job ID {job_id} not found.")
         raise HTTPException(status_code=404, detail="Job ID not found.")
-    logging.info(f"Status for Job ID {job_id}: {job_info}")
+    logging.debug(f"Status for Job ID {job_id}: {job_info.get('status')}")
     return JSONResponse(job_info)
 
 
+@app.get("/collection/history")
+async def collection_history(status: Optional[JobState] = None, since: Optional[datetime] = None,
+                             until: Optional[datetime] = None, limit: int = 50, cursor: Optional[str] = None):
+    """
+    Finished jobs, newest first, filtered by final status and by finish time (since <= finished < until).
+    Pass next_cursor from the response as cursor to get the next page.
+    """
+    try:
+        page = await asyncio.to_thread(job_history.query, status.value if status else None,
+                                       since.timestamp() if since else None,
+                                       until.timestamp() if until else None, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(page)
+
+
+@app.get("/videos/latest")
+async def latest_video(camera: Optional[str] = None):
+    """
+    The newest clip in the catalog, of one camera or of any, from memory without listing the bucket.
+    """
+    if clip_catalog.loaded:
+        clip = clip_catalog.latest(camera)
+    else:
+        clip = await asyncio.to_thread(clip_catalog.latest, camera)
+    if not clip:
+        raise HTTPException(status_code=404, detail="No clips in the catalog.")
+    return JSONResponse(clip)
+
+
+@app.get("/videos")
+async def list_videos(from_: Optional[datetime] = Query(None, alias="from"), to: Optional[datetime] = None,
+                      camera: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None):
+    """
+    Clips in the catalog in capture order, filtered by camera and by capture time (from <= captured < to).
+    Pass next_cursor from the response as cursor to get the next page.
+    """
+    try:
+        page = await asyncio.to_thread(clip_catalog.query, camera, from_.timestamp() if from_ else None,
+                                       to.timestamp() if to else None, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(page)
+
+
 @app.get("/active-collections")
 async def get_active_collections():
     """
@@ -325,37 +1744,53 @@ async def get_active_collections():
     """
     logging.info("Fetching active collections.")
     active_job_info = await active_jobs.get_all_jobs()
-    return JSONResponse({"active_jobs": active_job_info})
+    return JSONResponse({"active_jobs": active_job_info,
+                         "job_states": active_jobs.counts(),
+                         "history": job_history.stats(),
+                         "catalog": clip_catalog.stats(),
+                         "spool": {**clip_spool.stats(), **spool_uploader.stats()},
+                         "state_backend": state_backend.stats(),
+                         "queue": worker_pool.stats(),
+                         "scheduler": capture_scheduler.stats(),
+                         "quality": quality_policy.stats(),
+                         "uploads": gcs_uploader.stats(),
+                         "job_websockets": manager.stats(),
+                         "latest_websocket": latest_video_manager.stats(),
+                         "logging": logs.stats()})
 
 
-@app.websocket("/ws/{job_id}")
-async def websocket_endpoint(websocket: WebSocket, job_id: str):
+@app.websocket("/ws/latest")
+async def websocket_latest_endpoint(websocket: WebSocket):
     """
-    WebSocket connection for real-time notifications for a specific job.
+    WebSocket endpoint for clients to listen for updates about the latest video.
+    Registered before /ws/{job_id} so that route doesn't capture "latest" as a job ID.
     """
-    await manager.connect(websocket, job_id)
+    await latest_video_manager.connect(websocket)
     try:
         while True:
-            # Keep the connection alive
-            await websocket.receive_text()
+            await websocket.receive_text()  # Keep connection alive
     except WebSocketDisconnect:
-        manager.disconnect(job_id)
-        logging.info(f"WebSocket connection closed for Job ID: {job_id}")
+        latest_video_manager.disconnect(websocket)
 
 
-@app.websocket("/ws/latest")
-async def websocket_latest_endpoint(websocket: WebSocket):
+@app.websocket("/ws/{job_id}")
+async def websocket_endpoint(websocket: WebSocket, job_id: str):
     """
-    WebSocket endpoint for clients to listen for updates about the latest video.
+    WebSocket connection for real-time notifications for a specific job. Any number of clients
+    can watch the same job; each gets the job's recent messages on connect, and the socket is
+    closed by the server once the job is finished.
     """
-    await latest_video_manager.connect(websocket)
+    await manager.connect(websocket, job_id)
     try:
         while True:
-            await websocket.receive_text()  # Keep connection alive
+            # Keep the connection alive
+            await websocket.receive_text()
     except WebSocketDisconnect:
-        latest_video_manager.disconnect(websocket)
+        manager.disconnect(websocket, job_id)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    # Workers share jobs and websocket events only through STATE_BACKEND=redis
+    uvicorn.run("app:app" if workers > 1 else app, host="0.0.0.0", port=5000, workers=workers)
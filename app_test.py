@@ -1,21 +1,48 @@
+import json
 import pytest
 import asyncio
-from unittest.mock import AsyncMock, patch
-from app import collect_and_upload_video, active_jobs, app
+import io
+import os
+import sys
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+from app import (collect_and_upload_video, active_jobs, app, CollectionWorkerPool, inflight_jobs,
+                 normalize_youtube_url, StreamResolutionCache, resolve_stream, build_ffmpeg_cmd, can_stream_copy,
+                 run_ffmpeg, EgressMonitor, EgressUnavailableError, manager, latest_video_manager, finish_job,
+                 Readiness, launch_scheduled_capture, completed_sun_events, collect_session,
+                 upload_stills, capture_stream, handle_replica_event, enqueue_collection)
+from backend import MemoryBackend, MemoryBus, RedisBackend
+from cameras import Camera, CameraRegistry
+from catalog import ClipCatalog
+from fake_redis import FakeRedisServer
+from session import Session
+from spool import ClipSpool
+from stills import plan_stills
+from history import JobHistory
+from quality import LEVELS, QualityPolicy
+from jobs import JobState
+from uploader import GcsUploader
 from fastapi.testclient import TestClient
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 client = TestClient(app)
 
+
 @pytest.mark.asyncio
 class TestCameraCollector:
 
     @pytest.fixture(autouse=True)
-    def setup_and_teardown(self):
+    def setup_and_teardown(self, tmp_path_factory):
         """Setup and teardown for tests."""
-        active_jobs.data.clear()
-        yield
+        active_jobs.clear()
+        inflight_jobs.clear()
+        catalog = ClipCatalog(str(tmp_path_factory.mktemp("catalog") / "catalog.sqlite3"))
+        spool = ClipSpool(str(tmp_path_factory.mktemp("spool")))
+        with patch("app.state_backend", MemoryBackend()), patch("app.clip_catalog", catalog), \
+                patch("app.clip_spool", spool):
+            yield
+        catalog.close()
 
     async def test_root_endpoint(self):
         """Test the root endpoint to check API status and version."""
@@ -90,3 +117,686 @@ class TestCameraCollector:
         assert job_id2 in active_jobs_data
         assert active_jobs_data[job_id1]["url"] == "https://www.youtube.com/watch?v=example1"
         assert active_jobs_data[job_id2]["url"] == "https://www.youtube.com/watch?v=example2"
+
+    async def test_start_collection_queue_full(self):
+        """Test that requests beyond the queue capacity are rejected with 429."""
+        with patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=1)):
+            response = client.post("/collection/start/https://www.youtube.com/watch?v=example1")
+            assert response.status_code == 200
+            assert response.json()["status"] == "queued"
+
+            response = client.post("/collection/start/https://www.youtube.com/watch?v=example2")
+            assert response.status_code == 429
+            assert response.json()["detail"] == "Collection queue is full."
+        assert len(active_jobs) == 1
+
+    async def test_active_collections_reports_queue(self):
+        """Test that queue depth and capacity are exposed on /active-collections."""
+        with patch("app.worker_pool", CollectionWorkerPool(workers=2, max_queued=5)):
+            client.post("/collection/start")
+            response = client.get("/active-collections")
+        queue = response.json()["queue"]
+        assert queue["workers"] == 2
+        assert queue["queue_depth"] == 1
+        assert queue["queue_capacity"] == 5
+
+    async def test_worker_pool_runs_jobs_in_order(self):
+        """Test that workers drain queued jobs FIFO and record their wait time."""
+        pool = CollectionWorkerPool(workers=1, max_queued=5)
+        with patch("app.collect_and_upload_video", new_callable=AsyncMock) as collect:
+            pool.submit("job-1", "https://www.youtube.com/watch?v=example1")
+            pool.submit("job-2", "https://www.youtube.com/watch?v=example2")
+            pool.start()
+            await asyncio.wait_for(pool.queue.join(), timeout=5)
+            await pool.stop()
+        assert [c.args[0] for c in collect.await_args_list] == ["job-1", "job-2"]
+        assert pool.stats()["queue_depth"] == 0
+        assert len(pool.wait_times) == 2
+
+    async def test_normalize_youtube_url(self):
+        """Test that equivalent spellings of a stream URL share one key."""
+        canonical = "https://www.youtube.com/watch?v=hXtYKDio1rQ"
+        assert normalize_youtube_url("https://youtube.com/watch?v=hXtYKDio1rQ&t=30") == canonical
+        assert normalize_youtube_url("https://youtu.be/hXtYKDio1rQ") == canonical
+        assert normalize_youtube_url("https://www.youtube.com/live/hXtYKDio1rQ?si=abc") == canonical
+        assert normalize_youtube_url("https://Example.com/stream/") == "https://example.com/stream"
+
+    async def test_start_collection_coalesces_same_stream(self):
+        """Test that a second request for an in-flight stream attaches to the existing job."""
+        with patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)) as pool:
+            first = client.post("/collection/start/https://www.youtube.com/watch?v=example").json()
+            second = client.post("/collection/start/https://youtu.be/example").json()
+            other = client.post("/collection/start/https://www.youtube.com/watch?v=other").json()
+            assert pool.queue.qsize() == 2
+        assert second["job_id"] == first["job_id"]
+        assert second["coalesced"] is True
+        assert other["job_id"] != first["job_id"]
+        job_info = await active_jobs.get_job(first["job_id"])
+        assert job_info["youtube_url"] == "https://www.youtube.com/watch?v=example"
+        assert job_info["coalesced_requests"] == 1
+
+    async def test_start_collection_coalesce_window_expired(self):
+        """Test that requests outside the coalescing window start a new job."""
+        with patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)), \
+                patch("app.COALESCE_WINDOW_SECONDS", 0):
+            first = client.post("/collection/start").json()
+            second = client.post("/collection/start").json()
+        assert second["job_id"] != first["job_id"]
+
+    async def test_stream_cache_expiry_and_eviction(self):
+        """Test that stale entries are dropped and the soonest-expiring entry is evicted first."""
+        cache = StreamResolutionCache(ttl=60, max_entries=2)
+        cache.put("https://youtu.be/a", {"urls": ["a"], "expires_at": time.time() + 30})
+        cache.put("https://youtu.be/b", {"urls": ["b"], "expires_at": time.time() + 10})
+        cache.put("https://youtu.be/c", {"urls": ["c"], "expires_at": time.time() + 20})
+        assert cache.get("https://www.youtube.com/watch?v=a")["urls"] == ["a"]
+        assert cache.get("https://youtu.be/b") is None
+        assert cache.get("https://youtu.be/c")["urls"] == ["c"]
+
+        cache.put("https://youtu.be/d", {"urls": ["d"], "expires_at": time.time() - 1})
+        assert cache.get("https://youtu.be/d") is None
+
+    async def test_resolve_stream_uses_signed_url_expiry(self):
+        """Test that the cache lifetime of a resolved stream follows the googlevideo expire parameter."""
+        expire = int(time.time()) + 600
+        info = {
+            "format_id": "232+234",
+            "requested_formats": [
+                {"url": f"https://manifest.googlevideo.com/api/manifest/hls_playlist/expire/{expire}/itag/232/index.m3u8",
+                 "http_headers": {"User-Agent": "test"}},
+                {"url": f"https://manifest.googlevideo.com/api/manifest/hls_playlist/expire/{expire}/itag/234/index.m3u8"},
+            ],
+        }
+        with patch("app.run_command", new_callable=AsyncMock, return_value=(0, json.dumps(info).encode(), b"")):
+            stream = await resolve_stream("https://www.youtube.com/watch?v=example")
+        assert stream["format_id"] == "232+234"
+        assert len(stream["urls"]) == 2
+        assert stream["http_headers"] == {"User-Agent": "test"}
+        assert expire - 120 < stream["expires_at"] < expire
+
+    async def test_build_ffmpeg_cmd_encode_modes(self):
+        """Test that copy mode remuxes and transcode mode re-encodes with libx264/aac."""
+        copy_cmd = build_ffmpeg_cmd(["-i", "pipe:0"], "/tmp/out.mp4", copy=True)
+        assert copy_cmd[copy_cmd.index("-c") + 1] == "copy"
+        assert "libx264" not in copy_cmd
+        transcode_cmd = build_ffmpeg_cmd(["-i", "pipe:0"], "/tmp/out.mp4")
+        assert transcode_cmd[transcode_cmd.index("-c:v") + 1] == "libx264"
+        assert transcode_cmd[transcode_cmd.index("-t") + 1] == "15"
+        assert transcode_cmd[-1] == "/tmp/out.mp4"
+
+    async def test_build_ffmpeg_cmd_segments(self):
+        """Test that a session is cut by the segment muxer, forcing keyframes at the cuts when transcoding."""
+        cmd = build_ffmpeg_cmd(["-i", "pipe:0"], "/tmp/clip-%03d.mp4", duration=130, segment_times=[10, 60, 70, 120])
+        assert cmd[cmd.index("-f") + 1] == "segment"
+        assert cmd[cmd.index("-segment_times") + 1] == "10,60,70,120"
+        assert cmd[cmd.index("-force_key_frames") + 1] == "10,60,70,120"
+        assert cmd[cmd.index("-segment_list") + 1] == "pipe:1"
+        assert cmd[-1] == "/tmp/clip-%03d.mp4"
+        assert "-force_key_frames" not in build_ffmpeg_cmd(["-i", "pipe:0"], "/tmp/clip-%03d.mp4", copy=True,
+                                                           segment_times=[10])
+
+    async def test_can_stream_copy(self):
+        """Test that auto mode copies H.264/AAC sources and probes codecs yt-dlp could not name."""
+        assert await can_stream_copy({"urls": ["v"], "codecs": ["avc1.4D401F", "mp4a.40.2"]})
+        assert not await can_stream_copy({"urls": ["v"], "codecs": ["vp09.00.40.08", "opus"]})
+        stream = {"urls": ["v", "a"], "codecs": ["avc1.4D401F", None], "http_headers": {}}
+        with patch("app.probe_codecs", new_callable=AsyncMock, return_value=["h264", "aac"]) as probe:
+            assert await can_stream_copy(stream)
+            assert await can_stream_copy(stream)
+        probe.assert_awaited_once()
+
+    async def test_run_ffmpeg_streams_stdout_to_sink(self):
+        """Test that ffmpeg stdout goes to the sink while progress on stderr marks the first frame."""
+        fake_ffmpeg = [sys.executable, "-c", (
+            "import sys, time\n"
+            "sys.stderr.write('frame=0\\nprogress=continue\\n'); sys.stderr.flush()\n"
+            "sum(range(3000000))\n"
+            "sys.stderr.write('frame=30\\nout_time_us=7500000\\nprogress=continue\\n'); sys.stderr.flush()\n"
+            "sys.stdout.buffer.write(b'ftyp' * 100000)\n"
+            "sys.stderr.write('frame=450\\nout_time_us=15000000\\nprogress=end\\n')\n"
+        )]
+        sink = io.BytesIO()
+        progress = []
+
+        async def on_progress(percent):
+            progress.append(percent)
+
+        first_frame_at, encode_seconds, cpu_seconds = await run_ffmpeg(fake_ffmpeg, output_sink=sink,
+                                                                       on_progress=on_progress)
+        assert first_frame_at is not None
+        assert cpu_seconds > 0
+        assert progress == [50, 100]
+        assert sink.getvalue() == b"ftyp" * 100000
+
+    async def test_run_ffmpeg_timeout_kills_process(self):
+        """Test that a capture exceeding its wall-clock limit is killed and reported as an error."""
+        fake_ffmpeg = [sys.executable, "-c", "import time; time.sleep(30)"]
+        started = time.monotonic()
+        with pytest.raises(RuntimeError, match="timed out"):
+            await run_ffmpeg(fake_ffmpeg, timeout=0.5)
+        assert time.monotonic() - started < 10
+
+    async def test_cancel_queued_collection(self):
+        """Test that a queued job can be cancelled and is skipped by the workers."""
+        pool = CollectionWorkerPool(workers=1, max_queued=5)
+        with patch("app.worker_pool", pool), \
+                patch("app.collect_and_upload_video", new_callable=AsyncMock) as collect:
+            job_id = client.post("/collection/start").json()["job_id"]
+            response = client.post(f"/collection/cancel/{job_id}")
+            assert response.status_code == 200
+            assert await active_jobs.get_job(job_id) is None
+            assert client.post(f"/collection/cancel/{job_id}").status_code == 404
+
+            pool.start()
+            await asyncio.wait_for(pool.queue.join(), timeout=5)
+            await pool.stop()
+        collect.assert_not_awaited()
+
+    async def test_cancel_running_collection(self):
+        """Test that cancelling a running job cancels its task without stopping the worker."""
+        started = asyncio.Event()
+
+        async def slow_collection(job_id, youtube_url, camera=None):
+            started.set()
+            await asyncio.sleep(30)
+
+        pool = CollectionWorkerPool(workers=1, max_queued=5)
+        with patch("app.collect_and_upload_video", slow_collection):
+            pool.start()
+            pool.submit("job-1", "https://www.youtube.com/watch?v=example")
+            await asyncio.wait_for(started.wait(), timeout=5)
+            assert pool.cancel("job-1") == "running"
+            await asyncio.wait_for(pool.queue.join(), timeout=5)
+            assert all(not task.done() for task in pool._tasks)
+            await pool.stop()
+
+    async def test_capture_uses_adaptive_quality_level(self):
+        """Test that a capture resolves the format of its quality level and takes the level's preset, not its CRF."""
+        url = "https://www.youtube.com/watch?v=pier"
+        policy = QualityPolicy(cpus=64)
+        policy.bandwidth_kbps = 2000
+        stream = {"urls": ["https://example.com/231.m3u8"], "format_id": "231", "codecs": ["avc1.4D401F"],
+                  "bitrate_kbps": 1283, "http_headers": {}, "expires_at": time.time() + 600}
+        resolve = AsyncMock(return_value=stream)
+        run = AsyncMock(return_value=(time.monotonic(), 15.0, 3.0))
+        with patch("app.quality_policy", policy), patch("app.resolve_stream", resolve), patch("app.run_ffmpeg", run), \
+                patch("app.stream_cache", StreamResolutionCache(ttl=60, max_entries=4)), \
+                patch("app.egress_monitor", MagicMock(require_healthy=MagicMock(return_value=None))):
+            stats = await capture_stream(url, "/tmp/pier.mp4", encode_mode="transcode",
+                                         camera=Camera(id="pier", url=url, crf=30))
+        assert (stats["quality"], stats["format_id"]) == ("480p", "231")
+        assert resolve.await_args.args[1] == LEVELS[2].format_selector()
+        cmd = run.await_args.args[0]
+        assert cmd[cmd.index("-preset") + 1] == LEVELS[2].preset
+        assert cmd[cmd.index("-crf") + 1] == "30"
+        assert policy.running == []
+        assert policy.bandwidth_kbps > 2000
+
+    async def test_auto_capture_held_to_cpu_only_when_it_transcodes(self):
+        """Test that an auto capture that stream copies gets the best level the bandwidth allows on one CPU."""
+        url = "https://www.youtube.com/watch?v=pier"
+        policy = QualityPolicy(cpus=1)
+        policy.bandwidth_kbps = 4000
+        stream = {"urls": ["https://example.com/232.m3u8"], "format_id": "232", "codecs": ["avc1.4D401F", "mp4a.40.2"],
+                  "bitrate_kbps": 2448, "http_headers": {}, "expires_at": time.time() + 600}
+        resolve = AsyncMock(side_effect=lambda *args: dict(stream))
+        run = AsyncMock(return_value=(time.monotonic(), 15.0, 0.2))
+        with patch("app.quality_policy", policy), patch("app.resolve_stream", resolve), patch("app.run_ffmpeg", run), \
+                patch("app.stream_cache", StreamResolutionCache(ttl=60, max_entries=4)) as cache, \
+                patch("app.egress_monitor", MagicMock(require_healthy=MagicMock(return_value=None))):
+            for _ in range(2):
+                stats = await capture_stream(url, "/tmp/pier.mp4", encode_mode="auto")
+                assert (stats["quality"], stats["encode_mode"]) == ("720p", "copy")
+            assert cache.copy_compatible(url) is True
+
+            cache.set_copy_compatible(url, False)
+            stream["codecs"] = ["vp09.00.31.08", "opus"]
+            stats = await capture_stream(url, "/tmp/pier.mp4", encode_mode="auto")
+        assert (stats["quality"], stats["encode_mode"]) == ("480p", "transcode")
+
+    async def test_egress_monitor_caches_address(self):
+        """Test that the background check caches the address and status without per-job lookups."""
+        monitor = EgressMonitor(interval=60, expected_ips={"203.0.113.7"}, max_failures=2)
+        with patch("app.lookup_external_ip", return_value="203.0.113.7") as lookup:
+            await monitor.check()
+            assert monitor.require_healthy() == "203.0.113.7"
+            assert monitor.require_healthy() == "203.0.113.7"
+        assert lookup.call_count == 1
+        assert monitor.status()["healthy"] is True
+        with patch("app.egress_monitor", monitor):
+            response = client.get("/egress")
+        assert response.status_code == 200
+        assert response.json()["external_ip"] == "203.0.113.7"
+
+    async def test_egress_monitor_fails_fast_when_down(self):
+        """Test that jobs fail fast once egress is known bad, and recover after a good check."""
+        monitor = EgressMonitor(interval=60, expected_ips={"203.0.113.7"}, max_failures=2)
+        with patch("app.lookup_external_ip", side_effect=OSError("timed out")):
+            await monitor.check()
+            assert monitor.require_healthy() is None
+            await monitor.check()
+        with pytest.raises(EgressUnavailableError, match="consecutive"):
+            monitor.require_healthy()
+        with patch("app.egress_monitor", monitor):
+            assert client.get("/egress").status_code == 503
+
+        with patch("app.lookup_external_ip", return_value="198.51.100.1"):
+            await monitor.check()
+        with pytest.raises(EgressUnavailableError, match="not an expected VPN exit"):
+            monitor.require_healthy()
+        with patch("app.lookup_external_ip", return_value="203.0.113.7"):
+            await monitor.check()
+        assert monitor.require_healthy() == "203.0.113.7"
+
+    async def test_liveness_and_readiness(self):
+        """Test that liveness always answers and readiness waits for the warmup and the workers."""
+        assert client.get("/health").status_code == 200
+        assert client.get("/health/live").json()["status"] == "ok"
+
+        clients = []
+        uploader = GcsUploader(lambda: clients.append(object()) or MagicMock(), "bucket")
+        readiness = Readiness(retry_interval=0.01)
+        with patch("app.gcs_uploader", uploader), patch("app.readiness", readiness):
+            response = client.get("/health/ready")
+            assert response.status_code == 503
+            assert "warming up" in response.json()["problems"]
+            assert clients == []
+
+            readiness.start()
+            await readiness._task
+            assert len(clients) == 1
+            with patch.object(CollectionWorkerPool, "started", True):
+                response = client.get("/health/ready")
+                assert response.status_code == 200
+                assert response.json()["warmup_seconds"] is not None
+
+                await readiness.stop()
+                assert client.get("/health/ready").json()["problems"] == ["shutting down"]
+
+    async def test_warmup_retries_until_client_builds(self):
+        """Test that a failing client construction keeps the replica unready and is retried."""
+        attempts = []
+
+        def make_client():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OSError("credentials not found")
+            return MagicMock()
+
+        uploader = GcsUploader(make_client, "bucket")
+        readiness = Readiness(retry_interval=0.01)
+        with patch("app.gcs_uploader", uploader):
+            readiness.started_at = time.monotonic()
+            assert "GCS client not ready" not in " ".join(readiness.problems())
+            await readiness.warmup()
+            assert len(attempts) == 3
+            assert uploader.ready and readiness.last_error is None
+
+    def test_latest_websocket_not_shadowed_by_job_route(self):
+        """Test that /ws/latest subscribes to latest-video broadcasts rather than a job named 'latest'."""
+        with client.websocket_connect("/ws/latest"):
+            deadline = time.monotonic() + 5
+            while not latest_video_manager.broadcaster.clients and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(latest_video_manager.broadcaster.clients) == 1
+            assert "latest" not in manager.hub.channels
+
+    async def test_finished_job_served_from_history(self, tmp_path):
+        """Test that a finished job's status stays available and is listed by /collection/history."""
+        history = JobHistory(str(tmp_path / "history.sqlite3"))
+        with patch("app.job_history", history):
+            job_id = str(uuid.uuid4())
+            await active_jobs.set_job(job_id, {"status": "in progress",
+                                               "youtube_url": "https://www.youtube.com/watch?v=example"})
+            await finish_job(job_id, JobState.ERROR)
+            assert await active_jobs.get_job(job_id) is None
+
+            response = client.get(f"/collection/status/{job_id}")
+            assert response.status_code == 200
+            assert response.json()["status"] == "error"
+
+            response = client.get("/collection/history", params={"status": "error", "limit": 10})
+            assert response.status_code == 200
+            assert [job["job_id"] for job in response.json()["jobs"]] == [job_id]
+            assert client.get("/collection/history", params={"status": "completed"}).json()["jobs"] == []
+            assert client.get("/collection/history", params={"cursor": "bogus"}).status_code == 400
+        history.close()
+
+    async def test_jobs_shared_across_replicas(self):
+        """Test that a stream in flight on another replica is coalesced onto and its status served here."""
+        bus = MemoryBus()
+        other_replica = MemoryBackend(bus)
+        youtube_url = "https://www.youtube.com/watch?v=example"
+        await other_replica.acquire_lease(f"inflight:{normalize_youtube_url(youtube_url)}", "remote-job", ttl=60)
+        await other_replica.put_job("remote-job", {"status": "in progress", "youtube_url": youtube_url})
+
+        with patch("app.state_backend", MemoryBackend(bus)), \
+                patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)) as pool:
+            response = client.post(f"/collection/start/{youtube_url}").json()
+            assert response["job_id"] == "remote-job"
+            assert response["coalesced"] is True
+            assert pool.queue.qsize() == 0
+
+            status = client.get("/collection/status/remote-job")
+            assert status.status_code == 200
+            assert status.json()["status"] == "in progress"
+
+            await other_replica.put_job("remote-job", {"status": "completed", "youtube_url": youtube_url})
+            response = client.post(f"/collection/start/{youtube_url}").json()
+            assert response["job_id"] != "remote-job"
+            assert pool.queue.qsize() == 1
+
+    async def test_coalescing_off_with_redis_backend(self):
+        """Test that COALESCE_WINDOW_SECONDS=0 starts a job per request instead of taking a zero TTL lease."""
+        server = FakeRedisServer().start()
+        backend = RedisBackend(server.url, prefix="test")
+        try:
+            with patch("app.state_backend", backend), patch("app.COALESCE_WINDOW_SECONDS", 0), \
+                    patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)) as pool:
+                # Called on the test's loop rather than through the client, which runs on a loop of its own
+                responses = [await enqueue_collection("https://www.youtube.com/watch?v=example") for _ in range(2)]
+                assert responses[0]["job_id"] != responses[1]["job_id"]
+                assert not any(response.get("coalesced") for response in responses)
+                assert pool.queue.qsize() == 2
+            assert await backend.acquire_lease("inflight:zero-ttl", "job-1", ttl=0) == "job-1"
+        finally:
+            await backend.stop()
+            server.stop()
+
+    async def test_camera_collection_uses_camera_settings(self, tmp_path):
+        """Test that a camera's job carries its id and is captured and stored with its own settings."""
+        pier = Camera(id="pier", url="https://www.youtube.com/watch?v=pier", timezone="UTC", capture_seconds=30,
+                      encode_mode="copy", crf=28)
+        seacliff = Camera(id="seacliff", url="https://www.youtube.com/watch?v=example", gcs_prefix="")
+        registry = CameraRegistry([seacliff, pier])
+        pool = CollectionWorkerPool(workers=1, max_queued=5)
+        with patch("app.camera_registry", registry), patch("app.worker_pool", pool):
+            assert [c["id"] for c in client.get("/cameras").json()["cameras"]] == ["seacliff", "pier"]
+            assert client.post("/cameras/nowhere/collect").status_code == 404
+            data = client.post("/cameras/pier/collect").json()
+            assert data["camera"] == "pier"
+            assert (await active_jobs.get_job(data["job_id"]))["camera"] == "pier"
+            assert pool.queue.get_nowait()[2] is pier
+
+        capture = AsyncMock(return_value={})
+        with patch("app.camera_registry", registry), patch("app.CLIP_DIR", str(tmp_path)), \
+                patch("app.capture_stream", capture), \
+                patch("app.upload_to_gcs", side_effect=lambda path, blob: (blob, {})) as upload, \
+                patch("app.notify_latest_video", AsyncMock()):
+            await active_jobs.set_job("job-pier", {"status": JobState.QUEUED})
+            await collect_and_upload_video("job-pier", "https://youtu.be/pier")
+        assert capture.await_args.kwargs["camera"] is pier
+        assert capture.await_args.kwargs["encode_mode"] == "copy"
+        assert os.path.basename(capture.await_args.args[1]).startswith("pier-")
+        assert upload.call_args.args[1].startswith("pier/")
+        assert os.listdir(tmp_path) == []
+
+    async def test_session_uploads_clips_as_segments_close(self, tmp_path):
+        """Test that a session uploads each clip under its start time as it closes and drops the gaps."""
+        session = Session(clips=2, clip_seconds=10, interval=60)
+        uploaded = []
+
+        async def fake_capture(youtube_url, output_path, encode_mode, output_sink, on_progress, camera, session):
+            assert session.segment_times() == [10, 60]
+            for n in range(3):
+                path = output_path % n
+                with open(path, "wb") as f:
+                    f.write(b"clip")
+                await asyncio.to_thread(output_sink.write, f"{os.path.basename(path)},0,10\n".encode())
+                await asyncio.sleep(0.05)
+            assert len(uploaded) == 2
+            return {"encode_mode": "copy", "stream_source": "resolved"}
+
+        def fake_upload(path, blob_name):
+            uploaded.append((os.path.basename(path), blob_name))
+            return blob_name, {"upload_bytes": os.path.getsize(path)}
+
+        camera = Camera(id="pier", url="https://www.youtube.com/watch?v=pier", timezone="UTC")
+        with patch("app.CLIP_DIR", str(tmp_path)), patch("app.capture_stream", fake_capture), \
+                patch("app.upload_to_gcs", fake_upload), patch("app.notify_latest_video", AsyncMock()) as notify:
+            await active_jobs.set_job("job-session", {"status": JobState.QUEUED})
+            await collect_session("job-session", camera.url, camera, session)
+        assert [name for name, _ in uploaded] == ["pier-000.mp4", "pier-002.mp4"]
+        first, second = (datetime.strptime(blob.split("pier-", 1)[1], "%Y-%m-%dT%H:%M-%S%z.mp4")
+                         for _, blob in uploaded)
+        assert (second - first).total_seconds() == 60
+        assert notify.await_count == 2
+        assert os.listdir(tmp_path) == []
+
+    async def test_session_endpoint_starts_uncoalesced_job(self):
+        """Test that a session gets its own queued job even while a clip of the same stream is in flight."""
+        pool = CollectionWorkerPool(workers=1, max_queued=5)
+        with patch("app.worker_pool", pool):
+            clip = client.post("/collection/start").json()
+            response = client.post("/cameras/seacliff/session", params={"clips": 3, "interval": 60})
+            assert response.status_code == 200
+            assert response.json()["job_id"] != clip["job_id"]
+            assert (await active_jobs.get_job(response.json()["job_id"]))["session"]["clips"] == 3
+            assert pool.queue.qsize() == 2
+            assert client.post("/cameras/seacliff/session", params={"clips": 3, "interval": 5}).status_code == 400
+
+    async def test_stills_uploaded_beside_clip(self, tmp_path):
+        """Test that the poster goes beside the clip and to the camera's latest, and missing stills are skipped."""
+        poster, sprite = plan_stills(str(tmp_path / "pier-t.mp4"), "jpg", sprite_interval=3)
+        with open(poster.path, "wb") as f:
+            f.write(b"\xff\xd8")
+        uploader = MagicMock()
+        camera = Camera(id="pier", url="https://www.youtube.com/watch?v=pier")
+        with patch("app.gcs_uploader", uploader):
+            blobs = upload_stills([poster, sprite], "pier/2025/01/pier-t.mp4", camera)
+        assert blobs == {"poster_blob": "pier/2025/01/pier-t.jpg"}
+        uploads = [(c.args[1], c.args[3]) for c in uploader.upload_file.call_args_list]
+        assert uploads == [("pier/2025/01/pier-t.jpg", "public, max-age=31536000, immutable"),
+                           ("pier/latest.jpg", "public, max-age=60")]
+
+    async def test_frozen_clip_skipped(self, tmp_path):
+        """Test that with FROZEN_ACTION=skip a clip without motion completes its job without an upload."""
+        import numpy as np
+        from analysis import ANALYSIS_SIZE, ClipAnalyzer
+
+        async def fake_capture(youtube_url, output_path, analysis_path, **kwargs):
+            with open(output_path, "wb") as f:
+                f.write(b"clip")
+            np.full((20, ANALYSIS_SIZE, ANALYSIS_SIZE), 128, dtype=np.uint8).tofile(analysis_path)
+            return {"encode_mode": "copy"}
+
+        upload = MagicMock()
+        with patch("app.CLIP_DIR", str(tmp_path)), patch("app.capture_stream", fake_capture), \
+                patch("app.UPLOAD_MODE", "file"), patch("app.clip_analyzer", ClipAnalyzer()), \
+                patch("analysis.ANALYSIS_ENABLED", True), patch("analysis.FROZEN_ACTION", "skip"), patch("app.upload_to_gcs", upload), \
+                patch("app.notify_latest_video", AsyncMock()) as notify, \
+                patch("app.finish_job", AsyncMock()) as finish:
+            await active_jobs.set_job("job-frozen", {"status": JobState.QUEUED})
+            await collect_and_upload_video("job-frozen", "https://www.youtube.com/watch?v=example")
+        finish.assert_awaited_once_with("job-frozen", JobState.COMPLETED)
+        job = await active_jobs.get_job("job-frozen")
+        assert job["skipped"] == "frozen"
+        assert job["analysis"]["frozen"] is True
+        assert "blob_name" not in job
+        upload.assert_not_called()
+        notify.assert_not_awaited()
+        assert os.listdir(tmp_path) == []
+
+    async def test_uploaded_clip_served_from_catalog(self, tmp_path):
+        """Test that an uploaded clip is cataloged and found by /videos/latest and a /videos time range."""
+        camera = Camera(id="pier", url="https://www.youtube.com/watch?v=pier", timezone="UTC")
+        registry = CameraRegistry([camera])
+        with patch("app.camera_registry", registry), patch("app.CLIP_DIR", str(tmp_path)), \
+                patch("app.capture_stream", AsyncMock(return_value={})), \
+                patch("app.upload_to_gcs", side_effect=lambda path, blob: (blob, {"upload_bytes": 4,
+                                                                                "upload_crc32c": "AAAAAA=="})), \
+                patch("app.notify_latest_video", AsyncMock()) as notify:
+            assert client.get("/videos/latest").status_code == 404
+            await active_jobs.set_job("job-pier", {"status": JobState.QUEUED})
+            await collect_and_upload_video("job-pier", camera.url)
+        blob_name = notify.await_args.kwargs["blob_name"]
+
+        latest = client.get("/videos/latest", params={"camera": "pier"}).json()
+        assert latest["blob_name"] == blob_name
+        assert (latest["duration_seconds"], latest["size_bytes"], latest["crc32c"]) == (15, 4, "AAAAAA==")
+        captured_at = datetime.fromisoformat(latest["captured_at"])
+        in_range = client.get("/videos", params={"from": (captured_at - timedelta(minutes=1)).isoformat(),
+                                                  "to": (captured_at + timedelta(minutes=1)).isoformat()})
+        assert [clip["blob_name"] for clip in in_range.json()["clips"]] == [blob_name]
+        later = client.get("/videos", params={"from": (captured_at + timedelta(seconds=1)).isoformat()})
+        assert later.json()["clips"] == []
+        assert client.get("/videos", params={"cursor": "bogus"}).status_code == 400
+
+    async def test_failed_upload_waits_in_spool(self, tmp_path, tmp_path_factory):
+        """Test that a clip whose upload fails stays in the spool and is uploaded and cataloged later."""
+        from app import clip_spool, upload_spooled_clip
+
+        camera = Camera(id="pier", url="https://www.youtube.com/watch?v=pier", timezone="UTC")
+
+        async def fake_capture(youtube_url, output_path, **kwargs):
+            with open(output_path, "wb") as f:
+                f.write(b"clip")
+            return {"encode_mode": "copy"}
+
+        history = JobHistory(str(tmp_path_factory.mktemp("history") / "history.sqlite3"))
+        with patch("app.camera_registry", CameraRegistry([camera])), patch("app.CLIP_DIR", str(tmp_path)), \
+                patch("app.capture_stream", fake_capture), patch("app.UPLOAD_MODE", "file"), \
+                patch("app.job_history", history), \
+                patch("app.upload_to_gcs", side_effect=RuntimeError("503 Service Unavailable")), \
+                patch("app.notify_latest_video", AsyncMock()) as notify:
+            await active_jobs.set_job("job-pier", {"status": JobState.QUEUED})
+            await collect_and_upload_video("job-pier", camera.url)
+        job = history.get_recent("job-pier")
+        assert job["status"] == JobState.COMPLETED
+        assert (job["spooled"], job["upload_error"]) == (True, "503 Service Unavailable")
+        notify.assert_not_awaited()
+        assert os.listdir(tmp_path) == []
+        [entry] = clip_spool.entries.values()
+        assert (entry.attempts, entry.claimed) == (1, False)
+        with open(entry.file(entry.manifest["clip"]), "rb") as f:
+            assert f.read() == b"clip"
+
+        upload = MagicMock(side_effect=lambda path, blob: (blob, {"upload_bytes": 4}))
+        with patch("app.upload_to_gcs", upload), patch("app.job_history", history), \
+                patch("app.notify_latest_video", AsyncMock()) as notify:
+            await upload_spooled_clip(entry)
+        blob_name = upload.call_args.args[1]
+        notify.assert_awaited_once_with(None, blob_name=blob_name)
+        assert client.get("/videos/latest", params={"camera": "pier"}).json()["blob_name"] == blob_name
+        assert history.get_recent("job-pier")["spool_uploads"] == [{"blob_name": blob_name, "upload_bytes": 4}]
+
+    async def test_schedule_endpoint(self):
+        """Test that captures can be scheduled for registered cameras and are listed with the budget."""
+        from scheduler import CaptureScheduler
+
+        scheduler = CaptureScheduler(AsyncMock(return_value="job-1"), budget=3)
+        with patch("app.capture_scheduler", scheduler):
+            assert client.post("/schedule/nowhere").status_code == 404
+            response = client.post("/schedule/seacliff", params={"at": "2099-01-01T00:00:00+00:00",
+                                                                 "reason": "sunset"})
+            assert response.status_code == 200
+            schedule = client.get("/schedule").json()
+        assert schedule["budget"] == 3
+        assert schedule["upcoming"][0]["camera_id"] == "seacliff"
+        assert schedule["upcoming"][0]["reason"] == "sunset"
+
+    async def test_completed_sun_event_found_after_restart(self, tmp_path):
+        """Test that a sun event's key is stored with its job and found in the history once it completed."""
+        from scheduler import ScheduledCapture
+
+        history = JobHistory(str(tmp_path / "history.sqlite3"))
+        capture = ScheduledCapture(1000.0, 0, "seacliff", "sunset", key="seacliff:sunset:1000")
+        with patch("app.job_history", history), \
+                patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)):
+            job_id = await launch_scheduled_capture(capture)
+            assert (await active_jobs.get_job(job_id))["scheduled_event"] == "seacliff:sunset:1000"
+            assert completed_sun_events(0) == set()
+            await finish_job(job_id, JobState.COMPLETED)
+            assert completed_sun_events(0) == {"seacliff:sunset:1000"}
+            assert completed_sun_events(time.time() + 60) == set()
+        history.close()
+
+    async def test_scheduled_capture_coalesced_onto_another_replica(self, tmp_path):
+        """Test that a capture attached to another replica's job holds no slot here and is recorded on that job."""
+        from scheduler import CaptureScheduler
+
+        bus = MemoryBus()
+        received = []
+
+        async def other_replica_events(channel, message):
+            received.append((channel, message))
+
+        other_replica = MemoryBackend(bus)
+        await other_replica.start(other_replica_events)
+        youtube_url = "https://www.youtube.com/watch?v=example"
+        await other_replica.acquire_lease(f"inflight:{normalize_youtube_url(youtube_url)}", "remote-job", ttl=60)
+        await other_replica.put_job("remote-job", {"status": "in progress", "youtube_url": youtube_url})
+
+        registry = CameraRegistry([Camera(id="seacliff", url=youtube_url, gcs_prefix="")])
+        scheduler = CaptureScheduler(launch_scheduled_capture, budget=1)
+        with patch("app.state_backend", MemoryBackend(bus)), patch("app.camera_registry", registry), \
+                patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)) as pool:
+            scheduler.schedule("seacliff", time.time() - 1, "sunset", key="seacliff:sunset:1")
+            scheduler.schedule("seacliff", time.time() - 1, "sunset", key="seacliff:sunset:2")
+            await scheduler.launch_due()
+            assert scheduler.launched == 2
+            assert scheduler.running == {}
+            assert pool.queue.qsize() == 0
+        assert received == [("coalesced_event", {"job_id": "remote-job", "key": "seacliff:sunset:1"}),
+                            ("coalesced_event", {"job_id": "remote-job", "key": "seacliff:sunset:2"})]
+
+        # On the replica running the job, the events are stored with it and found once it completed
+        history = JobHistory(str(tmp_path / "history.sqlite3"))
+        with patch("app.job_history", history):
+            await active_jobs.set_job("remote-job", {"status": JobState.IN_PROGRESS, "youtube_url": youtube_url})
+            for channel, message in received:
+                await handle_replica_event(channel, message)
+            await finish_job("remote-job", JobState.COMPLETED)
+            assert completed_sun_events(0) == {"seacliff:sunset:1", "seacliff:sunset:2"}
+        history.close()
+
+    async def test_sun_session_captured_by_one_replica(self):
+        """Test that a scheduled session whose event another replica took is left to it, and one is taken here."""
+        from scheduler import CaptureScheduler
+
+        bus = MemoryBus()
+        other_replica = MemoryBackend(bus)
+        session = Session(clips=2, clip_seconds=10, interval=60)
+        registry = CameraRegistry([Camera(id="seacliff", url="https://www.youtube.com/watch?v=example",
+                                          gcs_prefix="")])
+        await other_replica.acquire_lease("event:seacliff:sunset:1", "remote-job", ttl=600)
+        scheduler = CaptureScheduler(launch_scheduled_capture, budget=2)
+        with patch("app.state_backend", MemoryBackend(bus)), patch("app.camera_registry", registry), \
+                patch("app.worker_pool", CollectionWorkerPool(workers=1, max_queued=5)) as pool:
+            scheduler.schedule("seacliff", time.time() - 1, "sunset", key="seacliff:sunset:1", session=session)
+            scheduler.schedule("seacliff", time.time() - 1, "sunset", key="seacliff:sunset:2", session=session)
+            await scheduler.launch_due()
+            assert pool.queue.qsize() == 1
+            job_id = pool.queue.get_nowait()[0]
+        assert list(scheduler.running) == [job_id]
+        assert (await active_jobs.get_job(job_id))["scheduled_event"] == "seacliff:sunset:2"
+        assert await other_replica.acquire_lease("event:seacliff:sunset:2", "remote-job-2", ttl=600) == job_id
+
+    async def test_metrics_endpoint(self):
+        """Test that /metrics exposes stage histograms, failure counters and running subprocesses."""
+        from prometheus_client import REGISTRY
+        import metrics
+
+        metrics.observe_job_stats({"resolve_seconds": 1.2, "first_frame_seconds": 2.5, "encode_mode": "copy",
+                                   "encode_seconds": 15.1, "upload_seconds": 0.8, "upload_bytes": 1000}, "file")
+        failures_before = REGISTRY.get_sample_value("collector_failures_total", {"stage": "capture"}) or 0
+
+        fake_ffmpeg = [sys.executable, "-c", "import time; time.sleep(30)"]
+        task = asyncio.create_task(run_ffmpeg(fake_ffmpeg, timeout=0.5))
+        await asyncio.sleep(0.2)
+        body = client.get("/metrics").text
+        assert f'collector_subprocesses{{name="{os.path.basename(sys.executable)}"}} 1.0' in body
+        with pytest.raises(RuntimeError):
+            await task
+
+        with patch("app.capture_stream", AsyncMock(side_effect=RuntimeError("ffmpeg failed"))):
+            with pytest.raises(RuntimeError):
+                await collect_and_upload_video("job-metrics", "https://www.youtube.com/watch?v=example")
+
+        body = client.get("/metrics").text
+        for name in ("collector_resolve_seconds_bucket", "collector_time_to_first_frame_seconds_count",
+                     'collector_encode_seconds_count{mode="copy"}', 'collector_upload_seconds_count{mode="file"}',
+                     "collector_queue_wait_seconds_count", 'collector_websocket_broadcast_seconds_count{channel="job"}',
+                     'collector_jobs_total{status="error"}', "collector_queue_depth"):
+            assert name in body
+        assert REGISTRY.get_sample_value("collector_failures_total", {"stage": "capture"}) == failures_before + 1
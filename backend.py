@@ -0,0 +1,188 @@
+"""
+Shared job state, leases and events for running several replicas or uvicorn workers.
+
+Each process keeps its own JobStore and websocket hubs; the backend is what
+lets them cooperate. Job status snapshots are published to a shared key so any
+replica can answer /collection/status, websocket events are fanned out to every
+other replica so subscribers connected anywhere see them, and leases make sure
+only one replica starts a capture for a given stream at a time.
+
+STATE_BACKEND=memory (the default) keeps everything in-process, which is all a
+single replica needs. STATE_BACKEND=redis shares it through REDIS_URL; the
+redis package is only imported for that backend. fake_redis.py is a local
+stand-in for tests.
+"""
+from typing import Awaitable, Callable, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "camera-collector")
+# How long a replica keeps a job's shared status after its last update
+JOB_STATE_TTL_SECONDS = float(os.getenv("JOB_STATE_TTL_SECONDS", "3600"))
+
+# Atomic lease operations; fake_redis.py implements the same scripts natively
+ACQUIRE_LEASE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then return ARGV[1] end
+return redis.call('GET', KEYS[1])
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+EventHandler = Callable[[str, dict], Awaitable[None]]
+
+
+class MemoryBus:
+    """
+    What a Redis server provides to the memory backend. Backends sharing one bus behave like
+    replicas sharing one Redis, which is how the fan-out is tested without a server.
+    """
+    def __init__(self):
+        self.jobs: dict[str, tuple[float, dict]] = {}
+        self.leases: dict[str, tuple[float, str]] = {}
+        self.backends: list["MemoryBackend"] = []
+        self._puts = 0
+
+    def sweep(self):
+        now = time.monotonic()
+        for store in (self.jobs, self.leases):
+            for key in [key for key, (expires_at, _) in store.items() if expires_at <= now]:
+                del store[key]
+
+
+class MemoryBackend:
+    def __init__(self, bus: Optional[MemoryBus] = None, replica_id: Optional[str] = None):
+        self.bus = bus or MemoryBus()
+        self.replica_id = replica_id or uuid.uuid4().hex
+        self._handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        self._handler = handler
+        self.bus.backends.append(self)
+
+    async def stop(self):
+        if self in self.bus.backends:
+            self.bus.backends.remove(self)
+
+    async def publish(self, channel: str, message: dict):
+        """Deliver an event to every other replica."""
+        for backend in list(self.bus.backends):
+            if backend is not self and backend._handler:
+                await backend._handler(channel, message)
+
+    async def put_job(self, job_id: str, job_info: dict, ttl: float = JOB_STATE_TTL_SECONDS):
+        self.bus.jobs[job_id] = (time.monotonic() + ttl, job_info)
+        self.bus._puts += 1
+        if self.bus._puts % 1000 == 0:
+            self.bus.sweep()
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        entry = self.bus.jobs.get(job_id)
+        return entry[1] if entry and entry[0] > time.monotonic() else None
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> str:
+        """Take the lease if it is free or expired; returns whoever holds it afterwards."""
+        entry = self.bus.leases.get(name)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self.bus.leases[name] = (time.monotonic() + ttl, owner)
+        return owner
+
+    async def release_lease(self, name: str, owner: str):
+        entry = self.bus.leases.get(name)
+        if entry and entry[1] == owner:
+            del self.bus.leases[name]
+
+    def stats(self):
+        return {"backend": "memory", "replica_id": self.replica_id, "replicas": len(self.bus.backends)}
+
+
+def expire_ms(ttl: float) -> int:
+    """A TTL as a Redis PX expiry, which has to be at least 1 ms; SET rejects 0 as invalid."""
+    return max(1, int(ttl * 1000))
+
+
+class RedisBackend:
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_KEY_PREFIX, replica_id: Optional[str] = None):
+        import redis.asyncio as redis
+
+        # RESP2 is enough for these commands and is what fake_redis.py speaks
+        self.redis = redis.from_url(url, protocol=2)
+        self.prefix = prefix
+        self.replica_id = replica_id or uuid.uuid4().hex
+        self.events_channel = f"{prefix}:events"
+        self._acquire = self.redis.register_script(ACQUIRE_LEASE_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_LEASE_SCRIPT)
+        self._handler: Optional[EventHandler] = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+
+    async def start(self, handler: EventHandler):
+        self._handler = handler
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(self.events_channel)
+        self._task = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                event = json.loads(message["data"])
+                if event["origin"] == self.replica_id:
+                    continue
+                self.received += 1
+                await self._handler(event["channel"], event["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"State backend event handling failed: {e}")
+                await asyncio.sleep(1)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self.redis.aclose()
+
+    async def publish(self, channel: str, message: dict):
+        await self.redis.publish(self.events_channel, json.dumps(
+            {"origin": self.replica_id, "channel": channel, "message": message}, default=str))
+
+    async def put_job(self, job_id: str, job_info: dict, ttl: float = JOB_STATE_TTL_SECONDS):
+        await self.redis.set(f"{self.prefix}:job:{job_id}", json.dumps(job_info, default=str), px=expire_ms(ttl))
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        value = await self.redis.get(f"{self.prefix}:job:{job_id}")
+        return json.loads(value) if value else None
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> str:
+        """Take the lease if it is free or expired; returns whoever holds it afterwards."""
+        holder = await self._acquire(keys=[f"{self.prefix}:lease:{name}"], args=[owner, expire_ms(ttl)])
+        return holder.decode() if isinstance(holder, bytes) else holder
+
+    async def release_lease(self, name: str, owner: str):
+        await self._release(keys=[f"{self.prefix}:lease:{name}"], args=[owner])
+
+    def stats(self):
+        return {"backend": "redis", "replica_id": self.replica_id, "events_received": self.received}
+
+
+def make_backend(kind: str = STATE_BACKEND):
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown STATE_BACKEND {kind!r}; expected 'memory' or 'redis'.")
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from backend import MemoryBackend, MemoryBus, RedisBackend
+from fake_redis import FakeRedisServer
+
+
+@pytest_asyncio.fixture(params=["memory", "redis"])
+async def replicas(request):
+    """Two backends that share state, like two replicas of the collector."""
+    if request.param == "memory":
+        bus = MemoryBus()
+        backends = [MemoryBackend(bus), MemoryBackend(bus)]
+        server = None
+    else:
+        server = FakeRedisServer().start()
+        backends = [RedisBackend(server.url, prefix="test"), RedisBackend(server.url, prefix="test")]
+    events = [[], []]
+    for backend, received in zip(backends, events):
+        async def handler(channel, message, received=received):
+            received.append((channel, message))
+        await backend.start(handler)
+    yield backends, events
+    for backend in backends:
+        await backend.stop()
+    if server:
+        server.stop()
+
+
+async def wait_until(condition, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_events_reach_other_replicas_only(replicas):
+    """Test that a published event is delivered to every other replica but not back to the sender."""
+    (first, second), (first_events, second_events) = replicas
+    await first.publish("job", {"job_id": "job-1", "text": "hello"})
+    await wait_until(lambda: second_events)
+    assert second_events == [("job", {"job_id": "job-1", "text": "hello"})]
+    await asyncio.sleep(0.1)
+    assert first_events == []
+
+
+@pytest.mark.asyncio
+async def test_job_state_is_shared(replicas):
+    """Test that job status written by one replica can be read by another."""
+    (first, second), _ = replicas
+    await first.put_job("job-1", {"status": "in progress", "progress": 50})
+    assert await second.get_job("job-1") == {"status": "in progress", "progress": 50}
+    assert await second.get_job("job-2") is None
+
+    await first.put_job("job-3", {"status": "completed"}, ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await second.get_job("job-3") is None
+
+
+@pytest.mark.asyncio
+async def test_leases_are_exclusive(replicas):
+    """Test that only one replica holds a lease, only its holder can release it, and it expires."""
+    (first, second), _ = replicas
+    assert await first.acquire_lease("inflight:a", "job-1", ttl=30) == "job-1"
+    assert await second.acquire_lease("inflight:a", "job-2", ttl=30) == "job-1"
+    await second.release_lease("inflight:a", "job-2")
+    assert await second.acquire_lease("inflight:a", "job-2", ttl=30) == "job-1"
+    await first.release_lease("inflight:a", "job-1")
+    assert await second.acquire_lease("inflight:a", "job-2", ttl=0.05) == "job-2"
+    await asyncio.sleep(0.1)
+    assert await first.acquire_lease("inflight:a", "job-3", ttl=30) == "job-3"
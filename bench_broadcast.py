@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the /ws/latest broadcast engine.
+
+Simulates thousands of websocket clients in-process, a share of them slow or
+stalled, publishes a burst of messages and reports how long publishing takes
+and how quickly healthy clients receive each frame. --sequential runs the same
+load through the old one-client-at-a-time send loop for comparison.
+
+    python bench_broadcast.py --clients 5000 --slow 0.05 --messages 20
+"""
+import argparse
+import asyncio
+import functools
+import json
+import random
+import statistics
+import time
+
+from broadcast import Broadcaster
+
+
+class SimulatedClient:
+    """Stands in for a Starlette WebSocket; records when each frame arrived."""
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.received: dict[int, float] = {}
+
+    async def send(self, message: dict):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.received[sequence_of(message["text"])] = time.perf_counter()
+
+    async def send_text(self, text: str):
+        await self.send({"type": "websocket.send", "text": text})
+
+
+@functools.lru_cache(maxsize=1024)
+def sequence_of(text: str) -> int:
+    return json.loads(text)["seq"]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    clients = []
+    for _ in range(args.clients):
+        slow = rng.random() < args.slow
+        clients.append(SimulatedClient(args.slow_latency if slow else rng.uniform(0, args.latency)))
+    healthy = [c for c in clients if c.latency < args.slow_latency]
+
+    broadcaster = Broadcaster(queue_size=args.queue_size, send_timeout=args.send_timeout)
+    if not args.sequential:
+        for client in clients:
+            broadcaster.subscribe(client)
+
+    published_at = {}
+    publish_seconds = []
+    for seq in range(args.messages):
+        message = json.dumps({"seq": seq, "latest_video_url": "https://weather.fogcat5.com/collector/video_latest"})
+        started = time.perf_counter()
+        published_at[seq] = started
+        if args.sequential:
+            for client in clients:
+                try:
+                    await asyncio.wait_for(client.send_text(message), timeout=args.send_timeout)
+                except asyncio.TimeoutError:
+                    pass
+        else:
+            broadcaster.publish(message)
+        publish_seconds.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval)
+
+    deadline = time.perf_counter() + args.drain_seconds
+    while time.perf_counter() < deadline and any(len(c.received) < args.messages for c in healthy):
+        await asyncio.sleep(0.01)
+
+    latencies = [received - published_at[seq] for c in healthy for seq, received in c.received.items()]
+    delivered = sum(len(c.received) for c in healthy)
+    stats = broadcaster.stats()
+    await broadcaster.close()
+    return {
+        "mode": "sequential" if args.sequential else "fan-out",
+        "clients": args.clients,
+        "slow_clients": args.clients - len(healthy),
+        "messages": args.messages,
+        "publish_ms_p50": round(statistics.median(publish_seconds) * 1000, 3),
+        "publish_ms_max": round(max(publish_seconds) * 1000, 3),
+        "delivery_ms_p50": round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        "delivery_ms_p99": round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        "healthy_delivery_ratio": round(delivered / (len(healthy) * args.messages), 4) if healthy else None,
+        "dropped_frames": stats["dropped_frames"],
+        "disconnected": stats["disconnected"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between published messages")
+    parser.add_argument("--latency", type=float, default=0.002, help="max send latency of a healthy client")
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of clients that are slow")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="send latency of a slow client")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--send-timeout", type=float, default=5.0)
+    parser.add_argument("--drain-seconds", type=float, default=10.0)
+    parser.add_argument("--sequential", action="store_true", help="use the old sequential send loop")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
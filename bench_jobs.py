@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the job store against the previous lock-and-copy registry.
+
+Tracks --jobs jobs, applies --updates progress/status updates spread across
+them, and every --read-every updates serves one /active-collections read
+(all jobs) and a batch of status reads, as the API would under polling.
+
+    python bench_jobs.py --jobs 10000 --updates 100000
+"""
+from collections import UserDict
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+
+from jobs import JobState, JobStore
+
+
+class LegacyJobs(UserDict):
+    """The registry app.py used before JobStore: plain dicts behind one asyncio.Lock."""
+    def __init__(self):
+        super().__init__()
+        self._lock = asyncio.Lock()
+
+    async def set_status(self, job_id, status, progress=None):
+        message = {"job_id": job_id, "status": status}
+        if progress is not None:
+            message["progress"] = progress
+        async with self._lock:
+            if job_id in self.data:
+                self.data[job_id]["status"] = status
+                if progress is not None:
+                    self.data[job_id]["progress"] = progress
+        json.dumps(message)
+
+    async def set_job(self, job_id, job_info):
+        async with self._lock:
+            self.data[job_id] = job_info
+        json.dumps({"job_id": job_id, "job_info": job_info})
+
+    async def get_job(self, job_id):
+        async with self._lock:
+            return self.data.get(job_id)
+
+    async def get_all_jobs(self):
+        async with self._lock:
+            return {job_id: job_info for job_id, job_info in self.data.items()}
+
+
+async def notify(job_id, message):
+    pass
+
+
+async def run(store, args):
+    rng = random.Random(args.seed)
+    ids = [f"job-{n}" for n in range(args.jobs)]
+    tracemalloc.start()
+    started = time.perf_counter()
+    for n, job_id in enumerate(ids):
+        await store.set_job(job_id, {"status": "queued", "youtube_url": f"https://www.youtube.com/watch?v={n % 50}",
+                                     "start_time": "2024-06-01T05:00:00"})
+    create_seconds = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    update_seconds = list_seconds = status_seconds = 0.0
+    states = [JobState.IN_PROGRESS, JobState.UPLOADING]
+    for n in range(args.updates):
+        job_id = ids[rng.randrange(len(ids))]
+        t = time.perf_counter()
+        await store.set_status(job_id, states[n % 2], progress=n % 100)
+        update_seconds += time.perf_counter() - t
+        if n % args.read_every == 0:
+            t = time.perf_counter()
+            await store.get_all_jobs()
+            list_seconds += time.perf_counter() - t
+            t = time.perf_counter()
+            for _ in range(args.status_reads):
+                await store.get_job(ids[rng.randrange(len(ids))])
+            status_seconds += time.perf_counter() - t
+    reads = args.updates // args.read_every + 1
+    return {
+        "store": type(store).__name__,
+        "jobs": args.jobs,
+        "memory_mb": round(memory / 1e6, 2),
+        "create_us_per_job": round(create_seconds / args.jobs * 1e6, 2),
+        "update_us": round(update_seconds / args.updates * 1e6, 2),
+        "list_ms": round(list_seconds / reads * 1e3, 3),
+        "status_read_us": round(status_seconds / (reads * args.status_reads) * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--updates", type=int, default=100000)
+    parser.add_argument("--read-every", type=int, default=100, help="updates between /active-collections reads")
+    parser.add_argument("--status-reads", type=int, default=20, help="status reads per read cycle")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    for store in (LegacyJobs(), JobStore(notify=notify)):
+        print(json.dumps(asyncio.run(run(store, args))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Event loop latency benchmark for the collector's logging.
+
+Runs simulated jobs on one event loop, each logging the way a collection job
+does: a websocket send line for every progress update plus the stage lines,
+while a probe task measures how late the loop wakes it up. The log sink can be
+made slow (--write-latency per write) to stand in for a backed-up pipe to the
+container runtime. --mode before logs as the API used to, every record
+formatted and written on the loop and every send logged; --mode after goes
+through logs.py: the queue handler, the writer thread and send sampling.
+
+    python bench_logging.py --jobs 20 --mode before --write-latency 0.0005
+    python bench_logging.py --jobs 20 --mode after --write-latency 0.0005
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+
+import logs
+
+
+class SlowSink:
+    """A stream to /dev/null that takes latency seconds per write, like a pipe nobody is draining."""
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.devnull = open(os.devnull, "w")
+        self.writes = 0
+
+    def write(self, text: str):
+        if self.latency:
+            time.sleep(self.latency)
+        self.writes += 1
+        return self.devnull.write(text)
+
+    def flush(self):
+        self.devnull.flush()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def job(n: int, args, sampler):
+    job_id = f"job-{n}"
+    job_info = {"job_id": job_id, "status": "in progress", "youtube_url": "https://www.youtube.com/watch?v=x",
+                "progress": 0, "encode_mode": "copy", "quality": "720p"}
+    with logs.log_context(job_id=job_id, camera="seacliff"):
+        for progress in range(args.updates):
+            job_info["progress"] = progress
+            message = json.dumps(job_info)
+            skipped = sampler.sample() if sampler else 0
+            if skipped is not None:
+                logging.info(f"Message sent to 1 subscriber(s) of Job ID {job_id}: {message}",
+                             extra={"stage": "websocket", "sampled_out": skipped})
+            if progress % 10 == 0:
+                logging.info(f"Status for Job ID {job_id}: {job_info}", extra={"stage": "capture"})
+            await asyncio.sleep(args.interval)
+        logging.info(f"Job ID {job_id} finished: completed", extra={"stage": "finish", "duration": 1.0})
+
+
+async def probe(lags: list, stop: asyncio.Event, period: float):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(period)
+        lags.append(time.perf_counter() - started - period)
+
+
+async def run(args):
+    sink = SlowSink(args.write_latency)
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.setLevel(logging.INFO)
+    if args.mode == "before":
+        handler = logging.StreamHandler(sink)
+        handler.setFormatter(logging.Formatter(logs.TEXT_FORMAT))
+        root.addHandler(handler)
+        sampler = None
+    else:
+        logs.setup_logging(stream=sink)
+        sampler = logs.LogSampler(args.sample_every)
+
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop, args.probe_period))
+    started = time.perf_counter()
+    await asyncio.gather(*(job(n, args, sampler) for n in range(args.jobs)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    dropped = logs.stats()["dropped"]
+    logs.stop_logging()
+    return {
+        "mode": args.mode,
+        "jobs": args.jobs,
+        "updates_per_job": args.updates,
+        "write_latency_ms": args.write_latency * 1000,
+        "wall_seconds": round(wall, 3),
+        "loop_lag_ms_p50": round(statistics.median(lags) * 1000, 3),
+        "loop_lag_ms_p99": round(percentile(lags, 99) * 1000, 3),
+        "loop_lag_ms_max": round(max(lags) * 1000, 3),
+        "records_written": sink.writes,
+        "records_dropped": dropped,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=("before", "after"), default="after")
+    parser.add_argument("--jobs", type=int, default=20, help="concurrent simulated jobs")
+    parser.add_argument("--updates", type=int, default=100, help="progress updates per job")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between a job's updates")
+    parser.add_argument("--write-latency", type=float, default=0.0005, help="seconds the sink takes per write")
+    parser.add_argument("--sample-every", type=int, default=logs.WEBSOCKET_LOG_SAMPLE_EVERY)
+    parser.add_argument("--probe-period", type=float, default=0.001)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark for the collector API.
+
+Starts the app under uvicorn with everything external replaced locally: yt-dlp
+by fake_yt_dlp.py serving an FFmpeg testsrc clip, GCS by fake_gcs.py, and the
+egress check by a data: URL. It then drives /collection/start at the given
+concurrency, follows each job on its websocket (plus any extra watchers and
+/ws/latest listeners) and reports jobs/min, p50/p99 end-to-end latency, CPU
+seconds per clip for the server and its FFmpeg/yt-dlp children, and peak
+memory of that process tree.
+
+The source is a file, so FFmpeg reads it as fast as it can rather than in
+real time; the numbers measure processing cost and overheads, not the 15s
+capture window. Results can be saved and compared against an earlier run:
+
+    python bench_pipeline.py --jobs 20 --concurrency 4 --save bench_results/baseline.json
+    python bench_pipeline.py --jobs 20 --concurrency 4 --compare bench_results/baseline.json
+"""
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from prometheus_client.parser import text_string_to_metric_families
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+import httpx
+
+from fake_gcs import FakeGcsServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TERMINAL = {"completed", "cancelled", "error"}
+# Result fields compared by --compare, and whether a higher value is better
+COMPARED = {
+    "jobs_per_minute": True,
+    "latency_p50_seconds": False,
+    "latency_p99_seconds": False,
+    "cpu_seconds_per_clip": False,
+    "peak_rss_bytes": False,
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_source(path: str, args):
+    """Encode a testsrc + sine clip long enough for one capture as the fake stream."""
+    subprocess.run([
+        "ffmpeg", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"testsrc=size={args.resolution}:rate={args.fps}",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+        "-t", str(args.source_seconds), "-c:v", "libx264", "-g", str(args.fps * 2), "-c:a", "aac",
+        "-movflags", "+faststart", path,
+    ], check=True)
+
+
+def fake_bin(directory: str):
+    """Directory to put first on PATH so the app's yt-dlp is fake_yt_dlp.py."""
+    os.makedirs(directory, exist_ok=True)
+    wrapper = os.path.join(directory, "yt-dlp")
+    with open(wrapper, "w") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "fake_yt_dlp.py")}" "$@"\n')
+    os.chmod(wrapper, 0o755)
+    return directory
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def tree_rss(pid: int):
+    """Resident bytes of pid and all its descendants, read from /proc."""
+    total, pending = 0, [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * resource.getpagesize()
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    pending += [int(child) for child in f.read().split()]
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+class MemorySampler:
+    """Polls the server's process tree in a thread and keeps the peak."""
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, tree_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def follow_job(client: httpx.AsyncClient, ws_url: str, n: int, args):
+    """Start one job, watch it to the end and return its final status and end-to-end latency."""
+    started = time.perf_counter()
+    response = await client.post(f"/collection/start/https://www.youtube.com/watch?v=bench-{n}")
+    if response.status_code != 200:
+        return {"status": f"http {response.status_code}", "latency": None}
+    job_id = response.json()["job_id"]
+
+    async def watch():
+        # The server closes job websockets once the job is finished
+        messages = 0
+        try:
+            async with connect(f"{ws_url}/ws/{job_id}") as websocket:
+                async for _ in websocket:
+                    messages += 1
+        except ConnectionClosed:
+            pass
+        return messages
+
+    try:
+        async with asyncio.timeout(args.job_timeout):
+            messages = await asyncio.gather(*(watch() for _ in range(args.watchers)))
+    except TimeoutError:
+        messages = []
+    # A job that finished before its websocket connected is only visible through its status
+    async with asyncio.timeout(args.job_timeout):
+        while (status := (await client.get(f"/collection/status/{job_id}")).json().get("status")) not in TERMINAL:
+            await asyncio.sleep(0.1)
+    return {"status": status, "latency": time.perf_counter() - started, "messages": sum(messages)}
+
+
+async def listen_latest(ws_url: str, received: list, ready: asyncio.Event):
+    async with connect(f"{ws_url}/ws/latest") as websocket:
+        ready.set()
+        try:
+            async for _ in websocket:
+                received[0] += 1
+        except ConnectionClosed:
+            pass
+
+
+async def drive(base_url: str, args):
+    ws_url = base_url.replace("http://", "ws://")
+    latest = [0]
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.job_timeout) as client:
+        ready = [asyncio.Event() for _ in range(args.latest_clients)]
+        listeners = [asyncio.create_task(listen_latest(ws_url, latest, event)) for event in ready]
+        for event in ready:
+            await event.wait()
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def one(n):
+            async with limit:
+                return await follow_job(client, ws_url, n, args)
+
+        started = time.perf_counter()
+        jobs = await asyncio.gather(*(one(n) for n in range(args.jobs)))
+        wall_seconds = time.perf_counter() - started
+        exposition = (await client.get("/metrics")).text
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+    return jobs, wall_seconds, latest[0], exposition
+
+
+def metric_sum(exposition: str, name: str):
+    """Sum and count of a histogram across its labels."""
+    total = count = 0.0
+    for family in text_string_to_metric_families(exposition):
+        for sample in family.samples:
+            if sample.name == f"{name}_sum":
+                total += sample.value
+            elif sample.name == f"{name}_count":
+                count += sample.value
+    return total, count
+
+
+def metric_value(exposition: str, name: str):
+    return sum(sample.value for family in text_string_to_metric_families(exposition)
+               for sample in family.samples if sample.name == name)
+
+
+def wait_until_up(client: httpx.Client, server: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode} during startup")
+        try:
+            client.get("/")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("Server did not come up")
+
+
+def run(args, workdir: str):
+    source = os.path.join(workdir, "testsrc.mp4")
+    make_source(source, args)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with FakeGcsServer() as gcs:
+        env = dict(
+            os.environ,
+            PATH=f"{fake_bin(os.path.join(workdir, 'bin'))}{os.pathsep}{os.environ['PATH']}",
+            FAKE_YT_DLP_SOURCE=source,
+            FAKE_YT_DLP_DELAY_SECONDS=str(args.resolve_delay),
+            STORAGE_EMULATOR_HOST=gcs.url,
+            BUCKET_NAME="bench",
+            EGRESS_CHECK_URL="data:,203.0.113.1",
+            SUN_SCHEDULER_ENABLED="0",
+            CLIP_DIR=os.path.join(workdir, "clips"),
+            SPOOL_DIR=os.path.join(workdir, "spool"),
+            JOB_HISTORY_PATH=os.path.join(workdir, "history.sqlite3"),
+            MAX_CONCURRENT_JOBS=str(args.workers or args.concurrency),
+            MAX_QUEUED_JOBS=str(args.jobs),
+            ENCODE_MODE=args.encode_mode,
+            UPLOAD_MODE=args.upload_mode,
+        )
+        before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+            cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+        try:
+            with httpx.Client(base_url=base_url) as client:
+                wait_until_up(client, server)
+            with MemorySampler(server.pid) as memory:
+                jobs, wall_seconds, notifications, exposition = asyncio.run(drive(base_url, args))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    cpu_seconds = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    completed = [job for job in jobs if job["status"] == "completed"]
+    latencies = [job["latency"] for job in completed]
+    encode_cpu, encodes = metric_sum(exposition, "collector_encode_cpu_seconds")
+    return {
+        "jobs": args.jobs,
+        "completed": len(completed),
+        "failed": {status: sum(1 for job in jobs if job["status"] == status)
+                   for status in {job["status"] for job in jobs} - {"completed"}},
+        "upload_bytes": int(metric_value(exposition, "collector_upload_bytes_total")),
+        "wall_seconds": round(wall_seconds, 3),
+        "jobs_per_minute": round(len(completed) / wall_seconds * 60, 2),
+        "latency_p50_seconds": round(percentile(latencies, 50), 3) if latencies else None,
+        "latency_p99_seconds": round(percentile(latencies, 99), 3) if latencies else None,
+        "cpu_seconds_per_clip": round(cpu_seconds / len(completed), 3) if completed else None,
+        "ffmpeg_cpu_seconds_per_clip": round(encode_cpu / encodes, 3) if encodes else None,
+        "peak_rss_bytes": memory.peak,
+        "job_messages": sum(job.get("messages", 0) for job in jobs),
+        "latest_notifications": notifications,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, tolerance: float):
+    """Relative change of each compared result against the baseline, and which ones regressed."""
+    changes, regressions = {}, []
+    for key, higher_is_better in COMPARED.items():
+        old, new = baseline["results"].get(key), report["results"].get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        changes[key] = round(change, 4)
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(key)
+    return changes, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="jobs in flight from the client side")
+    parser.add_argument("--workers", type=int, help="MAX_CONCURRENT_JOBS for the server (default: --concurrency)")
+    parser.add_argument("--watchers", type=int, default=1, help="websocket clients following each job")
+    parser.add_argument("--latest-clients", type=int, default=10, help="clients listening on /ws/latest")
+    parser.add_argument("--encode-mode", choices=("copy", "transcode", "auto"), default="auto")
+    parser.add_argument("--upload-mode", choices=("file", "stream"), default="file")
+    parser.add_argument("--resolution", default="640x360")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--source-seconds", type=int, default=16, help="length of the testsrc clip")
+    parser.add_argument("--resolve-delay", type=float, default=0.0, help="seconds each fake yt-dlp call takes")
+    parser.add_argument("--job-timeout", type=float, default=300.0)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--compare", help="baseline report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative worsening of a compared result that counts as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the server's log")
+    args = parser.parse_args()
+
+    config = {key: value for key, value in vars(args).items()
+              if key not in ("save", "compare", "tolerance", "verbose")}
+    with tempfile.TemporaryDirectory(prefix="bench-pipeline-") as workdir:
+        results = run(args, workdir)
+    report = {
+        "benchmark": "pipeline",
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "cpus": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"Warning: baseline was run with a different config: {baseline.get('config')}", file=sys.stderr)
+        report["baseline"] = {"commit": baseline.get("commit"), "recorded_at": baseline.get("recorded_at")}
+        report["changes"], regressions = compare(report, baseline, args.tolerance)
+        report["regressions"] = regressions
+    print(json.dumps(report, indent=2))
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Import and startup time of the collector API, for CI.
+
+Measures `import app` in fresh interpreters with -X importtime, then starts
+the app under uvicorn (GCS pointed at fake_gcs.py, egress check at a data:
+URL) and times how long it takes until /health/live and /health/ready answer
+200. Exits non-zero when a median exceeds its budget:
+
+    python bench_startup.py --runs 5 --max-import-seconds 1.5 --max-ready-seconds 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_pipeline import HERE, free_port
+from fake_gcs import FakeGcsServer
+
+
+def measure_import(env: dict):
+    """Seconds `import app` takes, and the modules that took longest on their own."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=HERE, env=env,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "self [us]" not in line:
+            own, cumulative, name = line.removeprefix("import time:").split("|")
+            modules.append((name.strip(), int(own), int(cumulative)))
+    total = next(cumulative for name, _, cumulative in reversed(modules) if name == "app")
+    slowest = sorted(modules, key=lambda m: m[1], reverse=True)[:10]
+    return total / 1e6, {name: round(own / 1e6, 4) for name, own, _ in slowest}
+
+
+def wait_for(client: httpx.Client, path: str, server: subprocess.Popen, deadline: float):
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode} during startup")
+        try:
+            if client.get(path).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise RuntimeError(f"{path} did not return 200 in time")
+
+
+def measure_startup(env: dict, timeout: float):
+    """Seconds from spawning uvicorn until the liveness and readiness endpoints answer 200."""
+    port = free_port()
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            wait_for(client, "/health/live", server, started + timeout)
+            live = time.monotonic() - started
+            wait_for(client, "/health/ready", server, started + timeout)
+            ready = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return live, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a server to become ready")
+    parser.add_argument("--max-import-seconds", type=float, help="fail if the median import time exceeds this")
+    parser.add_argument("--max-ready-seconds", type=float, help="fail if the median time to ready exceeds this")
+    parser.add_argument("--save", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    imports, live, ready = [], [], []
+    with tempfile.TemporaryDirectory(prefix="bench-startup-") as workdir, FakeGcsServer() as gcs:
+        env = dict(
+            os.environ,
+            STORAGE_EMULATOR_HOST=gcs.url,
+            EGRESS_CHECK_URL="data:,203.0.113.1",
+            SUN_SCHEDULER_ENABLED="0",
+            CLIP_DIR=workdir,
+            SPOOL_DIR=os.path.join(workdir, "spool"),
+            JOB_HISTORY_PATH=os.path.join(workdir, "history.sqlite3"),
+        )
+        for _ in range(args.runs):
+            seconds, slowest = measure_import(env)
+            imports.append(seconds)
+            live_seconds, ready_seconds = measure_startup(env, args.timeout)
+            live.append(live_seconds)
+            ready.append(ready_seconds)
+
+    report = {
+        "benchmark": "startup",
+        "runs": args.runs,
+        "import_seconds_p50": round(statistics.median(imports), 4),
+        "import_seconds_max": round(max(imports), 4),
+        "live_seconds_p50": round(statistics.median(live), 4),
+        "ready_seconds_p50": round(statistics.median(ready), 4),
+        "ready_seconds_max": round(max(ready), 4),
+        "slowest_imports": slowest,
+    }
+    failures = []
+    if args.max_import_seconds and report["import_seconds_p50"] > args.max_import_seconds:
+        failures.append(f"import took {report['import_seconds_p50']}s, budget {args.max_import_seconds}s")
+    if args.max_ready_seconds and report["ready_seconds_p50"] > args.max_ready_seconds:
+        failures.append(f"ready after {report['ready_seconds_p50']}s, budget {args.max_ready_seconds}s")
+    report["failures"] = failures
+    print(json.dumps(report, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Websocket fan-out that never waits on a slow viewer.
+
+Each subscriber gets a small bounded queue and its own sender task. Publishing
+serializes the message once into a shared ASGI frame and appends it to every
+queue without awaiting anything, so one laggard can't hold up the others. A
+full queue drops its oldest frame, and a client that can't take a frame within
+the send timeout is disconnected.
+
+ChannelHub keys broadcasters by job ID, keeps a short ring buffer of each
+job's recent events for subscribers that connect late, and closes the channel
+once the job is finished.
+"""
+from collections import deque
+from typing import Union
+import asyncio
+import json
+import logging
+import os
+
+# Frames buffered per client before the oldest is dropped
+WS_CLIENT_QUEUE_SIZE = int(os.getenv("WS_CLIENT_QUEUE_SIZE", "8"))
+# A client that can't accept a single frame in this long is disconnected
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "10"))
+# Recent events per job replayed to a subscriber when it connects
+JOB_EVENT_REPLAY_SIZE = int(os.getenv("JOB_EVENT_REPLAY_SIZE", "16"))
+# How long a finished job's channel keeps answering late subscribers before it is dropped
+JOB_CHANNEL_LINGER_SECONDS = float(os.getenv("JOB_CHANNEL_LINGER_SECONDS", "60"))
+
+CLOSE_FRAME = {"type": "websocket.close", "code": 1000}
+
+
+def make_frame(message: Union[str, dict]) -> dict:
+    """Serialize a message once into an ASGI send frame that can be shared by every client."""
+    text = message if isinstance(message, str) else json.dumps(message)
+    return {"type": "websocket.send", "text": text}
+
+
+class BroadcastClient:
+    """
+    One subscriber: a bounded frame queue drained by a dedicated sender task.
+    """
+    def __init__(self, websocket, broadcaster: "Broadcaster", queue_size: int):
+        self.websocket = websocket
+        self.frames: deque = deque(maxlen=queue_size)
+        self.dropped = 0
+        self.sent = 0
+        self._ready = asyncio.Event()
+        self._broadcaster = broadcaster
+        self._task = asyncio.create_task(self._send_loop())
+
+    def offer(self, frame: dict):
+        """Queue a frame without blocking, dropping the oldest one if the client is behind."""
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self._ready.set()
+
+    async def _send_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.frames:
+                    async with asyncio.timeout(self._broadcaster.send_timeout):
+                        await self.websocket.send(self.frames.popleft())
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Dropping websocket client after failed send: {e!r}")
+            self._broadcaster.unsubscribe(self, cancel=False)
+
+    async def close(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class Broadcaster:
+    def __init__(self, queue_size: int = WS_CLIENT_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.clients: dict[int, BroadcastClient] = {}
+        self.published = 0
+        self.disconnected = 0
+
+    def subscribe(self, websocket) -> BroadcastClient:
+        """Start delivering broadcasts to an accepted websocket."""
+        client = BroadcastClient(websocket, self, self.queue_size)
+        self.clients[id(websocket)] = client
+        return client
+
+    def unsubscribe(self, client: BroadcastClient, cancel: bool = True):
+        """Stop delivering to a client; its sender task is cancelled unless it is the caller."""
+        if self.clients.pop(id(client.websocket), None) is not None:
+            self.disconnected += 1
+            if cancel:
+                client._task.cancel()
+
+    def publish(self, message: Union[str, dict]) -> int:
+        """
+        Serialize once and queue the frame for every client. Returns the number of clients reached.
+        Never awaits, so it costs the publisher the same whether clients are fast or stalled.
+        """
+        return self.publish_frame(make_frame(message))
+
+    def publish_frame(self, frame: dict) -> int:
+        clients = list(self.clients.values())
+        for client in clients:
+            client.offer(frame)
+        self.published += 1
+        return len(clients)
+
+    def unsubscribe_all(self):
+        for client in list(self.clients.values()):
+            self.unsubscribe(client)
+
+    async def close(self):
+        clients = list(self.clients.values())
+        self.clients.clear()
+        await asyncio.gather(*(client.close() for client in clients))
+
+    def stats(self):
+        clients = list(self.clients.values())
+        return {
+            "clients": len(clients),
+            "published": self.published,
+            "disconnected": self.disconnected,
+            "dropped_frames": sum(client.dropped for client in clients),
+            "lagging_clients": sum(1 for client in clients if client.frames),
+        }
+
+
+class Channel:
+    def __init__(self, queue_size: int, send_timeout: float, replay_size: int):
+        self.broadcaster = Broadcaster(queue_size, send_timeout)
+        self.history: deque = deque(maxlen=replay_size)
+        self.finished = False
+
+
+class ChannelHub:
+    """
+    Broadcasters keyed by job ID, with replay of recent events and cleanup when the job finishes.
+    """
+    def __init__(self, replay_size: int = JOB_EVENT_REPLAY_SIZE, linger: float = JOB_CHANNEL_LINGER_SECONDS,
+                 queue_size: int = WS_CLIENT_QUEUE_SIZE, send_timeout: float = WS_SEND_TIMEOUT_SECONDS):
+        self.replay_size = replay_size
+        self.linger = linger
+        # Room for a full replay plus the close frame, so a late subscriber never loses replayed events
+        self.queue_size = max(queue_size, replay_size + 1)
+        self.send_timeout = send_timeout
+        self.channels: dict[str, Channel] = {}
+
+    def _channel(self, key: str) -> Channel:
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = Channel(self.queue_size, self.send_timeout, self.replay_size)
+        return channel
+
+    def subscribe(self, key: str, websocket) -> BroadcastClient:
+        """Subscribe an accepted websocket, replaying recent events (and the close, if the job is over)."""
+        channel = self._channel(key)
+        client = channel.broadcaster.subscribe(websocket)
+        for frame in channel.history:
+            client.offer(frame)
+        if channel.finished:
+            client.offer(CLOSE_FRAME)
+        return client
+
+    def unsubscribe(self, key: str, websocket):
+        channel = self.channels.get(key)
+        if channel is None:
+            return
+        client = channel.broadcaster.clients.get(id(websocket))
+        if client:
+            channel.broadcaster.unsubscribe(client)
+        if not channel.broadcaster.clients and not channel.history:
+            del self.channels[key]
+
+    def publish(self, key: str, message: Union[str, dict]) -> int:
+        """Record the event for replay and send it to the job's current subscribers."""
+        channel = self._channel(key)
+        frame = make_frame(message)
+        channel.history.append(frame)
+        return channel.broadcaster.publish_frame(frame)
+
+    def finish(self, key: str):
+        """
+        Close the job's subscribers after their queued events, and drop the channel once the
+        linger period in which late subscribers still get the replay has passed.
+        """
+        channel = self.channels.get(key)
+        if channel is None or channel.finished:
+            return
+        channel.finished = True
+        channel.broadcaster.publish_frame(CLOSE_FRAME)
+        asyncio.get_running_loop().call_later(self.linger, self._expire, key, channel)
+
+    def _expire(self, key: str, channel: Channel):
+        if self.channels.get(key) is channel:
+            del self.channels[key]
+        channel.broadcaster.unsubscribe_all()
+
+    async def close(self):
+        channels = list(self.channels.values())
+        self.channels.clear()
+        await asyncio.gather(*(channel.broadcaster.close() for channel in channels))
+
+    def stats(self):
+        return {
+            "channels": len(self.channels),
+            "finished_channels": sum(1 for channel in self.channels.values() if channel.finished),
+            "subscribers": sum(len(channel.broadcaster.clients) for channel in self.channels.values()),
+        }
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import pytest
+
+from broadcast import Broadcaster, ChannelHub, CLOSE_FRAME
+
+
+class FakeWebSocket:
+    def __init__(self, latency: float = 0, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.frames = []
+
+    async def send(self, message: dict):
+        if self.fail:
+            raise RuntimeError("connection reset")
+        await asyncio.sleep(self.latency)
+        self.frames.append(message)
+
+
+async def wait_until(condition, timeout: float = 5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others():
+    """Test that publishing returns immediately and fast clients are served while a slow one lags."""
+    broadcaster = Broadcaster(queue_size=4, send_timeout=30)
+    slow = FakeWebSocket(latency=10)
+    fast = [FakeWebSocket() for _ in range(100)]
+    broadcaster.subscribe(slow)
+    for ws in fast:
+        broadcaster.subscribe(ws)
+
+    assert broadcaster.publish({"latest_video_url": "a"}) == 101
+    await wait_until(lambda: all(ws.frames for ws in fast))
+    assert not slow.frames
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_message_serialized_once_and_shared():
+    """Test that every client receives the same pre-serialized frame object."""
+    broadcaster = Broadcaster()
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for ws in sockets:
+        broadcaster.subscribe(ws)
+    broadcaster.publish({"latest_video_url": "a"})
+    await wait_until(lambda: all(ws.frames for ws in sockets))
+    frames = [ws.frames[0] for ws in sockets]
+    assert all(frame is frames[0] for frame in frames)
+    assert json.loads(frames[0]["text"]) == {"latest_video_url": "a"}
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_lagging_client_drops_oldest():
+    """Test that a client's queue keeps only the newest frames once it is full."""
+    broadcaster = Broadcaster(queue_size=3, send_timeout=30)
+    ws = FakeWebSocket(latency=0.2)
+    client = broadcaster.subscribe(ws)
+    for n in range(10):
+        broadcaster.publish(str(n))
+    await wait_until(lambda: len(ws.frames) == 3)
+    assert [frame["text"] for frame in ws.frames] == ["7", "8", "9"]
+    assert client.dropped == 7
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_and_stalled_clients_are_removed():
+    """Test that clients whose sends fail or time out are unsubscribed without affecting others."""
+    broadcaster = Broadcaster(send_timeout=0.1)
+    broken, stalled, healthy = FakeWebSocket(fail=True), FakeWebSocket(latency=10), FakeWebSocket()
+    for ws in (broken, stalled, healthy):
+        broadcaster.subscribe(ws)
+    broadcaster.publish("hello")
+    await wait_until(lambda: len(broadcaster.clients) == 1)
+    assert id(healthy) in broadcaster.clients
+    assert broadcaster.stats()["disconnected"] == 2
+    broadcaster.publish("again")
+    await wait_until(lambda: len(healthy.frames) == 2)
+    await broadcaster.close()
+
+
+@pytest.mark.asyncio
+async def test_job_channel_fans_out_to_every_subscriber():
+    """Test that several websockets can watch the same job without evicting each other."""
+    hub = ChannelHub()
+    first, second, other_job = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    hub.subscribe("job-1", first)
+    hub.subscribe("job-1", second)
+    hub.subscribe("job-2", other_job)
+    assert hub.publish("job-1", {"job_id": "job-1", "status": "in progress"}) == 2
+    await wait_until(lambda: first.frames and second.frames)
+    assert not other_job.frames
+    await hub.close()
+
+
+@pytest.mark.asyncio
+async def test_late_subscriber_gets_replay_and_close():
+    """Test that a subscriber connecting after the job finished still gets its final events, then a close."""
+    hub = ChannelHub(replay_size=3, linger=0.2)
+    for status in ("queued", "in progress", "uploading to gcs", "completed"):
+        hub.publish("job-1", {"job_id": "job-1", "status": status})
+    hub.finish("job-1")
+
+    late = FakeWebSocket()
+    hub.subscribe("job-1", late)
+    await wait_until(lambda: len(late.frames) == 4)
+    assert [json.loads(frame["text"])["status"] for frame in late.frames[:3]] == \
+        ["in progress", "uploading to gcs", "completed"]
+    assert late.frames[3] is CLOSE_FRAME
+
+    await wait_until(lambda: "job-1" not in hub.channels)
+    assert hub.stats()["subscribers"] == 0
+
+
+@pytest.mark.asyncio
+async def test_finish_closes_connected_subscribers():
+    """Test that finishing a job delivers pending events and then closes its websockets."""
+    hub = ChannelHub(linger=30)
+    ws = FakeWebSocket()
+    hub.subscribe("job-1", ws)
+    hub.publish("job-1", {"job_id": "job-1", "status": "completed"})
+    hub.finish("job-1")
+    await wait_until(lambda: len(ws.frames) == 2)
+    assert ws.frames[-1] is CLOSE_FRAME
+    hub.unsubscribe("job-1", ws)
+    assert hub.stats() == {"channels": 1, "finished_channels": 1, "subscribers": 0}
+    await hub.close()
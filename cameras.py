@@ -0,0 +1,144 @@
+"""
+Camera registry: which streams the collector captures and how.
+
+Each camera has an id, its stream URL, where it is (for sun times), its
+timezone, how long a clip is, how it is encoded, the lowest quality it may be
+captured at under load and where its clips go in the bucket. The registry is
+read from CAMERAS_FILE, a JSON list of camera objects with the Camera fields
+below; without one the collector knows only the default camera it is given.
+
+Clips are stored as <gcs_prefix>/YYYY/MM/<id>-<local time>.mp4, with the month
+and time in the camera's timezone. gcs_prefix defaults to the camera id; the
+original Seacliff camera uses an empty prefix so its clips keep the bucket's
+YYYY/MM/seacliff-<time>.mp4 layout.
+"""
+from dataclasses import asdict, dataclass, replace
+from datetime import datetime
+from typing import Iterator, Optional
+from zoneinfo import ZoneInfo
+import json
+import logging
+import os
+import re
+import urllib.parse
+
+from quality import LEVEL_NAMES
+
+CAMERAS_FILE = os.getenv("CAMERAS_FILE", "cameras.json")
+# The camera /collection/start and unregistered stream URLs use
+DEFAULT_CAMERA_ID = os.getenv("DEFAULT_CAMERA_ID", "seacliff")
+DEFAULT_CAPTURE_SECONDS = 15
+# Stream of the built-in camera, used when there is no CAMERAS_FILE
+DEFAULT_YOUTUBE_URL = os.getenv("DEFAULT_YOUTUBE_URL", "https://www.youtube.com/watch?v=hXtYKDio1rQ")
+# copy: remux the source as-is, transcode: always re-encode, auto: copy when the source codecs allow it
+ENCODE_MODES = ("copy", "transcode", "auto")
+
+
+def normalize_youtube_url(youtube_url: str) -> str:
+    """
+    Reduce the various YouTube URL spellings of one stream to a single key.
+    """
+    parsed = urllib.parse.urlsplit(youtube_url.strip())
+    host = parsed.netloc.lower().removeprefix("www.").removeprefix("m.")
+    video_id = None
+    if host == "youtu.be":
+        video_id = parsed.path.strip("/")
+    elif host.endswith("youtube.com"):
+        if parsed.path == "/watch":
+            video_id = urllib.parse.parse_qs(parsed.query).get("v", [None])[0]
+        elif parsed.path.startswith(("/live/", "/shorts/", "/embed/")):
+            video_id = parsed.path.split("/")[2]
+    if video_id:
+        return f"https://www.youtube.com/watch?v={video_id}"
+    return urllib.parse.urlunsplit((parsed.scheme.lower(), host, parsed.path.rstrip("/"), parsed.query, ""))
+
+
+@dataclass(frozen=True)
+class Camera:
+    id: str
+    url: str
+    name: str = ""
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    timezone: str = "America/Los_Angeles"
+    capture_seconds: int = DEFAULT_CAPTURE_SECONDS
+    encode_mode: Optional[str] = None  # None follows ENCODE_MODE
+    preset: Optional[str] = None  # libx264 -preset when transcoding
+    crf: Optional[int] = None  # libx264 -crf when transcoding
+    gcs_prefix: Optional[str] = None  # None stores clips under the camera id
+    min_quality: Optional[str] = None  # lowest adaptive quality level, e.g. "480p"; None allows any
+
+    def __post_init__(self):
+        if not re.fullmatch(r"[a-z0-9][a-z0-9_-]*", self.id):
+            raise ValueError(f"Camera id {self.id!r} must be lowercase letters, digits, '-' or '_'")
+        if self.encode_mode is not None and self.encode_mode not in ENCODE_MODES:
+            raise ValueError(f"Camera {self.id}: encode_mode must be one of {ENCODE_MODES}, got {self.encode_mode!r}")
+        if self.min_quality is not None and self.min_quality not in LEVEL_NAMES:
+            raise ValueError(f"Camera {self.id}: min_quality must be one of {LEVEL_NAMES}, got {self.min_quality!r}")
+        if self.capture_seconds <= 0:
+            raise ValueError(f"Camera {self.id}: capture_seconds must be positive")
+        ZoneInfo(self.timezone)  # raises for an unknown timezone
+
+    @property
+    def tz(self):
+        return ZoneInfo(self.timezone)
+
+    @property
+    def prefix(self):
+        prefix = self.id if self.gcs_prefix is None else self.gcs_prefix.strip("/")
+        return f"{prefix}/" if prefix else ""
+
+    def clip_name(self, when: datetime) -> str:
+        """File name of a clip captured at when: <id>-<camera local time>.mp4."""
+        return f"{self.id}-{when.astimezone(self.tz).strftime('%Y-%m-%dT%H:%M-%S%z')}.mp4"
+
+    def blob_name(self, when: datetime) -> str:
+        """Where a clip captured at when is stored: <prefix>/YYYY/MM/<clip name>."""
+        return f"{self.prefix}{when.astimezone(self.tz).strftime('%Y/%m')}/{self.clip_name(when)}"
+
+    def to_dict(self):
+        return asdict(self)
+
+
+DEFAULT_CAMERA = Camera(id="seacliff", url=DEFAULT_YOUTUBE_URL, name="Seacliff", latitude=36.9741,
+                        longitude=-121.9158, timezone="America/Los_Angeles", gcs_prefix="")
+
+
+class CameraRegistry:
+    def __init__(self, cameras: list[Camera], default_id: str = DEFAULT_CAMERA_ID):
+        if not cameras:
+            raise ValueError("The camera registry needs at least one camera")
+        self.cameras: dict[str, Camera] = {}
+        for camera in cameras:
+            if camera.id in self.cameras:
+                raise ValueError(f"Duplicate camera id {camera.id!r}")
+            self.cameras[camera.id] = camera
+        self.default = self.cameras.get(default_id, cameras[0])
+        self._by_url = {normalize_youtube_url(camera.url): camera for camera in cameras}
+
+    @classmethod
+    def load(cls, path: str, default: Camera, default_id: str = DEFAULT_CAMERA_ID):
+        """Registry from a JSON list of cameras at path, or just default when there is no such file."""
+        if not os.path.exists(path):
+            logging.info(f"No camera registry at {path}, collecting from {default.id} only.")
+            return cls([default], default.id)
+        with open(path) as f:
+            cameras = [Camera(**entry) for entry in json.load(f)]
+        logging.info(f"Loaded {len(cameras)} camera(s) from {path}.")
+        return cls(cameras, default_id)
+
+    def get(self, camera_id: str) -> Optional[Camera]:
+        return self.cameras.get(camera_id)
+
+    def for_url(self, url: str) -> Camera:
+        """The registered camera streaming url, or the default camera's settings pointed at it."""
+        camera = self._by_url.get(normalize_youtube_url(url))
+        if camera:
+            return camera
+        return replace(self.default, url=url)
+
+    def __iter__(self) -> Iterator[Camera]:
+        return iter(self.cameras.values())
+
+    def __len__(self):
+        return len(self.cameras)
@@ -0,0 +1,66 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from cameras import Camera, CameraRegistry, normalize_youtube_url
+
+SEACLIFF = Camera(id="seacliff", url="https://www.youtube.com/watch?v=hXtYKDio1rQ", timezone="America/Los_Angeles",
+                  gcs_prefix="")
+
+
+def test_clip_names_and_prefixes():
+    """Test that clips are named and stored in the camera's timezone and under its prefix."""
+    when = datetime(2025, 1, 1, 1, 30, 5, tzinfo=timezone.utc)
+    assert SEACLIFF.blob_name(when) == "2024/12/seacliff-2024-12-31T17:30-05-0800.mp4"
+    pier = Camera(id="pier", url="https://youtu.be/abc", timezone="Europe/Lisbon")
+    assert pier.clip_name(when) == "pier-2025-01-01T01:30-05+0000.mp4"
+    assert pier.blob_name(when) == "pier/2025/01/pier-2025-01-01T01:30-05+0000.mp4"
+    nested = Camera(id="pier", url="https://youtu.be/abc", timezone="UTC", gcs_prefix="/portugal/pier/")
+    assert nested.blob_name(when) == "portugal/pier/2025/01/pier-2025-01-01T01:30-05+0000.mp4"
+
+
+def test_camera_validation():
+    """Test that bad ids, encode modes, durations, quality floors and timezones are rejected."""
+    with pytest.raises(ValueError):
+        Camera(id="Sea Cliff", url="https://youtu.be/abc")
+    with pytest.raises(ValueError):
+        Camera(id="pier", url="https://youtu.be/abc", encode_mode="fast")
+    with pytest.raises(ValueError):
+        Camera(id="pier", url="https://youtu.be/abc", capture_seconds=0)
+    with pytest.raises(ValueError):
+        Camera(id="pier", url="https://youtu.be/abc", min_quality="4k")
+    with pytest.raises(Exception):
+        Camera(id="pier", url="https://youtu.be/abc", timezone="Mars/Olympus_Mons")
+
+
+def test_registry_loads_file_and_matches_urls(tmp_path):
+    """Test loading cameras from JSON and finding a camera by any spelling of its stream URL."""
+    path = tmp_path / "cameras.json"
+    path.write_text(json.dumps([
+        {"id": "seacliff", "url": "https://www.youtube.com/watch?v=hXtYKDio1rQ", "gcs_prefix": ""},
+        {"id": "pier", "url": "https://www.youtube.com/live/abc", "capture_seconds": 30, "encode_mode": "copy"},
+    ]))
+    registry = CameraRegistry.load(str(path), default=SEACLIFF)
+    assert len(registry) == 2
+    assert registry.default.id == "seacliff"
+    assert registry.for_url("https://youtu.be/abc").id == "pier"
+    assert registry.get("pier").capture_seconds == 30
+
+    unregistered = registry.for_url("https://www.youtube.com/watch?v=other")
+    assert unregistered.id == "seacliff"
+    assert unregistered.url == "https://www.youtube.com/watch?v=other"
+
+
+def test_registry_without_file_and_duplicates(tmp_path):
+    """Test that a missing registry file means just the default camera, and ids must be unique."""
+    registry = CameraRegistry.load(str(tmp_path / "missing.json"), default=SEACLIFF)
+    assert [camera.id for camera in registry] == ["seacliff"]
+    with pytest.raises(ValueError, match="Duplicate"):
+        CameraRegistry([SEACLIFF, SEACLIFF])
+
+
+def test_normalize_youtube_url():
+    """Test that the spellings of one stream share a key."""
+    assert normalize_youtube_url("https://m.youtube.com/live/abc?feature=share") == \
+        normalize_youtube_url("https://youtu.be/abc")
@@ -0,0 +1,233 @@
+"""
+Catalog of the clips in the bucket.
+
+Consumers used to find the latest clip, or the clips of a day, by listing the
+bucket's YYYY/MM/ prefixes, which gets slower every month. Instead every clip
+the collector uploads is recorded here as it is uploaded: blob name, camera,
+capture time, duration, size, CRC32C checksum and poster. Clips live in a
+SQLite table (WAL mode) indexed by capture time, and the newest clip of each
+camera is also kept in memory, so "latest" lookups don't touch the database
+and time range queries are an index range scan.
+
+A clip is written in its own small transaction when it is uploaded; clips
+arrive seconds apart at most, so unlike the job history there is nothing to
+batch.
+
+Clips uploaded before the catalog existed are added once with
+
+    python catalog.py backfill [--prefix PREFIX]
+
+which lists the bucket and parses the clip names <prefix>YYYY/MM/<camera>-<time>.mp4.
+"""
+from datetime import datetime
+from typing import Iterable, Optional
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from history import decode_cursor, encode_cursor
+
+CATALOG_PATH = os.getenv("CATALOG_PATH", "clip_catalog.sqlite3")
+CATALOG_MAX_PAGE_SIZE = 1000
+BACKFILL_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    blob_name TEXT PRIMARY KEY,
+    camera TEXT NOT NULL,
+    captured_at REAL NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS clips_captured ON clips (captured_at, blob_name);
+CREATE INDEX IF NOT EXISTS clips_camera_captured ON clips (camera, captured_at, blob_name);
+"""
+
+# <prefix>YYYY/MM/<camera id>-<camera local time>.mp4, as Camera.blob_name writes them
+CLIP_BLOB_NAME = re.compile(
+    r"(?:.*/)?\d{4}/\d{2}/(?P<camera>[a-z0-9][a-z0-9_-]*?)-(?P<time>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}-\d{2}[+-]\d{4})\.mp4")
+POSTER_EXTENSIONS = ("jpg", "webp")
+
+
+def clip_entry(blob_name: str, camera_id: str, captured_at: datetime, duration: Optional[float] = None,
+               size: Optional[int] = None, crc32c: Optional[str] = None, poster_blob: Optional[str] = None,
+               suspect: Optional[str] = None) -> dict:
+    """A catalog entry. suspect is the frozen/duplicate verdict of a flagged clip."""
+    entry = {
+        "blob_name": blob_name,
+        "camera": camera_id,
+        "captured_at": captured_at.isoformat(),
+        "duration_seconds": duration,
+        "size_bytes": size,
+        "crc32c": crc32c,
+        "poster_blob": poster_blob,
+    }
+    if suspect:
+        entry["suspect"] = suspect
+    return entry
+
+
+def parse_clip_blob_name(blob_name: str) -> Optional[tuple[str, datetime]]:
+    """The camera id and capture time of a clip stored at blob_name, or None if it isn't a clip."""
+    match = CLIP_BLOB_NAME.fullmatch(blob_name)
+    if not match:
+        return None
+    return match.group("camera"), datetime.strptime(match.group("time"), "%Y-%m-%dT%H:%M-%S%z")
+
+
+class ClipCatalog:
+    def __init__(self, path: str = CATALOG_PATH):
+        self.path = path
+        self.added = 0
+        self._latest: Optional[dict[str, tuple[float, dict]]] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        # latest() reads the newest clips on the event loop while add_many() updates them in a thread
+        self._latest_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    @property
+    def loaded(self):
+        """Whether the newest clip of each camera is in memory, so latest() won't touch the database."""
+        return self._latest is not None
+
+    def _load_latest(self):
+        with self._db_lock:
+            # SQLite returns the bare column from the row holding the MAX
+            rows = self._connection().execute(
+                "SELECT camera, MAX(captured_at), info FROM clips GROUP BY camera").fetchall()
+        with self._latest_lock:
+            if self._latest is None:
+                self._latest = {camera: (captured_at, json.loads(info)) for camera, captured_at, info in rows}
+
+    def add_many(self, entries: Iterable[dict]) -> int:
+        """Add or replace clips in one transaction. Returns how many. Blocking; call it from a thread."""
+        if self._latest is None:
+            self._load_latest()
+        entries = list(entries)
+        captured = [datetime.fromisoformat(entry["captured_at"]).timestamp() for entry in entries]
+        rows = [(entry["blob_name"], entry["camera"], captured_at, json.dumps(entry))
+                for entry, captured_at in zip(entries, captured)]
+        with self._db_lock:
+            db = self._connection()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?)", rows)
+        with self._latest_lock:
+            for entry, captured_at in zip(entries, captured):
+                if captured_at >= self._latest.get(entry["camera"], (float("-inf"),))[0]:
+                    self._latest[entry["camera"]] = (captured_at, entry)
+        self.added += len(rows)
+        return len(rows)
+
+    def add(self, entry: dict):
+        """Add an uploaded clip. Blocking; call it from a thread."""
+        self.add_many([entry])
+
+    def latest(self, camera_id: Optional[str] = None) -> Optional[dict]:
+        """
+        The newest clip of camera_id, or of any camera. From memory once loaded; the first call reads
+        the newest clip of each camera from the database.
+        """
+        if self._latest is None:
+            self._load_latest()
+        with self._latest_lock:
+            if camera_id is not None:
+                latest = self._latest.get(camera_id)
+            else:
+                latest = max(self._latest.values(), key=lambda item: item[0], default=None)
+        return latest[1] if latest else None
+
+    def query(self, camera_id: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 100, cursor: Optional[str] = None) -> dict:
+        """
+        A page of clips in capture order, optionally of one camera and captured since <= t < until.
+        Pass the returned next_cursor to get the following page. Blocking; call it from a thread.
+        """
+        limit = max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+        clauses, params = [], []
+        if camera_id:
+            clauses.append("camera = ?")
+            params.append(camera_id)
+        if since is not None:
+            clauses.append("captured_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("captured_at < ?")
+            params.append(until)
+        if cursor:
+            captured_at, blob_name = decode_cursor(cursor)
+            clauses.append("(captured_at, blob_name) > (?, ?)")
+            params += [captured_at, blob_name]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._db_lock:
+            rows = self._connection().execute(
+                f"SELECT captured_at, blob_name, info FROM clips {where} "
+                f"ORDER BY captured_at, blob_name LIMIT ?", (*params, limit + 1)).fetchall()
+        clips = [json.loads(info) for _, _, info in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return {"clips": clips, "next_cursor": next_cursor}
+
+    def backfill(self, blobs: Iterable, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+        """
+        Add the clips among blobs, a bucket listing, with their size and checksum and the poster
+        stored beside them. Listings are in name order, so a clip's poster is listed right before
+        (.jpg) or right after (.webp) it. Returns the number of clips added. Blocking.
+        """
+        added, batch, poster = 0, [], None
+        for blob in blobs:
+            stem, extension = os.path.splitext(blob.name)
+            if extension[1:] in POSTER_EXTENSIONS:
+                if batch and batch[-1]["blob_name"] == f"{stem}.mp4":
+                    batch[-1]["poster_blob"] = blob.name
+                else:
+                    poster = blob.name
+                continue
+            parsed = parse_clip_blob_name(blob.name)
+            if not parsed:
+                continue
+            if len(batch) >= batch_size:
+                added += self.add_many(batch)
+                batch = []
+            camera_id, captured_at = parsed
+            poster_blob = poster if poster and os.path.splitext(poster)[0] == stem else None
+            batch.append(clip_entry(blob.name, camera_id, captured_at, size=blob.size, crc32c=blob.crc32c,
+                                    poster_blob=poster_blob))
+        if batch:
+            added += self.add_many(batch)
+        return added
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        return {"cameras": len(self._latest) if self._latest is not None else None, "added": self.added}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill = subcommands.add_parser("backfill", help="Add the clips already in the bucket to the catalog")
+    backfill.add_argument("--prefix", default="", help="Only list blobs under this prefix")
+    args = parser.parse_args()
+
+    from app import clip_catalog, gcs_uploader
+
+    logging.info(f"Listing gs://{gcs_uploader.bucket_name}/{args.prefix}...")
+    count = clip_catalog.backfill(gcs_uploader.client.list_blobs(gcs_uploader.bucket_name, prefix=args.prefix))
+    clip_catalog.close()
+    logging.info(f"Added {count} clip(s) to {clip_catalog.path}.")
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import threading
+
+import pytest
+
+from catalog import ClipCatalog, clip_entry, parse_clip_blob_name
+from cameras import Camera
+
+PIER = Camera(id="pier-2", url="https://example.com/pier", timezone="UTC")
+START = datetime(2025, 1, 31, 23, 59, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = ClipCatalog(str(tmp_path / "catalog.sqlite3"))
+    yield catalog
+    catalog.close()
+
+
+def pier_clip(minutes: int) -> dict:
+    when = START + timedelta(minutes=minutes)
+    return clip_entry(PIER.blob_name(when), PIER.id, when, 15, 1000, "AAAAAA==")
+
+
+def test_parse_clip_blob_name():
+    """Test that clip names give their camera and capture time, and other blobs are ignored."""
+    when = datetime(2025, 1, 31, 16, 59, 5, tzinfo=timezone(timedelta(hours=-8)))
+    assert parse_clip_blob_name("2025/01/seacliff-2025-01-31T16:59-05-0800.mp4") == ("seacliff", when)
+    assert parse_clip_blob_name(PIER.blob_name(START)) == ("pier-2", START)
+    assert parse_clip_blob_name("2025/01/seacliff-2025-01-31T16:59-05-0800.jpg") is None
+    assert parse_clip_blob_name("tmp/composite/abc/0") is None
+
+
+def test_latest_from_memory_and_after_reopen(catalog):
+    """Test that the newest clip per camera is tracked as clips are added and reloaded from disk."""
+    catalog.add(pier_clip(2))
+    catalog.add(pier_clip(1))
+    seacliff = clip_entry("2025/01/seacliff-x.mp4", "seacliff", START, 15)
+    catalog.add(seacliff)
+    assert catalog.latest("pier-2") == pier_clip(2)
+    assert catalog.latest() == pier_clip(2)
+    assert catalog.latest("nowhere") is None
+
+    reopened = ClipCatalog(catalog.path)
+    assert not reopened.loaded
+    assert reopened.latest("seacliff") == seacliff
+    assert reopened.latest() == pier_clip(2)
+    reopened.close()
+
+
+def test_query_range_in_pages(catalog):
+    """Test that a time range comes back in capture order, page by page."""
+    catalog.add_many(pier_clip(minutes) for minutes in range(10))
+    since, until = (START + timedelta(minutes=2)).timestamp(), (START + timedelta(minutes=7)).timestamp()
+    first = catalog.query("pier-2", since, until, limit=3)
+    second = catalog.query("pier-2", since, until, limit=3, cursor=first["next_cursor"])
+    assert first["clips"] + second["clips"] == [pier_clip(minutes) for minutes in range(2, 7)]
+    assert second["next_cursor"] is None
+    assert catalog.query("seacliff")["clips"] == []
+
+
+def test_backfill_from_listing(catalog):
+    """Test that a bucket listing adds its clips with size, checksum and poster, in batches."""
+    names = sorted([PIER.blob_name(START + timedelta(minutes=n)) for n in range(5)]
+                   + [PIER.blob_name(START)[:-4] + ".jpg", PIER.blob_name(START)[:-4] + "-sprite.jpg",
+                      PIER.blob_name(START + timedelta(minutes=1))[:-4] + ".webp", "pier-2/latest.jpg"])
+    blobs = [SimpleNamespace(name=name, size=100, crc32c="AAAAAA==") for name in names]
+    assert catalog.backfill(blobs, batch_size=2) == 5
+    clips = catalog.query()["clips"]
+    assert [clip["poster_blob"] for clip in clips[:3]] == [
+        PIER.blob_name(START)[:-4] + ".jpg", PIER.blob_name(START + timedelta(minutes=1))[:-4] + ".webp", None]
+    assert clips[0]["size_bytes"] == 100
+    assert catalog.latest("pier-2")["blob_name"] == PIER.blob_name(START + timedelta(minutes=4))
+
+
+def test_latest_while_clips_are_added_in_a_thread(catalog):
+    """Test that latest() over all cameras can run while another thread adds clips of new cameras."""
+    catalog.add(pier_clip(0))
+    errors = []
+
+    def add_cameras():
+        try:
+            for batch in range(100):
+                catalog.add_many(clip_entry(f"2025/01/cam{batch}-{n}-x.mp4", f"cam{batch}-{n}", START, 15)
+                                 for n in range(50))
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=add_cameras)
+    writer.start()
+    while writer.is_alive():
+        catalog.latest()
+    writer.join()
+    assert errors == []
+    assert catalog.stats()["cameras"] == 5001
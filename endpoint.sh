@@ -1,15 +1,11 @@
 #!/bin/bash
-# make sure the times in crontab and at jobs are in Pacific time, not UTC
+# log timestamps in Pacific time, not UTC; sunrise/sunset captures are scheduled by the API itself
 export TZ="America/Los_Angeles"
 
-# run atd and cron in the background, tail the log output for the workload
-touch /var/log/cron
+# tail the log output for the workload
 touch /var/log/camera-collector
 
-/usr/sbin/atd
 /etc/init.d/inetutils-syslogd start
-/app/sun.py
-/usr/sbin/cron
 
 # pass the service account auth details to upload cached results
 ENV GOOGLE_APPLICATION_CREDENTIALS=/app/service-account-key.json
@@ -0,0 +1,223 @@
+"""
+Minimal in-memory stand-in for the GCS JSON/upload API, for tests and local benchmarks.
+
+Point a client at it with STORAGE_EMULATOR_HOST=<server.url>, or pass
+client_options={"api_endpoint": server.url} with anonymous credentials.
+Supports resumable and multipart uploads, compose, object metadata, media
+download and prefix listing — enough for what the collector does with
+google-cloud-storage. fail_next() makes the next requests fail, to exercise
+retry paths.
+"""
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import base64
+import hashlib
+import itertools
+import json
+import re
+import threading
+import urllib.parse
+
+import google_crc32c
+
+
+class FakeGcsServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.objects: dict[tuple[str, str], bytes] = {}
+        self.metadata: dict[tuple[str, str], dict] = {}
+        self.uploads: dict[str, dict] = {}
+        self.requests: list[tuple[str, str]] = []
+        self.failures: list[int] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def fail_next(self, count: int = 1, status: int = 503):
+        """Answer the next count requests with an error status."""
+        with self._lock:
+            self.failures += [status] * count
+
+    def _store(self, bucket: str, name: str, data: bytes, content_type: str = None, cache_control: str = None):
+        now = datetime.now(timezone.utc).isoformat()
+        metadata = {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}",
+            "bucket": bucket,
+            "name": name,
+            "size": str(len(data)),
+            "contentType": content_type or "application/octet-stream",
+            "md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode(),
+            "crc32c": base64.b64encode(google_crc32c.value(data).to_bytes(4, "big")).decode(),
+            "generation": str(next(self._ids)),
+            "timeCreated": now,
+            "updated": now,
+            "mediaLink": f"{self.url}/download/storage/v1/b/{bucket}/o/{urllib.parse.quote(name, safe='')}?alt=media",
+        }
+        if cache_control:
+            metadata["cacheControl"] = cache_control
+        with self._lock:
+            self.objects[(bucket, name)] = data
+            self.metadata[(bucket, name)] = metadata
+        return metadata
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body=None, headers=None):
+                payload = json.dumps(body).encode() if isinstance(body, (dict, list)) else (body or b"")
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if isinstance(body, (dict, list)):
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _route(self):
+                parsed = urllib.parse.urlsplit(self.path)
+                server.requests.append((self.command, parsed.path))
+                with server._lock:
+                    status = server.failures.pop(0) if server.failures else None
+                if status:
+                    self._body()
+                    self._reply(status, {"error": {"code": status, "message": "Injected failure"}})
+                    return None, None
+                return parsed.path, dict(urllib.parse.parse_qsl(parsed.query))
+
+            def do_POST(self):
+                path, query = self._route()
+                if path is None:
+                    return
+                compose = re.fullmatch(r"/storage/v1/b/([^/]+)/o/(.+)/compose", path)
+                if compose:
+                    bucket, name = compose.group(1), urllib.parse.unquote(compose.group(2))
+                    request = json.loads(self._body())
+                    with server._lock:
+                        sources = [server.objects.get((bucket, source["name"])) for source in request["sourceObjects"]]
+                    if None in sources:
+                        return self._reply(404, {"error": {"code": 404, "message": "Source object not found"}})
+                    return self._reply(200, server._store(bucket, name, b"".join(sources),
+                                                          request.get("destination", {}).get("contentType")))
+                match = re.fullmatch(r"/upload/storage/v1/b/([^/]+)/o", path)
+                if not match:
+                    return self._reply(404, {"error": {"code": 404, "message": "Not Found"}})
+                bucket = match.group(1)
+                body = self._body()
+                if query.get("uploadType") == "resumable":
+                    metadata = json.loads(body or b"{}")
+                    upload_id = str(next(server._ids))
+                    server.uploads[upload_id] = {
+                        "bucket": bucket,
+                        "name": query.get("name") or metadata.get("name"),
+                        "content_type": self.headers.get("X-Upload-Content-Type") or metadata.get("contentType"),
+                        "cache_control": metadata.get("cacheControl"),
+                        "data": bytearray(),
+                    }
+                    location = f"{server.url}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={upload_id}"
+                    return self._reply(200, headers={"Location": location})
+                if query.get("uploadType") == "multipart":
+                    message = BytesParser(policy=HTTP).parsebytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+                    metadata_part, media_part = list(message.iter_parts())[:2]
+                    metadata = json.loads(metadata_part.get_payload(decode=True))
+                    name = query.get("name") or metadata.get("name")
+                    return self._reply(200, server._store(bucket, name, media_part.get_payload(decode=True),
+                                                          media_part.get_content_type(), metadata.get("cacheControl")))
+                return self._reply(400, {"error": {"code": 400, "message": "Unsupported uploadType"}})
+
+            def do_PUT(self):
+                path, query = self._route()
+                if path is None:
+                    return
+                upload = server.uploads.get(query.get("upload_id", ""))
+                if upload is None:
+                    return self._reply(404, {"error": {"code": 404, "message": "No such upload"}})
+                data = self._body()
+                start, end, total = re.fullmatch(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)",
+                                                 self.headers.get("Content-Range", "bytes */*")).groups()
+                if start is not None:
+                    del upload["data"][int(start):]
+                    upload["data"] += data
+                if total != "*" and len(upload["data"]) == int(total):
+                    del server.uploads[query["upload_id"]]
+                    return self._reply(200, server._store(upload["bucket"], upload["name"], bytes(upload["data"]),
+                                                          upload["content_type"], upload["cache_control"]))
+                headers = {"Range": f"bytes=0-{len(upload['data']) - 1}"} if upload["data"] else {}
+                return self._reply(308, headers=headers)
+
+            def do_DELETE(self):
+                path, query = self._route()
+                if path is None:
+                    return
+                if server.uploads.pop(query.get("upload_id", ""), None) is not None:
+                    return self._reply(499)
+                match = re.fullmatch(r"/storage/v1/b/([^/]+)/o/(.+)", path)
+                key = (match.group(1), urllib.parse.unquote(match.group(2))) if match else None
+                with server._lock:
+                    if key in server.objects:
+                        del server.objects[key]
+                        del server.metadata[key]
+                        return self._reply(204)
+                return self._reply(404, {"error": {"code": 404, "message": "Not Found"}})
+
+            def do_GET(self):
+                path, query = self._route()
+                if path is None:
+                    return
+                match = re.fullmatch(r"/(?:download/)?storage/v1/b/([^/]+)/o(?:/(.+))?", path)
+                if not match:
+                    return self._reply(404, {"error": {"code": 404, "message": "Not Found"}})
+                bucket, name = match.group(1), match.group(2)
+                if name is None:
+                    prefix = query.get("prefix", "")
+                    items = [m for (b, n), m in sorted(server.metadata.items()) if b == bucket and n.startswith(prefix)]
+                    return self._reply(200, {"kind": "storage#objects", "items": items})
+                key = (bucket, urllib.parse.unquote(name))
+                if key not in server.objects:
+                    return self._reply(404, {"error": {"code": 404, "message": "No such object"}})
+                if query.get("alt") == "media":
+                    return self._reply(200, server.objects[key],
+                                       headers={"Content-Type": server.metadata[key]["contentType"]})
+                return self._reply(200, server.metadata[key])
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import time
+
+    with FakeGcsServer(port=4443) as fake:
+        print(f"Fake GCS listening on {fake.url}; export STORAGE_EMULATOR_HOST={fake.url}")
+        while True:
+            time.sleep(3600)
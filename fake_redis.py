@@ -0,0 +1,223 @@
+"""
+Minimal in-memory stand-in for a Redis server, for tests and local multi-replica runs.
+
+Speaks RESP2 over TCP and implements the commands the redis state backend
+uses: GET/SET (NX, XX, EX, PX)/DEL, PUBLISH/SUBSCRIBE/UNSUBSCRIBE, and
+EVAL/EVALSHA/SCRIPT LOAD for the lease scripts in backend.py, which are run
+natively since there is no Lua interpreter. Point the collector at it with
+STATE_BACKEND=redis REDIS_URL=<server.url>.
+"""
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import hashlib
+import threading
+import time
+
+from backend import ACQUIRE_LEASE_SCRIPT, RELEASE_LEASE_SCRIPT
+
+
+class ReplyError(Exception):
+    pass
+
+
+class FakeRedisServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.values: dict[bytes, tuple[bytes, float]] = {}
+        self.subscribers: dict[bytes, set] = {}
+        self.commands: list[bytes] = []
+        self.scripts = {
+            hashlib.sha1(ACQUIRE_LEASE_SCRIPT.encode()).hexdigest(): self._acquire_lease,
+            hashlib.sha1(RELEASE_LEASE_SCRIPT.encode()).hexdigest(): self._release_lease,
+        }
+        self._lock = threading.Lock()
+        ThreadingTCPServer.allow_reuse_address = True
+        self._server = ThreadingTCPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _get(self, key: bytes):
+        entry = self.values.get(key)
+        if entry and entry[1] and entry[1] <= time.time():
+            del self.values[key]
+            return None
+        return entry[0] if entry else None
+
+    def _set(self, key: bytes, value: bytes, options: list[bytes]):
+        expires_at = 0.0
+        nx = xx = False
+        options = [option.upper() for option in options]
+        n = 0
+        while n < len(options):
+            if options[n] == b"NX":
+                nx = True
+            elif options[n] == b"XX":
+                xx = True
+            elif options[n] in (b"PX", b"EX"):
+                scale = 1000 if options[n] == b"PX" else 1
+                if int(options[n + 1]) <= 0:
+                    raise ReplyError("ERR invalid expire time in 'set' command")
+                expires_at = time.time() + int(options[n + 1]) / scale
+                n += 1
+            n += 1
+        exists = self._get(key) is not None
+        if (nx and exists) or (xx and not exists):
+            return None
+        self.values[key] = (value, expires_at)
+        return b"OK"
+
+    def _acquire_lease(self, keys, args):
+        if self._set(keys[0], args[0], [b"NX", b"PX", args[1]]):
+            return args[0]
+        return self._get(keys[0])
+
+    def _release_lease(self, keys, args):
+        if self._get(keys[0]) == args[0]:
+            del self.values[keys[0]]
+            return 1
+        return 0
+
+    def _eval(self, sha: str, args: list[bytes]):
+        script = self.scripts.get(sha)
+        if script is None:
+            raise ReplyError("NOSCRIPT No matching script.")
+        numkeys = int(args[0])
+        return script(args[1:1 + numkeys], args[1 + numkeys:])
+
+    def execute(self, command: list[bytes], connection):
+        name = command[0].upper()
+        args = command[1:]
+        self.commands.append(name)
+        with self._lock:
+            if name == b"PING":
+                return b"PONG"
+            if name in (b"CLIENT", b"SELECT"):
+                return b"OK"
+            if name == b"GET":
+                return self._get(args[0])
+            if name == b"SET":
+                return self._set(args[0], args[1], args[2:])
+            if name == b"DEL":
+                return sum(1 for key in args if self.values.pop(key, None) is not None)
+            if name == b"SCRIPT" and args[0].upper() == b"LOAD":
+                sha = hashlib.sha1(args[1]).hexdigest()
+                if sha not in self.scripts:
+                    raise ReplyError("ERR Only the collector's lease scripts are supported.")
+                return sha.encode()
+            if name == b"EVALSHA":
+                return self._eval(args[0].decode(), args[1:])
+            if name == b"EVAL":
+                return self._eval(hashlib.sha1(args[0]).hexdigest(), args[1:])
+            if name == b"PUBLISH":
+                receivers = list(self.subscribers.get(args[0], ()))
+            elif name in (b"SUBSCRIBE", b"UNSUBSCRIBE"):
+                replies = []
+                for channel in args:
+                    subscribed = self.subscribers.setdefault(channel, set())
+                    if name == b"SUBSCRIBE":
+                        subscribed.add(connection)
+                        connection.channels.add(channel)
+                    else:
+                        subscribed.discard(connection)
+                        connection.channels.discard(channel)
+                    replies.append([name.lower(), channel, len(connection.channels)])
+                return ("push", replies)
+            else:
+                raise ReplyError(f"ERR unknown command '{name.decode()}'")
+        for receiver in receivers:
+            receiver.push([b"message", args[0], args[1]])
+        return len(receivers)
+
+    def _handler(self):
+        server = self
+
+        class Handler(StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                self.channels = set()
+                self.write_lock = threading.Lock()
+
+            def _read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                if not line.startswith(b"*"):
+                    return line.split()
+                command = []
+                for _ in range(int(line[1:])):
+                    size = int(self.rfile.readline()[1:])
+                    command.append(self.rfile.read(size + 2)[:-2])
+                return command
+
+            def _encode(self, value):
+                if value is None:
+                    return b"$-1\r\n"
+                if isinstance(value, ReplyError):
+                    return f"-{value}\r\n".encode()
+                if isinstance(value, int):
+                    return f":{value}\r\n".encode()
+                if isinstance(value, list):
+                    return f"*{len(value)}\r\n".encode() + b"".join(self._encode(item) for item in value)
+                if isinstance(value, str):
+                    value = value.encode()
+                return b"$%d\r\n%s\r\n" % (len(value), value)
+
+            def push(self, value):
+                with self.write_lock:
+                    try:
+                        self.wfile.write(self._encode(value))
+                    except OSError:
+                        pass
+
+            def handle(self):
+                while (command := self._read_command()) is not None:
+                    if not command:
+                        continue
+                    try:
+                        reply = server.execute(command, self)
+                    except ReplyError as e:
+                        reply = e
+                    if isinstance(reply, tuple) and reply[0] == "push":
+                        for item in reply[1]:
+                            self.push(item)
+                    elif reply == b"OK" or reply == b"PONG":
+                        self.push_simple(reply)
+                    else:
+                        self.push(reply)
+
+            def push_simple(self, value: bytes):
+                with self.write_lock:
+                    self.wfile.write(b"+" + value + b"\r\n")
+
+            def finish(self):
+                with server._lock:
+                    for channel in self.channels:
+                        server.subscribers.get(channel, set()).discard(self)
+                super().finish()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    with FakeRedisServer(port=6379) as fake:
+        print(f"Fake Redis listening on {fake.url}; export STATE_BACKEND=redis REDIS_URL={fake.url}")
+        while True:
+            time.sleep(3600)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the yt-dlp command line, for benchmarks and local runs without YouTube.
+
+Answers the two invocations the collector makes with a local video file in
+place of the live stream: --dump-single-json prints a format whose url is
+FAKE_YT_DLP_SOURCE, and -o - copies that file to stdout. The codecs reported
+decide whether ENCODE_MODE=auto remuxes or transcodes, like real stream
+metadata does. Put it on PATH as yt-dlp, e.g. with a shell wrapper:
+
+    exec python fake_yt_dlp.py "$@"
+"""
+import json
+import os
+import shutil
+import sys
+import time
+
+FAKE_YT_DLP_SOURCE = os.getenv("FAKE_YT_DLP_SOURCE", "testsrc.mp4")
+# Added to every call, to stand in for yt-dlp's extraction time
+FAKE_YT_DLP_DELAY_SECONDS = float(os.getenv("FAKE_YT_DLP_DELAY_SECONDS", "0"))
+FAKE_YT_DLP_VCODEC = os.getenv("FAKE_YT_DLP_VCODEC", "avc1.4D401F")
+FAKE_YT_DLP_ACODEC = os.getenv("FAKE_YT_DLP_ACODEC", "mp4a.40.2")
+# Comma-separated substrings; URLs containing one fail as if the video were unavailable
+FAKE_YT_DLP_FAIL = [s for s in os.getenv("FAKE_YT_DLP_FAIL", "").split(",") if s]
+
+
+def main(argv):
+    time.sleep(FAKE_YT_DLP_DELAY_SECONDS)
+    url = argv[-1] if argv else ""
+    if any(s in url for s in FAKE_YT_DLP_FAIL):
+        print(f"ERROR: [youtube] {url}: Video unavailable", file=sys.stderr)
+        return 1
+    if "--dump-single-json" in argv:
+        print(json.dumps({
+            "id": url.rsplit("=", 1)[-1],
+            "format_id": "fake",
+            "url": os.path.abspath(FAKE_YT_DLP_SOURCE),
+            "vcodec": FAKE_YT_DLP_VCODEC,
+            "acodec": FAKE_YT_DLP_ACODEC,
+            "http_headers": {},
+        }))
+        return 0
+    if "-o" in argv and argv[argv.index("-o") + 1] == "-":
+        with open(FAKE_YT_DLP_SOURCE, "rb") as source:
+            try:
+                shutil.copyfileobj(source, sys.stdout.buffer)
+            except BrokenPipeError:
+                # FFmpeg stops reading once it has its capture window
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    print(f"fake yt-dlp: unsupported arguments {argv}", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
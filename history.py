@@ -0,0 +1,238 @@
+"""
+Durable log of finished collection jobs.
+
+Finished jobs go into an in-memory LRU of recent jobs and a pending batch that
+a background task writes to SQLite (WAL mode) in one transaction every
+HISTORY_FLUSH_SECONDS, or sooner once HISTORY_BATCH_SIZE jobs are waiting.
+A batch whose write fails goes back to the front of the pending batch for the
+next attempt; while writes keep failing, at most HISTORY_MAX_PENDING jobs are
+kept, dropping the oldest. Jobs older than HISTORY_RETENTION_DAYS are pruned. Status lookups hit the
+LRU first; history queries page through the database newest-first with a
+keyset cursor, so deep pages cost the same as the first one.
+"""
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import base64
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+JOB_HISTORY_PATH = os.getenv("JOB_HISTORY_PATH", "job_history.sqlite3")
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "100"))
+# Jobs kept waiting for the database while writes fail; the oldest are dropped beyond this
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "10000"))
+HISTORY_FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "2"))
+HISTORY_HOT_SIZE = int(os.getenv("HISTORY_HOT_SIZE", "1000"))
+HISTORY_RETENTION_DAYS = float(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+HISTORY_PRUNE_INTERVAL_SECONDS = float(os.getenv("HISTORY_PRUNE_INTERVAL_SECONDS", "3600"))
+HISTORY_MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_history (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    youtube_url TEXT,
+    finished_at REAL NOT NULL,
+    info TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_history_finished ON job_history (finished_at, job_id);
+CREATE INDEX IF NOT EXISTS job_history_status_finished ON job_history (status, finished_at, job_id);
+"""
+
+
+def encode_cursor(finished_at: float, job_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([finished_at, job_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    try:
+        finished_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(finished_at), str(job_id)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+
+class JobHistory:
+    def __init__(self, path: str = JOB_HISTORY_PATH, batch_size: int = HISTORY_BATCH_SIZE,
+                 flush_interval: float = HISTORY_FLUSH_SECONDS, hot_size: int = HISTORY_HOT_SIZE,
+                 retention_seconds: float = HISTORY_RETENTION_DAYS * 86400, max_pending: int = HISTORY_MAX_PENDING):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.hot_size = hot_size
+        self.retention_seconds = retention_seconds
+        self.max_pending = max_pending
+        self.hot: OrderedDict[str, dict] = OrderedDict()
+        self.pending: list[tuple] = []
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def record(self, job_id: str, job_info: dict, finished_at: Optional[float] = None):
+        """Keep a finished job in the hot tier and queue it for the next batched write."""
+        finished_at = finished_at or time.time()
+        entry = {**job_info, "job_id": job_id, "finished_at": finished_at}
+        self.hot[job_id] = entry
+        self.hot.move_to_end(job_id)
+        while len(self.hot) > self.hot_size:
+            self.hot.popitem(last=False)
+        self.pending.append((job_id, entry.get("status"), entry.get("youtube_url"), finished_at,
+                             json.dumps(entry, default=str)))
+        if len(self.pending) >= self.batch_size and self._flush_requested:
+            self._flush_requested.set()
+
+    def _write(self, rows: list[tuple]):
+        with self._db_lock:
+            db = self._connection()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO job_history VALUES (?, ?, ?, ?, ?)", rows)
+
+    def flush(self):
+        """
+        Write pending jobs in one transaction. Blocking; the background task runs it in a thread. If
+        the write fails the jobs are put back ahead of any recorded meanwhile and the error is raised.
+        """
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        try:
+            self._write(rows)
+        except Exception:
+            # In place, so jobs appended by record() on the event loop meanwhile are kept
+            self.pending[:0] = rows
+            excess = len(self.pending) - self.max_pending
+            if excess > 0:
+                del self.pending[:excess]
+                self.dropped += excess
+                logging.warning(f"Job history dropped {excess} job(s) waiting for the database.")
+            raise
+        self.written += len(rows)
+
+    def _prune_db(self, cutoff: float) -> int:
+        with self._db_lock:
+            db = self._connection()
+            with db:
+                removed = db.execute("DELETE FROM job_history WHERE finished_at < ?", (cutoff,)).rowcount
+        self.pruned += removed
+        return removed
+
+    def _prune_hot(self, cutoff: float):
+        for job_id in [job_id for job_id, entry in self.hot.items() if entry["finished_at"] < cutoff]:
+            del self.hot[job_id]
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete jobs older than the retention period. Returns the number removed from the database."""
+        cutoff = (now or time.time()) - self.retention_seconds
+        self._prune_hot(cutoff)
+        return self._prune_db(cutoff)
+
+    async def _run(self):
+        last_prune = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+                if time.monotonic() - last_prune >= HISTORY_PRUNE_INTERVAL_SECONDS:
+                    cutoff = time.time() - self.retention_seconds
+                    self._prune_hot(cutoff)
+                    removed = await asyncio.to_thread(self._prune_db, cutoff)
+                    last_prune = time.monotonic()
+                    if removed:
+                        logging.info(f"Pruned {removed} job(s) from history.")
+            except Exception as e:
+                logging.error(f"Job history write failed: {e}")
+
+    def start(self):
+        if not self._task:
+            self._flush_requested = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get_recent(self, job_id: str) -> Optional[dict]:
+        """A recently finished job from the in-memory tier, without touching the database."""
+        entry = self.hot.get(job_id)
+        if entry is not None:
+            self.hot.move_to_end(job_id)
+        return entry
+
+    def lookup(self, job_id: str) -> Optional[dict]:
+        """A finished job from the database. Blocking; call it from a thread."""
+        if self._db is None and not os.path.exists(self.path):
+            return None
+        with self._db_lock:
+            row = self._connection().execute("SELECT info FROM job_history WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def query(self, status: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """
+        A page of finished jobs, newest first, optionally filtered by status and finish time range.
+        Pass the returned next_cursor to get the following page. Blocking; call it from a thread.
+        Pending jobs are written first; if that fails they stay pending and the page is served from
+        the jobs already written.
+        """
+        try:
+            self.flush()
+        except Exception as e:
+            logging.warning(f"Job history write failed, querying the jobs already written: {e}")
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if since is not None:
+            clauses.append("finished_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("finished_at < ?")
+            params.append(until)
+        if cursor:
+            finished_at, job_id = decode_cursor(cursor)
+            clauses.append("(finished_at, job_id) < (?, ?)")
+            params += [finished_at, job_id]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._db_lock:
+            rows = self._connection().execute(
+                f"SELECT finished_at, job_id, info FROM job_history {where} "
+                f"ORDER BY finished_at DESC, job_id DESC LIMIT ?", (*params, limit + 1)).fetchall()
+        jobs = [json.loads(info) for _, _, info in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return {"jobs": jobs, "next_cursor": next_cursor}
+
+    def stats(self):
+        return {"hot": len(self.hot), "pending": len(self.pending), "written": self.written, "dropped": self.dropped,
+                "pruned": self.pruned}
@@ -0,0 +1,134 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from history import JobHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = JobHistory(str(tmp_path / "history.sqlite3"), batch_size=3, flush_interval=30, hot_size=2,
+                         retention_seconds=3600)
+    yield history
+    history.close()
+
+
+def test_writes_are_batched_in_wal_mode(history):
+    """Test that recorded jobs stay pending until flushed, then land in a WAL-mode database."""
+    history.record("job-1", {"status": "completed"}, finished_at=1000)
+    history.record("job-2", {"status": "error"}, finished_at=1001)
+    assert history.stats()["pending"] == 2
+    history.flush()
+    assert history.stats() == {"hot": 2, "pending": 0, "written": 2, "dropped": 0, "pruned": 0}
+
+    db = sqlite3.connect(history.path)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("SELECT count(*) FROM job_history").fetchone()[0] == 2
+    db.close()
+
+
+def test_hot_tier_keeps_most_recent(history):
+    """Test that the in-memory tier is an LRU and older jobs are still found in the database."""
+    for n in range(3):
+        history.record(f"job-{n}", {"status": "completed"}, finished_at=1000 + n)
+    assert history.get_recent("job-0") is None
+    assert history.get_recent("job-2")["status"] == "completed"
+    history.flush()
+    assert history.lookup("job-0")["finished_at"] == 1000
+    assert history.lookup("missing") is None
+
+
+def test_query_pages_and_filters(history):
+    """Test newest-first keyset pagination with status and time range filters."""
+    for n in range(10):
+        history.record(f"job-{n}", {"status": "error" if n % 3 == 0 else "completed"}, finished_at=1000 + n)
+
+    first = history.query(limit=4)
+    assert [job["job_id"] for job in first["jobs"]] == ["job-9", "job-8", "job-7", "job-6"]
+    second = history.query(limit=4, cursor=first["next_cursor"])
+    assert [job["job_id"] for job in second["jobs"]] == ["job-5", "job-4", "job-3", "job-2"]
+    last = history.query(limit=4, cursor=second["next_cursor"])
+    assert [job["job_id"] for job in last["jobs"]] == ["job-1", "job-0"]
+    assert last["next_cursor"] is None
+
+    errors = history.query(status="error")
+    assert [job["job_id"] for job in errors["jobs"]] == ["job-9", "job-6", "job-3", "job-0"]
+    window = history.query(since=1002, until=1005)
+    assert [job["job_id"] for job in window["jobs"]] == ["job-4", "job-3", "job-2"]
+
+    with pytest.raises(ValueError):
+        history.query(cursor="not-a-cursor")
+
+
+def test_retention_prunes_old_jobs(history):
+    """Test that jobs past the retention period are removed from memory and the database."""
+    history.record("old", {"status": "completed"}, finished_at=1000)
+    history.record("new", {"status": "completed"}, finished_at=5000)
+    history.flush()
+    assert history.prune(now=5000) == 1
+    assert history.get_recent("old") is None
+    assert history.lookup("old") is None
+    assert history.lookup("new") is not None
+
+
+def test_failed_write_keeps_jobs_for_the_next_flush(tmp_path):
+    """Test that a batch whose write fails is retried ahead of newer jobs, keeping at most max_pending."""
+    history = JobHistory(str(tmp_path / "history.sqlite3"), max_pending=3)
+    write = history._write
+    calls, failures = [], [sqlite3.OperationalError("database is locked")]
+
+    def flaky_write(rows):
+        calls.append([row[0] for row in rows])
+        if failures:
+            raise failures.pop()
+        write(rows)
+
+    history._write = flaky_write
+    history.record("job-0", {"status": "completed"}, finished_at=1000)
+    history.record("job-1", {"status": "completed"}, finished_at=1001)
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+    history.record("job-2", {"status": "completed"}, finished_at=1002)
+    assert [row[0] for row in history.pending] == ["job-0", "job-1", "job-2"]
+
+    failures.append(sqlite3.OperationalError("disk I/O error"))
+    history.record("job-3", {"status": "completed"}, finished_at=1003)
+    with pytest.raises(sqlite3.OperationalError):
+        history.flush()
+    assert [row[0] for row in history.pending] == ["job-1", "job-2", "job-3"]
+    assert history.dropped == 1
+
+    history.flush()
+    assert calls[-1] == ["job-1", "job-2", "job-3"]
+    assert history.stats() == {"hot": 4, "pending": 0, "written": 3, "dropped": 1, "pruned": 0}
+    assert history.lookup("job-1") is not None
+    history.close()
+
+
+def test_query_served_from_written_jobs_when_write_fails(history):
+    """Test that a query whose flush fails returns the jobs already written and keeps the rest pending."""
+    history.record("job-0", {"status": "completed"}, finished_at=1000)
+    history.flush()
+    history.record("job-1", {"status": "completed"}, finished_at=1001)
+
+    def locked(rows):
+        raise sqlite3.OperationalError("database is locked")
+
+    write, history._write = history._write, locked
+    assert [job["job_id"] for job in history.query()["jobs"]] == ["job-0"]
+    assert [row[0] for row in history.pending] == ["job-1"]
+    history._write = write
+    assert [job["job_id"] for job in history.query()["jobs"]] == ["job-1", "job-0"]
+
+
+@pytest.mark.asyncio
+async def test_background_flush_when_batch_is_full(history):
+    """Test that reaching the batch size triggers a write without waiting for the flush interval."""
+    history.start()
+    for n in range(3):
+        history.record(f"job-{n}", {"status": "completed"})
+    async with asyncio.timeout(5):
+        while history.written < 3:
+            await asyncio.sleep(0.01)
+    await history.stop()
@@ -0,0 +1,203 @@
+"""
+In-memory registry of collection jobs.
+
+Records are slotted objects with a typed state and timestamps, indexed by
+state and by URL. Every change bumps the store's version; readers get a
+snapshot cached for that version, so /active-collections and status lookups
+never wait on a lock, and a status read is a single dict lookup. Writers run on
+the event loop and never await while mutating, which is what makes the
+lock-free reads safe. Subscribers are notified after the mutation, not inside it.
+"""
+from datetime import datetime
+from enum import Enum
+from typing import Awaitable, Callable, Optional
+import json
+import time
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    IN_PROGRESS = "in progress"
+    UPLOADING = "uploading to gcs"
+    COMPLETED = "completed"
+    CANCELLED = "cancelled"
+    ERROR = "error"
+
+
+TERMINAL_STATES = frozenset({JobState.COMPLETED, JobState.CANCELLED, JobState.ERROR})
+
+
+class JobRecord:
+    __slots__ = ("job_id", "state", "youtube_url", "progress", "start_time", "created_at", "updated_at", "fields",
+                 "_view")
+
+    def __init__(self, job_id: str, state: JobState, youtube_url: Optional[str], start_time: Optional[str],
+                 fields: Optional[dict]):
+        self.job_id = job_id
+        self.state = state
+        self.youtube_url = youtube_url
+        self.progress: Optional[int] = None
+        self.created_at = self.updated_at = time.time()
+        self.start_time = start_time or datetime.fromtimestamp(self.created_at).isoformat()
+        self.fields = fields or None
+        self._view: Optional[dict] = None
+
+    def changed(self):
+        self.updated_at = time.time()
+        self._view = None
+
+    def view(self) -> dict:
+        """The record as the JSON-ready dict the API returns, rebuilt only after the record changes."""
+        if self._view is None:
+            view = {"status": self.state.value, "start_time": self.start_time,
+                    "updated_time": datetime.fromtimestamp(self.updated_at).isoformat()}
+            if self.youtube_url is not None:
+                view["youtube_url"] = self.youtube_url
+            if self.progress is not None:
+                view["progress"] = self.progress
+            if self.fields:
+                view.update(self.fields)
+            self._view = view
+        return self._view
+
+
+class JobStore:
+    def __init__(self, notify: Optional[Callable[[str, str], Awaitable[None]]] = None,
+                 on_delete: Optional[Callable[[str], None]] = None):
+        self._notify = notify
+        self._on_delete = on_delete
+        self._records: dict[str, JobRecord] = {}
+        self._by_state: dict[JobState, set[str]] = {state: set() for state in JobState}
+        self._by_url: dict[str, set[str]] = {}
+        self.version = 0
+        self._snapshot: dict = {}
+        self._snapshot_version = 0
+        self._dirty: set[str] = set()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, job_id: str):
+        return job_id in self._records
+
+    def _touch(self, record: JobRecord):
+        record.changed()
+        self._dirty.add(record.job_id)
+        self.version += 1
+
+    def _set_state(self, record: JobRecord, state: JobState):
+        if record.state is not state:
+            self._by_state[record.state].discard(record.job_id)
+            self._by_state[state].add(record.job_id)
+            record.state = state
+
+    def _unindex(self, record: JobRecord):
+        self._by_state[record.state].discard(record.job_id)
+        if record.youtube_url is not None:
+            ids = self._by_url.get(record.youtube_url)
+            if ids is not None:
+                ids.discard(record.job_id)
+                if not ids:
+                    del self._by_url[record.youtube_url]
+
+    async def _publish(self, job_id: str, message: dict):
+        if self._notify:
+            await self._notify(job_id, json.dumps(message))
+
+    async def set_job(self, job_id: str, job_info: dict):
+        """Create or replace a job from a dict with at least a status."""
+        fields = dict(job_info)
+        state = JobState(fields.pop("status"))
+        youtube_url = fields.pop("youtube_url", None)
+        old = self._records.get(job_id)
+        if old:
+            self._unindex(old)
+        record = JobRecord(job_id, state, youtube_url, fields.pop("start_time", None), fields)
+        self._records[job_id] = record
+        self._by_state[state].add(job_id)
+        if youtube_url is not None:
+            self._by_url.setdefault(youtube_url, set()).add(job_id)
+        self._dirty.add(job_id)
+        self.version += 1
+        await self._publish(job_id, {"job_id": job_id, "job_info": job_info})
+
+    async def set_status(self, job_id: str, status: str, progress: Optional[int] = None):
+        """Set the status of a job, with the percentage captured so far while it is in progress."""
+        state = status if isinstance(status, JobState) else JobState(status)
+        record = self._records.get(job_id)
+        if record:
+            self._set_state(record, state)
+            if progress is not None:
+                record.progress = progress
+            self._touch(record)
+        message = {"job_id": job_id, "status": state.value}
+        if progress is not None:
+            message["progress"] = progress
+        await self._publish(job_id, message)
+
+    async def update_job(self, job_id: str, **fields):
+        """Merge extra fields (e.g. the uploaded blob name) into a job and notify its subscribers."""
+        record = self._records.get(job_id)
+        if record:
+            if record.fields is None:
+                record.fields = {}
+            record.fields.update(fields)
+            self._touch(record)
+        await self._publish(job_id, {"job_id": job_id, **fields})
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        record = self._records.get(job_id)
+        return dict(record.view()) if record else None
+
+    def get_record(self, job_id: str) -> Optional[JobRecord]:
+        return self._records.get(job_id)
+
+    async def delete_job(self, job_id: str):
+        record = self._records.pop(job_id, None)
+        if record:
+            self._unindex(record)
+            self._dirty.add(job_id)
+            self.version += 1
+        if self._on_delete:
+            self._on_delete(job_id)
+
+    def snapshot(self) -> dict:
+        """
+        {job_id: job dict} for the current version. After a change the previous snapshot is copied
+        (a C-level dict copy) and only the changed jobs are patched in, so older snapshots that
+        readers still hold are never modified. Shared between readers, so treat it as read-only.
+        """
+        if self._snapshot_version != self.version:
+            snapshot = dict(self._snapshot)
+            for job_id in self._dirty:
+                record = self._records.get(job_id)
+                if record:
+                    snapshot[job_id] = record.view()
+                else:
+                    snapshot.pop(job_id, None)
+            self._dirty.clear()
+            self._snapshot = snapshot
+            self._snapshot_version = self.version
+        return self._snapshot
+
+    async def get_all_jobs(self) -> dict:
+        return self.snapshot()
+
+    def ids_in_state(self, state: JobState) -> frozenset:
+        return frozenset(self._by_state[state])
+
+    def ids_for_url(self, youtube_url: str) -> frozenset:
+        return frozenset(self._by_url.get(youtube_url, ()))
+
+    def counts(self) -> dict:
+        return {state.value: len(ids) for state, ids in self._by_state.items() if ids}
+
+    def clear(self):
+        self._records.clear()
+        self._dirty.clear()
+        self._snapshot = {}
+        self._by_url.clear()
+        for ids in self._by_state.values():
+            ids.clear()
+        self.version += 1
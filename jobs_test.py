@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from jobs import JobState, JobStore
+
+
+class Recorder:
+    def __init__(self):
+        self.messages = []
+        self.deleted = []
+
+    async def notify(self, job_id: str, message: str):
+        self.messages.append((job_id, json.loads(message)))
+
+    def on_delete(self, job_id: str):
+        self.deleted.append(job_id)
+
+
+@pytest.fixture
+def recorder():
+    return Recorder()
+
+
+@pytest.fixture
+def store(recorder):
+    return JobStore(notify=recorder.notify, on_delete=recorder.on_delete)
+
+
+@pytest.mark.asyncio
+async def test_lifecycle_updates_record_and_notifies(store, recorder):
+    """Test that transitions update the record, its indexes and notify subscribers."""
+    url = "https://www.youtube.com/watch?v=example"
+    await store.set_job("job-1", {"status": "queued", "youtube_url": url})
+    await store.set_status("job-1", JobState.IN_PROGRESS, progress=40)
+    await store.update_job("job-1", blob_name="2024/06/clip.mp4")
+
+    job = await store.get_job("job-1")
+    assert job["status"] == "in progress"
+    assert job["progress"] == 40
+    assert job["blob_name"] == "2024/06/clip.mp4"
+    assert job["youtube_url"] == url
+    assert "start_time" in job and "updated_time" in job
+    assert store.ids_in_state(JobState.IN_PROGRESS) == {"job-1"}
+    assert store.ids_in_state(JobState.QUEUED) == frozenset()
+    assert store.ids_for_url(url) == {"job-1"}
+    assert [message for _, message in recorder.messages][1:] == [
+        {"job_id": "job-1", "status": "in progress", "progress": 40},
+        {"job_id": "job-1", "blob_name": "2024/06/clip.mp4"},
+    ]
+
+    await store.delete_job("job-1")
+    assert await store.get_job("job-1") is None
+    assert store.ids_for_url(url) == frozenset()
+    assert store.counts() == {}
+    assert recorder.deleted == ["job-1"]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_versioned(store):
+    """Test that snapshots are reused until something changes, and only changed records are rebuilt."""
+    await store.set_job("job-1", {"status": "queued"})
+    await store.set_job("job-2", {"status": "queued"})
+    first = store.snapshot()
+    assert store.snapshot() is first
+
+    await store.set_status("job-2", "in progress", progress=10)
+    second = store.snapshot()
+    assert second is not first
+    assert second["job-1"] is first["job-1"]
+    assert first["job-2"]["status"] == "queued"
+    assert second["job-2"]["status"] == "in progress"
+
+
+@pytest.mark.asyncio
+async def test_get_job_returns_a_copy(store):
+    """Test that callers can't change a stored job through the dict they get back."""
+    await store.set_job("job-1", {"status": "queued"})
+    (await store.get_job("job-1"))["status"] = "tampered"
+    assert (await store.get_job("job-1"))["status"] == "queued"
+
+
+@pytest.mark.asyncio
+async def test_unknown_status_rejected(store):
+    """Test that only known job states are accepted."""
+    await store.set_job("job-1", {"status": "queued"})
+    with pytest.raises(ValueError):
+        await store.set_status("job-1", "finished-ish")
@@ -0,0 +1,169 @@
+"""
+Structured, non-blocking logging for the API and its scripts.
+
+Log calls used to format and write each record on the thread that logged,
+which for the API is the event loop, so a slow pipe to the container runtime
+stalled every job and websocket for as long as the write took (and sun.py
+opened and appended its log file for every line). setup_logging() gives the
+root logger a handler that only puts the record on a bounded queue; a
+QueueListener thread formats and writes it. When the writer is LOG_QUEUE_SIZE
+records behind, new records are dropped and counted rather than blocking the
+caller.
+
+Records are JSON lines (LOG_FORMAT=text for the old "time - message" lines)
+with the time, level, logger and message, the job_id and camera of the job
+being run, set by log_context() around it and inherited by its tasks and the
+threads asyncio.to_thread starts, and any fields passed with extra=, such as
+stage and duration.
+
+A LogSampler thins out logs too frequent to keep whole, like the websocket
+sends of job progress: one in every N is logged, with how many were skipped.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+
+# json or text
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Log one in this many websocket sends of job updates
+WEBSOCKET_LOG_SAMPLE_EVERY = int(os.getenv("WEBSOCKET_LOG_SAMPLE_EVERY", "100"))
+TEXT_FORMAT = "%(asctime)s - %(message)s"
+
+# Attributes every LogRecord has; anything else on a record came from extra= or the log context
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+current_log_context: ContextVar[dict] = ContextVar("log_context", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Add fields, e.g. job_id and camera, to every record logged in the block and in tasks it starts."""
+    token = current_log_context.set({**current_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        current_log_context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the log context onto records; runs in the logging thread, where the context is set."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in current_log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Queues records for the writer thread, dropping them when it is too far behind."""
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+        self.addFilter(ContextFilter())
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve what can't wait for the writer thread: the arguments and traceback may change
+        # or go away once the caller moves on. Formatting into JSON or text happens on the writer.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogSampler:
+    """Lets one in every `every` calls through, for logs too frequent to keep whole."""
+    def __init__(self, every: int = WEBSOCKET_LOG_SAMPLE_EVERY):
+        self.every = max(1, every)
+        self.skipped = 0
+
+    def sample(self) -> Optional[int]:
+        """How many calls were skipped since the last one logged if this one should be, otherwise None."""
+        if self.skipped + 1 < self.every:
+            self.skipped += 1
+            return None
+        skipped, self.skipped = self.skipped, 0
+        return skipped
+
+
+queue_handler: Optional[NonBlockingQueueHandler] = None
+listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT, filename: Optional[str] = None,
+                  stream: Optional[TextIO] = None) -> NonBlockingQueueHandler:
+    """
+    Log through a queue to a writer thread that writes to stream (stderr by default) and, with
+    filename, appends to that file. Calling it again replaces the earlier setup.
+    """
+    global queue_handler, listener
+    if log_format not in ("json", "text"):
+        raise ValueError(f"LOG_FORMAT must be json or text, got {log_format!r}")
+    stop_logging()
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(stream)]
+    if filename:
+        handlers.append(logging.FileHandler(filename))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return queue_handler
+
+
+@atexit.register
+def stop_logging():
+    """Write out the queued records, stop the writer thread and close its files."""
+    global queue_handler, listener
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        listener = None
+    if queue_handler:
+        logging.getLogger().removeHandler(queue_handler)
+        queue_handler = None
+
+
+def stats():
+    return {"queued": queue_handler.queue.qsize() if queue_handler else 0,
+            "dropped": queue_handler.dropped if queue_handler else 0}
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import logging
+import queue
+
+from logs import JsonFormatter, LogSampler, NonBlockingQueueHandler, log_context, setup_logging, stop_logging
+
+
+def capture_logger(name: str, size: int = 100):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = NonBlockingQueueHandler(queue.Queue(size))
+    logger.handlers = [handler]
+    return logger, handler
+
+
+def test_records_carry_context_and_extra_fields():
+    """Test that JSON records get the log context of the task that logged and the extra= fields."""
+    logger, handler = capture_logger("logs_test.context")
+
+    async def job():
+        await asyncio.to_thread(logger.info, "uploaded %s", "a.mp4", extra={"stage": "upload", "duration": 1.5})
+
+    async def run():
+        with log_context(job_id="job-1", camera="pier"):
+            task = asyncio.create_task(job())
+        logger.info("outside")
+        await task
+
+    asyncio.run(run())
+    formatter = JsonFormatter()
+    outside, uploaded = (json.loads(formatter.format(handler.queue.get_nowait())) for _ in range(2))
+    assert "job_id" not in outside
+    assert uploaded["message"] == "uploaded a.mp4"
+    assert (uploaded["job_id"], uploaded["camera"], uploaded["stage"], uploaded["duration"]) == (
+        "job-1", "pier", "upload", 1.5)
+    assert uploaded["level"] == "INFO"
+
+
+def test_full_queue_drops_instead_of_blocking():
+    """Test that records beyond the queue's capacity are counted as dropped, with tracebacks kept as text."""
+    logger, handler = capture_logger("logs_test.full", size=2)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    for n in range(3):
+        logger.info(f"line {n}")
+    assert handler.dropped == 2
+    record = json.loads(JsonFormatter().format(handler.queue.get_nowait()))
+    assert "ValueError: boom" in record["exception"]
+
+
+def test_sampler_lets_one_in_every_n_through():
+    """Test that one call in every N is logged, reporting how many were skipped before it."""
+    sampler = LogSampler(every=3)
+    assert [sampler.sample() for _ in range(7)] == [None, None, 2, None, None, 2, None]
+    assert [LogSampler(every=1).sample() for _ in range(2)] == [0, 0]
+
+
+def test_writer_thread_appends_to_file(tmp_path):
+    """Test that setup_logging writes text or JSON lines to its file from the writer thread."""
+    path = tmp_path / "collector.log"
+    try:
+        setup_logging(log_format="text", filename=str(path))
+        logging.info("sunset capture at 17:04")
+        stop_logging()
+        assert path.read_text().strip().endswith(" - sunset capture at 17:04")
+        setup_logging(filename=str(path))
+        logging.warning("second line", extra={"camera": "pier"})
+        stop_logging()
+        record = json.loads(path.read_text().splitlines()[-1])
+        assert (record["message"], record["level"], record["camera"]) == ("second line", "WARNING", "pier")
+    finally:
+        setup_logging()
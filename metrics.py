@@ -0,0 +1,105 @@
+"""
+Prometheus metrics for the collector, served on /metrics.
+
+Stage latencies are recorded from the per-job stats the capture and upload
+already produce, failures are counted by the stage they happened in, and the
+yt-dlp/FFmpeg/ffprobe children are sampled from /proc whenever the endpoint
+is scraped.
+"""
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+import os
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+RESOLVE_SECONDS = Histogram("collector_resolve_seconds", "yt-dlp stream resolution time.", buckets=STAGE_BUCKETS)
+FIRST_FRAME_SECONDS = Histogram("collector_time_to_first_frame_seconds",
+                                "Time from capture start to FFmpeg's first frame.", buckets=STAGE_BUCKETS)
+ENCODE_SECONDS = Histogram("collector_encode_seconds", "FFmpeg wall-clock time per capture.", ["mode"],
+                           buckets=STAGE_BUCKETS)
+ENCODE_CPU_SECONDS = Histogram("collector_encode_cpu_seconds", "FFmpeg CPU time per capture.", ["mode"],
+                               buckets=STAGE_BUCKETS)
+UPLOAD_SECONDS = Histogram("collector_upload_seconds", "GCS upload time per clip.", ["mode"], buckets=STAGE_BUCKETS)
+UPLOAD_BYTES = Counter("collector_upload_bytes", "Bytes uploaded to GCS.")
+JOB_SECONDS = Histogram("collector_job_seconds", "Total time per collection job.", buckets=STAGE_BUCKETS)
+QUEUE_WAIT_SECONDS = Histogram("collector_queue_wait_seconds", "Time jobs wait for a worker.", buckets=STAGE_BUCKETS)
+BROADCAST_SECONDS = Histogram("collector_websocket_broadcast_seconds",
+                              "Time to queue one websocket message for every subscriber.", ["channel"],
+                              buckets=FAST_BUCKETS)
+JOBS = Counter("collector_jobs", "Finished collection jobs by final status.", ["status"])
+FAILURES = Counter("collector_failures", "Failures by pipeline stage, including ones recovered by a fallback.",
+                   ["stage"])
+SUSPECT_CLIPS = Counter("collector_suspect_clips", "Frozen or duplicate clips, by verdict and whether they were "
+                        "uploaded flagged or skipped.", ["verdict", "action"])
+CAPTURE_QUALITY = Counter("collector_capture_quality", "Captures by adaptive quality level.", ["level"])
+BANDWIDTH_ESTIMATE_KBPS = Gauge("collector_bandwidth_estimate_kbps",
+                                "Download bandwidth the quality policy allows for; 0 until a capture falls behind.")
+SPOOL_BYTES = Gauge("collector_spool_bytes", "Bytes of clips waiting in the upload spool.")
+SPOOL_EVICTIONS = Counter("collector_spool_evictions", "Clips dropped from the upload spool before they could be "
+                          "uploaded, by whether they were too old or the spool was full.", ["reason"])
+LOG_RECORDS_DROPPED = Gauge("collector_log_records_dropped",
+                            "Log records dropped since startup because the log writer thread fell behind.")
+QUEUE_DEPTH = Gauge("collector_queue_depth", "Jobs waiting for a worker.")
+BUSY_WORKERS = Gauge("collector_busy_workers", "Workers running a job.")
+WARMUP_SECONDS = Gauge("collector_warmup_seconds", "Time from startup until the warmup finished.")
+WEBSOCKET_CLIENTS = Gauge("collector_websocket_clients", "Connected websocket clients.", ["channel"])
+
+
+class SubprocessCollector:
+    """
+    Count, resident memory and CPU time of the running children, sampled at scrape time.
+    """
+    def __init__(self, usage):
+        self.usage = usage
+        self.processes: dict[int, str] = {}
+
+    def add(self, process, cmd):
+        self.processes[process.pid] = os.path.basename(cmd[0])
+
+    def remove(self, process):
+        self.processes.pop(process.pid, None)
+
+    def collect(self):
+        count = GaugeMetricFamily("collector_subprocesses", "Running child processes.", labels=["name"])
+        rss = GaugeMetricFamily("collector_subprocess_rss_bytes", "Resident memory of running child processes.",
+                                labels=["name"])
+        cpu = GaugeMetricFamily("collector_subprocess_cpu_seconds", "CPU time used so far by running child processes.",
+                                labels=["name"])
+        totals: dict[str, list] = {}
+        for pid, name in list(self.processes.items()):
+            total = totals.setdefault(name, [0, 0, 0.0])
+            total[0] += 1
+            usage = self.usage(pid)
+            if usage:
+                total[1] += usage[1]
+                total[2] += usage[0]
+        for name, (processes, rss_bytes, cpu_seconds) in totals.items():
+            count.add_metric([name], processes)
+            rss.add_metric([name], rss_bytes)
+            cpu.add_metric([name], cpu_seconds)
+        return [count, rss, cpu]
+
+
+def observe_job_stats(stats: dict, upload_mode: str):
+    """Record the stage timings of a finished capture/upload from its job stats."""
+    if "resolve_seconds" in stats:
+        RESOLVE_SECONDS.observe(stats["resolve_seconds"])
+    if "first_frame_seconds" in stats:
+        FIRST_FRAME_SECONDS.observe(stats["first_frame_seconds"])
+    mode = stats.get("encode_mode", "unknown")
+    if "encode_seconds" in stats:
+        ENCODE_SECONDS.labels(mode).observe(stats["encode_seconds"])
+    if "encode_cpu_seconds" in stats:
+        ENCODE_CPU_SECONDS.labels(mode).observe(stats["encode_cpu_seconds"])
+    if "upload_seconds" in stats:
+        UPLOAD_SECONDS.labels(upload_mode).observe(stats["upload_seconds"])
+    if "upload_bytes" in stats:
+        UPLOAD_BYTES.inc(stats["upload_bytes"])
+    if "total_seconds" in stats:
+        JOB_SECONDS.observe(stats["total_seconds"])
+
+
+def render():
+    """The exposition-format body and content type for /metrics."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,165 @@
+"""
+Adaptive capture quality.
+
+Left to itself yt-dlp picks a live stream's best format (720p at about
+2.4 Mbit/s for Seacliff), and libx264 gets the camera's preset and CRF, however
+busy the node is. Around sunset every camera captures at once; when the node's
+download bandwidth or CPU can't keep up, captures run long and miss their
+window. So each capture gets a level from a quality ladder instead:
+
+- bandwidth: a capture that took longer than QUALITY_BEHIND_FACTOR times its
+  length, from first frame to end, couldn't download the stream in real time.
+  The node's bandwidth estimate then drops to what that capture and the ones
+  running beside it were getting. Each capture that kept up raises it by
+  QUALITY_PROBE_GROWTH, so quality climbs back once the pressure is gone.
+  Until a capture falls behind, bandwidth isn't limited. A level fits when its
+  bitrate, added to the running captures', is within QUALITY_BANDWIDTH_HEADROOM
+  of the estimate.
+- CPU, for captures that will transcode: what a level costs in cores is learnt
+  from the encode_cpu_seconds of transcodes at that level. A level fits when
+  its cost, added to the running transcodes', is within QUALITY_CPU_HEADROOM of
+  the CPUs the pod may use. A stream copy costs next to no CPU, so an auto
+  mode capture is only held to this once its stream is known not to copy.
+
+A capture gets the best level that fits, but never one below its camera's
+min_quality: a camera with a floor is captured at the floor even if it then
+runs late. The level caps the video height in the yt-dlp format selection and
+sets the libx264 preset and CRF where the camera doesn't set its own.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+import os
+
+QUALITY_ADAPTIVE = os.getenv("QUALITY_ADAPTIVE", "true").lower() in ("1", "true", "yes")
+QUALITY_BANDWIDTH_HEADROOM = float(os.getenv("QUALITY_BANDWIDTH_HEADROOM", "0.8"))
+QUALITY_CPU_HEADROOM = float(os.getenv("QUALITY_CPU_HEADROOM", "0.8"))
+# Growth of the bandwidth estimate after each capture that kept up with real time
+QUALITY_PROBE_GROWTH = float(os.getenv("QUALITY_PROBE_GROWTH", "1.1"))
+# A capture taking longer than this times its length fell behind the live stream
+QUALITY_BEHIND_FACTOR = float(os.getenv("QUALITY_BEHIND_FACTOR", "1.1"))
+# Weight of the newest transcode in each level's CPU cost
+QUALITY_CPU_SMOOTHING = 0.3
+
+
+@dataclass(frozen=True)
+class QualityLevel:
+    name: str
+    height: int
+    bitrate_kbps: float  # typical YouTube live video plus audio at this height
+    preset: str
+    crf: int
+    cpu_cores: float  # initial guess at the cores a real-time transcode takes
+
+    def format_selector(self, merged: bool = False) -> str:
+        """
+        yt-dlp -f selection of the best format no taller than this level, or the stream's smallest
+        when none is. merged prefers single-file formats, for downloads piped to stdout.
+        """
+        capped = f"[height<={self.height}]"
+        if merged:
+            return f"b{capped}/bv*{capped}+ba/w"
+        return f"bv*{capped}+ba/b{capped}/wv*+ba/w"
+
+
+# Best first
+LEVELS = (
+    QualityLevel("1080p", 1080, 4600, "veryfast", 23, 3.0),
+    QualityLevel("720p", 720, 2600, "veryfast", 23, 1.5),
+    QualityLevel("480p", 480, 1400, "superfast", 25, 0.7),
+    QualityLevel("360p", 360, 1100, "ultrafast", 27, 0.4),
+    QualityLevel("240p", 240, 650, "ultrafast", 29, 0.2),
+)
+LEVEL_NAMES = tuple(level.name for level in LEVELS)
+
+
+class QualityCapture:
+    """A running capture's level, and once its stream is resolved the bitrate it really has."""
+    def __init__(self, level: Optional[QualityLevel], transcode: bool):
+        self.level = level
+        self.transcode = transcode
+        self.stream_kbps: Optional[float] = None
+
+    @property
+    def kbps(self) -> float:
+        return self.stream_kbps or (self.level.bitrate_kbps if self.level else 0.0)
+
+
+class QualityPolicy:
+    def __init__(self, cpus: int, levels: tuple[QualityLevel, ...] = LEVELS, enabled: bool = QUALITY_ADAPTIVE,
+                 bandwidth_headroom: float = QUALITY_BANDWIDTH_HEADROOM, cpu_headroom: float = QUALITY_CPU_HEADROOM,
+                 probe_growth: float = QUALITY_PROBE_GROWTH, behind_factor: float = QUALITY_BEHIND_FACTOR):
+        self.cpus = cpus
+        self.levels = levels
+        self.enabled = enabled
+        self.bandwidth_headroom = bandwidth_headroom
+        self.cpu_headroom = cpu_headroom
+        self.probe_growth = probe_growth
+        self.behind_factor = behind_factor
+        self.bandwidth_kbps: Optional[float] = None
+        self.cpu_cores = {level.name: level.cpu_cores for level in levels}
+        self.running: list[QualityCapture] = []
+        self.chosen = {level.name: 0 for level in levels}
+        self.behind = 0
+
+    def level(self, name: str) -> QualityLevel:
+        for level in self.levels:
+            if level.name == name:
+                return level
+        raise ValueError(f"Unknown quality level {name!r}, expected one of {LEVEL_NAMES}")
+
+    def choose(self, floor: Optional[str] = None, transcode: bool = True) -> Optional[QualityLevel]:
+        """The best level that fits the bandwidth and CPU left beside the running captures, or None when off."""
+        if not self.enabled:
+            return None
+        lowest = self.levels.index(self.level(floor)) if floor else len(self.levels) - 1
+        kbps_in_use = sum(capture.kbps for capture in self.running)
+        cores_in_use = sum(self.cpu_cores[capture.level.name] for capture in self.running if capture.transcode)
+        for level in self.levels[:lowest]:
+            if (self.bandwidth_kbps is not None
+                    and kbps_in_use + level.bitrate_kbps > self.bandwidth_kbps * self.bandwidth_headroom):
+                continue
+            if transcode and cores_in_use + self.cpu_cores[level.name] > self.cpus * self.cpu_headroom:
+                continue
+            return level
+        return self.levels[lowest]
+
+    @contextmanager
+    def capture(self, floor: Optional[str] = None, transcode: bool = True) -> Iterator[QualityCapture]:
+        """Choose a capture's level and count it as running until the block exits."""
+        capture = QualityCapture(self.choose(floor, transcode), transcode)
+        if capture.level:
+            self.chosen[capture.level.name] += 1
+            self.running.append(capture)
+        try:
+            yield capture
+        finally:
+            if capture in self.running:
+                self.running.remove(capture)
+
+    def observe(self, capture: QualityCapture, media_seconds: float, ingest_seconds: float,
+                cpu_seconds: Optional[float] = None, transcoded: bool = False):
+        """Learn from a finished capture: whether it kept up with the stream, and what its transcode cost."""
+        if not capture.level or media_seconds <= 0 or ingest_seconds <= 0:
+            return
+        others = sum(other.kbps for other in self.running if other is not capture)
+        if ingest_seconds > media_seconds * self.behind_factor:
+            self.behind += 1
+            delivered = others + capture.kbps * media_seconds / ingest_seconds
+            self.bandwidth_kbps = min(self.bandwidth_kbps or delivered, delivered)
+        elif self.bandwidth_kbps is not None:
+            self.bandwidth_kbps = max(self.bandwidth_kbps * self.probe_growth, others + capture.kbps)
+        if transcoded and cpu_seconds:
+            cost = self.cpu_cores[capture.level.name]
+            self.cpu_cores[capture.level.name] = cost + QUALITY_CPU_SMOOTHING * (cpu_seconds / media_seconds - cost)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "bandwidth_kbps": round(self.bandwidth_kbps) if self.bandwidth_kbps is not None else None,
+            "cpus": self.cpus,
+            "cpu_cores": {name: round(cores, 2) for name, cores in self.cpu_cores.items()},
+            "running": [capture.level.name for capture in self.running],
+            "chosen": self.chosen,
+            "behind": self.behind,
+        }
@@ -0,0 +1,58 @@
+from quality import LEVELS, QualityPolicy
+
+
+def names(levels):
+    return [level.name if level else None for level in levels]
+
+
+def test_format_selector_caps_height():
+    """Test that a level caps the height yt-dlp may pick, falling back to the smallest format."""
+    level = LEVELS[2]
+    assert level.format_selector() == "bv*[height<=480]+ba/b[height<=480]/wv*+ba/w"
+    assert level.format_selector(merged=True) == "b[height<=480]/bv*[height<=480]+ba/w"
+
+
+def test_transcodes_limited_by_cpu_and_copies_not():
+    """Test that running transcodes push new transcodes down the ladder, while copies keep the best level."""
+    policy = QualityPolicy(cpus=6)
+    levels = []
+    with policy.capture() as first, policy.capture() as second:
+        levels += [first.level, second.level]
+        with policy.capture() as third, policy.capture(transcode=False) as copy:
+            levels += [third.level, copy.level]
+    assert names(levels) == ["1080p", "720p", "240p", "1080p"]
+    assert policy.running == []
+    assert names([QualityPolicy(cpus=4, enabled=False).choose()]) == [None]
+
+
+def test_falling_behind_lowers_bandwidth_until_captures_keep_up():
+    """Test that a late capture caps the bandwidth estimate, and captures that keep up raise it back."""
+    policy = QualityPolicy(cpus=64)
+    with policy.capture() as capture:
+        capture.stream_kbps = 2600
+        # 15 seconds of stream took 30: the link delivered half the bitrate
+        policy.observe(capture, media_seconds=15, ingest_seconds=30)
+    assert policy.bandwidth_kbps == 1300
+    assert policy.choose().name == "240p"
+
+    for _ in range(10):
+        with policy.capture() as capture:
+            policy.observe(capture, media_seconds=15, ingest_seconds=14)
+    assert policy.choose().name == "720p"
+    assert policy.stats()["behind"] == 1
+
+
+def test_camera_floor_wins_over_pressure():
+    """Test that a camera is never captured below its minimum quality."""
+    policy = QualityPolicy(cpus=1)
+    policy.bandwidth_kbps = 100
+    assert policy.choose().name == "240p"
+    assert policy.choose(floor="720p").name == "720p"
+
+
+def test_transcode_cost_is_learnt():
+    """Test that measured transcode CPU moves a level's cost estimate toward what it really takes."""
+    policy = QualityPolicy(cpus=4)
+    with policy.capture() as capture:
+        policy.observe(capture, media_seconds=10, ingest_seconds=10, cpu_seconds=10, transcoded=True)
+    assert 1.0 < policy.cpu_cores["1080p"] < 3.0
@@ -0,0 +1,156 @@
+"""
+Budgeted launching of scheduled captures.
+
+Captures are queued with the time they are due and started in due order, but
+never more than the budget at once: when many cameras share an event (sunset
+across one timezone), the rest wait for a running capture to finish instead of
+all hitting yt-dlp, FFmpeg and the uplink at the same moment. A capture that
+can't start within its max delay of the due time is dropped as missed, since
+the moment it was meant to catch has passed.
+
+The scheduler only decides when to start a capture; launch() hands it to the
+collector's queue and returns the job ID, and job_finished() frees the slot.
+A capture may carry a key naming the event it is for, which launch() records
+with the job so a planner can tell afterwards which events were captured, and
+a session to capture several clips from one stream connection. launch() marks
+a capture remote when it attached to a job another replica runs: that job
+counts against the other replica's budget, and its end is never seen here, so
+it takes no slot.
+"""
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from session import Session
+
+# How late a scheduled capture may start before it is dropped as missed
+SCHEDULE_MAX_DELAY_SECONDS = float(os.getenv("SCHEDULE_MAX_DELAY_SECONDS", "600"))
+
+
+@dataclass(order=True)
+class ScheduledCapture:
+    due: float
+    seq: int
+    camera_id: str = field(compare=False)
+    reason: str = field(default="", compare=False)
+    max_delay: float = field(default=SCHEDULE_MAX_DELAY_SECONDS, compare=False)
+    job_id: Optional[str] = field(default=None, compare=False)
+    started_at: Optional[float] = field(default=None, compare=False)
+    key: Optional[str] = field(default=None, compare=False)
+    session: Optional[Session] = field(default=None, compare=False)
+    remote: bool = field(default=False, compare=False)
+
+    def to_dict(self):
+        return {
+            "camera_id": self.camera_id,
+            "reason": self.reason,
+            "key": self.key,
+            "session": self.session.to_dict() if self.session else None,
+            "due": datetime.fromtimestamp(self.due).astimezone().isoformat(),
+            "job_id": self.job_id,
+            "remote": self.remote,
+            "start_delay_seconds": round(self.started_at - self.due, 3) if self.started_at else None,
+        }
+
+
+class CaptureScheduler:
+    def __init__(self, launch: Callable[[ScheduledCapture], Awaitable[str]], budget: int,
+                 max_delay: float = SCHEDULE_MAX_DELAY_SECONDS, clock: Callable[[], float] = time.time):
+        self.launch = launch
+        self.budget = max(1, budget)
+        self.max_delay = max_delay
+        self.clock = clock
+        self.pending: list[ScheduledCapture] = []
+        self.running: dict[str, ScheduledCapture] = {}
+        self.launched = 0
+        self.missed = 0
+        self.failed = 0
+        self.max_start_delay = 0.0
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, camera_id: str, due: float, reason: str = "", max_delay: Optional[float] = None,
+                 key: Optional[str] = None, session: Optional[Session] = None):
+        """Queue a capture of camera_id to start at the unix time due, as a session if one is given."""
+        capture = ScheduledCapture(due, next(self._seq), camera_id, reason,
+                                   self.max_delay if max_delay is None else max_delay, key=key, session=session)
+        heapq.heappush(self.pending, capture)
+        self._wakeup.set()
+        return capture
+
+    def job_finished(self, job_id: str):
+        """Free the slot of a scheduled capture once its job has finished."""
+        if self.running.pop(job_id, None):
+            self._wakeup.set()
+
+    async def launch_due(self):
+        """Start due captures while the budget allows, dropping ones that are too late."""
+        now = self.clock()
+        while self.pending and self.pending[0].due <= now and len(self.running) < self.budget:
+            capture = heapq.heappop(self.pending)
+            delay = now - capture.due
+            if delay > capture.max_delay:
+                self.missed += 1
+                logging.warning(f"Missed {capture.reason or 'scheduled'} capture of {capture.camera_id}: "
+                                f"no slot within {capture.max_delay:.0f}s of {capture.to_dict()['due']}")
+                continue
+            try:
+                capture.job_id = await self.launch(capture)
+            except Exception as e:
+                self.failed += 1
+                logging.error(f"Could not start scheduled capture of {capture.camera_id}: {e}")
+                continue
+            capture.started_at = now
+            if not capture.remote:
+                self.running[capture.job_id] = capture
+            self.launched += 1
+            self.max_start_delay = max(self.max_start_delay, delay)
+            logging.info(f"Started {capture.reason or 'scheduled'} capture of {capture.camera_id} as "
+                         f"Job ID {capture.job_id}, {delay:.1f}s after due ({len(self.running)}/{self.budget}).")
+            now = self.clock()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            await self.launch_due()
+            timeout = None
+            if self.pending and len(self.running) < self.budget:
+                timeout = max(0.0, self.pending[0].due - self.clock())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if not self._task:
+            # A fresh event bound to the running loop, already set for anything scheduled before startup
+            self._wakeup = asyncio.Event()
+            self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def upcoming(self, limit: int = 50):
+        return [capture.to_dict() for capture in heapq.nsmallest(limit, self.pending)]
+
+    def stats(self):
+        return {
+            "budget": self.budget,
+            "pending": len(self.pending),
+            "running": len(self.running),
+            "launched": self.launched,
+            "missed": self.missed,
+            "failed": self.failed,
+            "max_start_delay_seconds": round(self.max_start_delay, 3),
+        }
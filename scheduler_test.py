@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from scheduler import CaptureScheduler
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler(budget: int, clock=None):
+    launched = []
+
+    async def launch(capture):
+        launched.append(capture.camera_id)
+        return f"job-{capture.camera_id}"
+
+    return CaptureScheduler(launch, budget=budget, max_delay=60, clock=clock or Clock()), launched
+
+
+@pytest.mark.asyncio
+async def test_budget_limits_concurrent_captures():
+    """Test that simultaneous captures start in due order, at most budget at a time."""
+    scheduler, launched = make_scheduler(budget=2)
+    for n, camera_id in enumerate(["c", "a", "b", "d"]):
+        scheduler.schedule(camera_id, due=990 + n)
+    await scheduler.launch_due()
+    assert launched == ["c", "a"]
+    assert scheduler.stats()["running"] == 2
+
+    scheduler.job_finished("job-c")
+    await scheduler.launch_due()
+    assert launched == ["c", "a", "b"]
+    scheduler.job_finished("job-unknown")
+    await scheduler.launch_due()
+    assert launched == ["c", "a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_late_captures_are_missed():
+    """Test that a capture that can't start within its max delay is dropped, not started late."""
+    clock = Clock()
+    scheduler, launched = make_scheduler(budget=1, clock=clock)
+    scheduler.schedule("a", due=1000)
+    scheduler.schedule("b", due=1000)
+    scheduler.schedule("c", due=1000, max_delay=600)
+    await scheduler.launch_due()
+    clock.now = 1100
+    scheduler.job_finished("job-a")
+    await scheduler.launch_due()
+    assert launched == ["a", "c"]
+    assert scheduler.stats()["missed"] == 1
+    assert scheduler.stats()["max_start_delay_seconds"] == 100
+
+
+@pytest.mark.asyncio
+async def test_failed_launch_frees_the_slot():
+    """Test that a capture whose launch fails is counted and doesn't hold a slot."""
+    async def launch(capture):
+        if capture.camera_id == "broken":
+            raise RuntimeError("queue full")
+        return f"job-{capture.camera_id}"
+
+    scheduler = CaptureScheduler(launch, budget=1, clock=Clock())
+    scheduler.schedule("broken", due=999)
+    scheduler.schedule("ok", due=1000)
+    await scheduler.launch_due()
+    assert scheduler.stats()["failed"] == 1
+    assert list(scheduler.running) == ["job-ok"]
+
+
+@pytest.mark.asyncio
+async def test_background_loop_waits_until_due():
+    """Test that the running scheduler starts a capture when it becomes due, not before."""
+    launched = asyncio.Event()
+
+    async def launch(capture):
+        launched.set()
+        return "job-1"
+
+    loop = asyncio.get_running_loop()
+    scheduler = CaptureScheduler(launch, budget=1, clock=loop.time)
+    scheduler.start()
+    capture = scheduler.schedule("a", due=loop.time() + 0.2, reason="sunset")
+    await asyncio.sleep(0.05)
+    assert not launched.is_set()
+    await asyncio.wait_for(launched.wait(), timeout=5)
+    assert capture.job_id == "job-1"
+    assert scheduler.upcoming() == []
+    await scheduler.stop()
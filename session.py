@@ -0,0 +1,103 @@
+"""
+Capture sessions: several clips from one long-lived stream connection.
+
+A normal job resolves the stream, opens it, captures one clip and tears it all
+down. A session (a burst around sunset, or a timelapse of one clip every few
+minutes) instead keeps one yt-dlp/FFmpeg ingest open for the whole run and has
+FFmpeg's segment muxer cut it into clips, so stream resolution and connection
+set-up are paid once per session rather than once per clip.
+
+FFmpeg writes its segment list to stdout as each segment closes; the
+SegmentListSink turns those lines into queue entries so each clip can be
+uploaded while the next one is still being captured. With an interval longer
+than the clip, the stream between clips becomes gap segments that are deleted
+instead of uploaded.
+"""
+from dataclasses import dataclass
+from typing import Optional
+import asyncio
+import os
+
+# Longest session accepted, clips and gaps included
+SESSION_MAX_SECONDS = float(os.getenv("SESSION_MAX_SECONDS", "3600"))
+
+
+@dataclass(frozen=True)
+class Session:
+    clips: int
+    clip_seconds: float
+    interval: float = 0.0  # seconds from one clip's start to the next; 0 captures them back to back
+
+    def __post_init__(self):
+        if self.clips < 1:
+            raise ValueError("A session needs at least one clip")
+        if self.clip_seconds <= 0:
+            raise ValueError("clip_seconds must be positive")
+        if self.interval and self.interval < self.clip_seconds:
+            raise ValueError(f"interval must be 0 or at least the clip length ({self.clip_seconds}s)")
+        if self.duration > SESSION_MAX_SECONDS:
+            raise ValueError(f"Session of {self.duration:.0f}s exceeds SESSION_MAX_SECONDS ({SESSION_MAX_SECONDS:.0f}s)")
+
+    @property
+    def period(self) -> float:
+        return max(self.interval, self.clip_seconds)
+
+    @property
+    def gaps(self) -> bool:
+        return self.period > self.clip_seconds
+
+    @property
+    def duration(self) -> float:
+        """Seconds of stream the session reads, from the first clip's start to the last one's end."""
+        return (self.clips - 1) * self.period + self.clip_seconds
+
+    def clip_start(self, clip: int) -> float:
+        return clip * self.period
+
+    def segment_times(self) -> list[float]:
+        """Offsets FFmpeg splits the stream at: every clip's end, and with gaps every later clip's start."""
+        times = []
+        for clip in range(self.clips):
+            if clip and self.gaps:
+                times.append(self.clip_start(clip))
+            if clip < self.clips - 1:
+                times.append(self.clip_start(clip) + self.clip_seconds)
+        return times
+
+    def clip_for_segment(self, segment: int) -> Optional[int]:
+        """The clip number of FFmpeg's segment-th segment, or None for a gap between clips."""
+        if not self.gaps:
+            return segment
+        return None if segment % 2 else segment // 2
+
+    def to_dict(self):
+        return {"clips": self.clips, "clip_seconds": self.clip_seconds, "interval": self.interval}
+
+
+class SegmentListSink:
+    """
+    output_sink for run_ffmpeg while FFmpeg writes a CSV segment list to stdout. write() runs in a
+    worker thread; each completed segment is put on queue as (segment number, path) from the event
+    loop, and close() puts None after the last one.
+    """
+    def __init__(self, directory: str, loop: asyncio.AbstractEventLoop):
+        self.directory = directory
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.bytes_written = 0
+        self.segments = 0
+        self._buffer = b""
+
+    def write(self, chunk: bytes):
+        self.bytes_written += len(chunk)
+        *lines, self._buffer = (self._buffer + chunk).split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            filename = line.decode().split(",")[0]
+            entry = (self.segments, os.path.join(self.directory, os.path.basename(filename)))
+            self.segments += 1
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, entry)
+
+    def close(self):
+        self.queue.put_nowait(None)
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from session import SegmentListSink, Session
+
+
+def test_back_to_back_session():
+    """Test that a burst without an interval is split at each clip's end and keeps every segment."""
+    session = Session(clips=3, clip_seconds=15)
+    assert session.duration == 45
+    assert session.segment_times() == [15, 30]
+    assert [session.clip_for_segment(n) for n in range(3)] == [0, 1, 2]
+
+
+def test_timelapse_session_drops_gaps():
+    """Test that clips an interval apart are split at every clip's start and end, with the gaps dropped."""
+    session = Session(clips=3, clip_seconds=10, interval=60)
+    assert session.duration == 130
+    assert session.segment_times() == [10, 60, 70, 120]
+    assert [session.clip_for_segment(n) for n in range(5)] == [0, None, 1, None, 2]
+    assert session.clip_start(2) == 120
+
+
+def test_invalid_sessions():
+    """Test that sessions without clips, with overlapping clips or over the length limit are rejected."""
+    with pytest.raises(ValueError):
+        Session(clips=0, clip_seconds=15)
+    with pytest.raises(ValueError):
+        Session(clips=2, clip_seconds=15, interval=10)
+    with pytest.raises(ValueError):
+        Session(clips=100, clip_seconds=15, interval=3600)
+
+
+@pytest.mark.asyncio
+async def test_segment_list_sink_queues_closed_segments(tmp_path):
+    """Test that segment list lines split across writes from a thread become ordered queue entries."""
+    sink = SegmentListSink(str(tmp_path), asyncio.get_running_loop())
+    for chunk in (b"clip-000.mp4,0.000000,15.0", b"00000\nclip-001.mp4,15.0", b"00000,30.000000\n"):
+        await asyncio.to_thread(sink.write, chunk)
+    sink.close()
+    entries = []
+    while (entry := await sink.queue.get()) is not None:
+        entries.append(entry)
+    assert entries == [(0, str(tmp_path / "clip-000.mp4")), (1, str(tmp_path / "clip-001.mp4"))]
+    assert sink.bytes_written > 0
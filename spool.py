@@ -0,0 +1,334 @@
+"""
+On-disk spool of clips waiting for upload.
+
+A clip used to be deleted with its job directory whatever happened to its
+upload, so a GCS outage longer than the uploader's own retries, or a restart
+mid-upload, lost the capture. Instead a finished clip is moved (a rename) into
+the spool with its stills before the upload starts, and only deleted once it
+is in the bucket. Each entry is a directory holding the files and a
+spool.json manifest naming the blob, camera and capture time; the manifest is
+written last, so a directory without one is a move interrupted by a crash and
+is deleted when the spool is recovered at startup. Entries with a manifest
+are picked up again, so clips survive restarts. The manifest is marked as
+soon as the clip is in the bucket, before its stills, catalog entry and
+announcement: an upload interrupted after that point is dropped, not retried,
+so the clip is never catalogued or announced twice.
+
+The job that captured a clip uploads it first. When that fails, the
+SpoolUploader retries it in the background with exponential backoff from
+SPOOL_RETRY_INITIAL_SECONDS up to SPOOL_RETRY_MAX_SECONDS, at most
+SPOOL_UPLOAD_CONCURRENCY uploads at a time so a recovering bucket isn't hit
+by the whole backlog at once and captures keep most of the uplink.
+
+The spool is bounded: entries older than SPOOL_MAX_AGE_SECONDS are dropped,
+and while it holds more than SPOOL_MAX_BYTES the least recently used entry,
+the one whose upload was tried longest ago, is evicted. While the bucket is
+down that is the oldest clip, so the newest captures are the ones kept.
+"""
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "/app/spool")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", str(2 * 1024 ** 3)))
+SPOOL_MAX_AGE_SECONDS = float(os.getenv("SPOOL_MAX_AGE_SECONDS", str(3 * 86400)))
+SPOOL_UPLOAD_CONCURRENCY = int(os.getenv("SPOOL_UPLOAD_CONCURRENCY", "2"))
+SPOOL_RETRY_INITIAL_SECONDS = float(os.getenv("SPOOL_RETRY_INITIAL_SECONDS", "30"))
+SPOOL_RETRY_MAX_SECONDS = float(os.getenv("SPOOL_RETRY_MAX_SECONDS", "1800"))
+# The uploader wakes at least this often to drop entries past their age
+SPOOL_CHECK_INTERVAL_SECONDS = 60
+MANIFEST_NAME = "spool.json"
+
+
+class SpoolEntry:
+    def __init__(self, entry_id: str, directory: str, manifest: dict, size: int):
+        self.id = entry_id
+        self.directory = directory
+        self.manifest = manifest
+        self.size = size
+        # Being uploaded, by its job or the uploader; claimed entries are never evicted
+        self.claimed = False
+
+    @property
+    def attempts(self) -> int:
+        return self.manifest.get("attempts", 0)
+
+    @property
+    def next_attempt(self) -> float:
+        return self.manifest.get("next_attempt", 0.0)
+
+    @property
+    def uploaded(self) -> bool:
+        return self.manifest.get("uploaded", False)
+
+    def file(self, name: str) -> str:
+        """Path of a file moved into the entry, by its name."""
+        return os.path.join(self.directory, name)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "blob_name": self.manifest.get("blob_name"),
+            "size_bytes": self.size,
+            "attempts": self.attempts,
+            "last_error": self.manifest.get("last_error"),
+        }
+
+
+def write_manifest(directory: str, manifest: dict):
+    """Write an entry's manifest atomically, so a crash leaves the old one or the new one."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(f"{path}.tmp", path)
+
+
+class ClipSpool:
+    def __init__(self, directory: str = SPOOL_DIR, max_bytes: int = SPOOL_MAX_BYTES,
+                 max_age: float = SPOOL_MAX_AGE_SECONDS, retry_initial: float = SPOOL_RETRY_INITIAL_SECONDS,
+                 retry_max: float = SPOOL_RETRY_MAX_SECONDS, clock: Callable[[], float] = time.time,
+                 on_evict: Optional[Callable[[SpoolEntry, str], None]] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.clock = clock
+        self.on_evict = on_evict
+        # Least recently used first
+        self.entries: OrderedDict[str, SpoolEntry] = OrderedDict()
+        self.bytes = 0
+        self.evicted = {"age": 0, "size": 0}
+        self.recovered = 0
+        self._lock = threading.Lock()
+
+    def add(self, entry_id: str, paths: Iterable[str], manifest: dict, claimed: bool = True) -> SpoolEntry:
+        """
+        Move the files at paths into a new entry described by manifest; missing files are left out.
+        The entry starts claimed by the caller, who uploads it next. Blocking; call it from a thread.
+        """
+        directory = os.path.join(self.directory, entry_id)
+        os.makedirs(directory)
+        size = 0
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            target = os.path.join(directory, os.path.basename(path))
+            shutil.move(path, target)  # a rename unless the spool is on another filesystem
+            size += os.path.getsize(target)
+        now = self.clock()
+        manifest = {**manifest, "created_at": now, "attempts": 0, "next_attempt": now}
+        write_manifest(directory, manifest)
+        entry = SpoolEntry(entry_id, directory, manifest, size)
+        entry.claimed = claimed
+        with self._lock:
+            self.entries[entry_id] = entry
+            self.bytes += size
+        self.evict()
+        return entry
+
+    def due(self, limit: int) -> list[SpoolEntry]:
+        """Claim up to limit unclaimed entries whose next attempt is due, least recently used first."""
+        now = self.clock()
+        with self._lock:
+            claimed = [entry for entry in self.entries.values()
+                       if not entry.claimed and entry.next_attempt <= now][:limit]
+            for entry in claimed:
+                entry.claimed = True
+                self.entries.move_to_end(entry.id)
+        return claimed
+
+    def next_due(self) -> Optional[float]:
+        """When the next unclaimed entry is due, or None if there is none."""
+        with self._lock:
+            return min((entry.next_attempt for entry in self.entries.values() if not entry.claimed), default=None)
+
+    def mark_uploaded(self, entry: SpoolEntry):
+        """
+        Record that a claimed entry's clip is in the bucket, so it is never uploaded again, even
+        after a restart. Blocking, but only a small write: call it right after the upload, before
+        anything else is awaited, so a cancellation can't come between the two.
+        """
+        entry.manifest = {**entry.manifest, "uploaded": True}
+        write_manifest(entry.directory, entry.manifest)
+
+    def release(self, entry: SpoolEntry, error: Optional[str] = None):
+        """
+        Give back a claimed entry that is still not uploaded. With the error of a failed attempt, its
+        next attempt backs off exponentially. An entry marked uploaded is removed instead. Blocking
+        when there is an error or the entry is uploaded; call it from a thread.
+        """
+        if entry.uploaded:
+            self.remove(entry)
+            return
+        if error is not None:
+            attempts = entry.attempts + 1
+            delay = min(self.retry_max, self.retry_initial * 2 ** (attempts - 1))
+            entry.manifest = {**entry.manifest, "attempts": attempts, "next_attempt": self.clock() + delay,
+                              "last_error": error}
+            if entry.id in self.entries:
+                write_manifest(entry.directory, entry.manifest)
+        entry.claimed = False
+
+    def remove(self, entry: SpoolEntry):
+        """Delete an uploaded entry. Blocking; call it from a thread."""
+        with self._lock:
+            if self.entries.pop(entry.id, None) is not None:
+                self.bytes -= entry.size
+        shutil.rmtree(entry.directory, ignore_errors=True)
+
+    def evict(self) -> int:
+        """Drop unclaimed entries past their age, then the least recently used while over size. Blocking."""
+        cutoff = self.clock() - self.max_age
+        victims = []
+        with self._lock:
+            remaining = self.bytes
+            for entry in self.entries.values():
+                if not entry.claimed and entry.manifest.get("created_at", 0.0) < cutoff:
+                    victims.append((entry, "age"))
+                    remaining -= entry.size
+            for entry in self.entries.values():
+                if remaining <= self.max_bytes:
+                    break
+                if not entry.claimed and all(victim is not entry for victim, _ in victims):
+                    victims.append((entry, "size"))
+                    remaining -= entry.size
+            for entry, _ in victims:
+                del self.entries[entry.id]
+                self.bytes -= entry.size
+        for entry, reason in victims:
+            shutil.rmtree(entry.directory, ignore_errors=True)
+            self.evicted[reason] += 1
+            logging.warning(f"Evicted {entry.manifest.get('blob_name')} from the upload spool ({reason}) "
+                            f"after {entry.attempts} failed upload(s).")
+            if self.on_evict:
+                self.on_evict(entry, reason)
+        return len(victims)
+
+    def recover(self) -> int:
+        """
+        Load the entries left in the spool directory by an earlier run, oldest first, and delete the
+        directories a crash left without a manifest. Returns the number of entries. Blocking.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            directory = os.path.join(self.directory, name)
+            if not os.path.isdir(directory) or name in self.entries:
+                continue
+            try:
+                with open(os.path.join(directory, MANIFEST_NAME)) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                logging.warning(f"Deleting incomplete spool entry {name}.")
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            if manifest.get("uploaded"):
+                logging.info(f"Deleting spool entry {name}, uploaded before the restart.")
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            size = sum(entry.stat().st_size for entry in os.scandir(directory)
+                       if entry.is_file() and entry.name != MANIFEST_NAME)
+            found.append(SpoolEntry(name, directory, manifest, size))
+        found.sort(key=lambda entry: entry.manifest.get("created_at", 0.0))
+        with self._lock:
+            for entry in found:
+                self.entries[entry.id] = entry
+                self.bytes += entry.size
+        self.recovered += len(found)
+        if found:
+            logging.info(f"Recovered {len(found)} clip(s) waiting for upload from {self.directory}.")
+        self.evict()
+        return len(found)
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "recovered": self.recovered,
+            "evicted": dict(self.evicted),
+            "waiting": [entry.to_dict() for entry in list(self.entries.values())[:10]],
+        }
+
+
+class SpoolUploader:
+    """
+    Background task uploading the spool's due entries, at most concurrency at a time. upload raises
+    when an entry couldn't be uploaded; the entry is then retried after its backoff.
+    """
+    def __init__(self, spool: ClipSpool, upload: Callable[[SpoolEntry], Awaitable[None]],
+                 concurrency: int = SPOOL_UPLOAD_CONCURRENCY):
+        self.spool = spool
+        self.upload = upload
+        self.concurrency = concurrency
+        self.uploaded = 0
+        self.failed = 0
+        self.running: set[asyncio.Task] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self):
+        """Look for due entries now, e.g. after one was released."""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _upload(self, entry: SpoolEntry):
+        try:
+            await self.upload(entry)
+        except asyncio.CancelledError:
+            self.spool.release(entry)
+            raise
+        except Exception as e:
+            self.failed += 1
+            logging.warning(f"Upload of spooled {entry.manifest.get('blob_name')} failed "
+                            f"(attempt {entry.attempts + 1}): {e}")
+            await asyncio.to_thread(self.spool.release, entry, str(e))
+        else:
+            self.uploaded += 1
+            await asyncio.to_thread(self.spool.remove, entry)
+        finally:
+            self.wake()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.to_thread(self.spool.evict)
+            except Exception as e:
+                logging.error(f"Upload spool eviction failed: {e}")
+            for entry in self.spool.due(self.concurrency - len(self.running)):
+                task = asyncio.create_task(self._upload(entry))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+            timeout = SPOOL_CHECK_INTERVAL_SECONDS
+            next_due = self.spool.next_due()
+            if next_due is not None and len(self.running) < self.concurrency:
+                timeout = min(timeout, max(0.0, next_due - self.spool.clock()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if not self._task:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop uploading; interrupted uploads stay in the spool for the next run."""
+        tasks = [task for task in (self._task, *self.running) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._wakeup = None
+
+    def stats(self):
+        return {"uploading": len(self.running), "uploaded": self.uploaded, "failed": self.failed}
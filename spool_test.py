@@ -0,0 +1,146 @@
+import asyncio
+import os
+
+import pytest
+
+from spool import MANIFEST_NAME, ClipSpool, SpoolUploader
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def clip(tmp_path, name: str, size: int = 10) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_entry_moves_files_and_backs_off(tmp_path):
+    """Test that spooled files move into the entry and each failed attempt doubles the wait, up to the cap."""
+    clock = Clock()
+    spool = ClipSpool(str(tmp_path / "spool"), retry_initial=30, retry_max=100, clock=clock)
+    path = clip(tmp_path, "a.mp4")
+    entry = spool.add("job-a", [path, str(tmp_path / "missing.jpg")], {"blob_name": "a.mp4"})
+    assert not os.path.exists(path)
+    assert sorted(os.listdir(entry.directory)) == ["a.mp4", MANIFEST_NAME]
+    assert (spool.bytes, entry.claimed) == (10, True)
+    assert spool.due(5) == []
+
+    delays = []
+    for _ in range(3):
+        spool.release(entry, "503")
+        delays.append(entry.next_attempt - clock.now)
+    assert delays == [30, 60, 100]
+    assert spool.due(5) == []
+    clock.now += 100
+    assert spool.due(5) == [entry]
+    spool.remove(entry)
+    assert (spool.entries, spool.bytes) == ({}, 0)
+    assert not os.path.exists(entry.directory)
+
+
+def test_eviction_by_age_and_least_recently_used(tmp_path):
+    """Test that old entries are dropped, then the least recently tried while over size, never claimed ones."""
+    clock = Clock()
+    evicted = []
+    spool = ClipSpool(str(tmp_path / "spool"), max_bytes=35, max_age=600, clock=clock,
+                      on_evict=lambda entry, reason: evicted.append((entry.id, reason)))
+    old = spool.add("old", [clip(tmp_path, "old.mp4")], {}, claimed=False)
+    clock.now += 500
+    tried = spool.add("tried", [clip(tmp_path, "tried.mp4")], {}, claimed=False)
+    spool.add("untried", [clip(tmp_path, "untried.mp4")], {}, claimed=False)
+    assert spool.due(1) == [old]
+    spool.release(old, "503")
+    assert spool.due(1) == [tried]
+    spool.release(tried, "503")
+    spool.add("new", [clip(tmp_path, "new.mp4")], {})
+    assert evicted == [("untried", "size")]
+
+    clock.now += 200
+    assert spool.evict() == 1
+    assert evicted[-1] == ("old", "age")
+    assert list(spool.entries) == ["tried", "new"]
+    assert spool.bytes == 20
+
+
+def test_recover_after_restart(tmp_path):
+    """Test that entries survive a restart in age order and a directory without a manifest is deleted."""
+    clock = Clock()
+    spool = ClipSpool(str(tmp_path / "spool"), clock=clock)
+    spool.add("first", [clip(tmp_path, "first.mp4")], {"blob_name": "first.mp4"})
+    clock.now += 1
+    second = spool.add("second", [clip(tmp_path, "second.mp4", size=5)], {"blob_name": "second.mp4"})
+    spool.release(second, "503")
+    os.makedirs(tmp_path / "spool" / "interrupted")
+
+    restarted = ClipSpool(str(tmp_path / "spool"), clock=clock)
+    assert restarted.recover() == 2
+    assert list(restarted.entries) == ["first", "second"]
+    assert restarted.bytes == 15
+    assert restarted.entries["second"].attempts == 1
+    assert not os.path.exists(tmp_path / "spool" / "interrupted")
+
+
+@pytest.mark.asyncio
+async def test_uploader_drains_with_limited_concurrency(tmp_path):
+    """Test that the uploader keeps at most its concurrency running and retries a failed upload."""
+    spool = ClipSpool(str(tmp_path / "spool"), retry_initial=0.01)
+    for n in range(5):
+        spool.add(f"clip-{n}", [clip(tmp_path, f"{n}.mp4")], {"blob_name": f"{n}.mp4"}, claimed=False)
+    running, most, attempts = 0, 0, []
+
+    async def upload(entry):
+        nonlocal running, most
+        running += 1
+        most = max(most, running)
+        attempts.append(entry.id)
+        await asyncio.sleep(0.01)
+        running -= 1
+        if entry.id == "clip-2" and entry.attempts == 0:
+            raise RuntimeError("503")
+
+    uploader = SpoolUploader(spool, upload, concurrency=2)
+    uploader.start()
+    for _ in range(100):
+        if not spool.entries:
+            break
+        await asyncio.sleep(0.01)
+    await uploader.stop()
+    assert spool.entries == {}
+    assert most == 2
+    assert attempts.count("clip-2") == 2
+    assert uploader.stats() == {"uploading": 0, "uploaded": 5, "failed": 1}
+
+
+@pytest.mark.asyncio
+async def test_upload_cancelled_after_the_clip_is_in_the_bucket_is_not_retried(tmp_path):
+    """Test that an entry marked uploaded is removed when its upload is cancelled, and dropped on recovery."""
+    spool = ClipSpool(str(tmp_path / "spool"))
+    spool.add("clip-0", [clip(tmp_path, "0.mp4")], {"blob_name": "0.mp4"}, claimed=False)
+    uploaded, attempts = asyncio.Event(), []
+
+    async def upload(entry):
+        attempts.append(entry.id)
+        spool.mark_uploaded(entry)
+        uploaded.set()
+        await asyncio.sleep(60)  # announcing the clip when the uploader is stopped
+
+    uploader = SpoolUploader(spool, upload)
+    uploader.start()
+    await asyncio.wait_for(uploaded.wait(), 5)
+    await uploader.stop()
+    assert attempts == ["clip-0"]
+    assert (spool.entries, spool.bytes) == ({}, 0)
+    assert os.listdir(tmp_path / "spool") == []
+
+    # A restart between the upload and the removal finds the entry marked
+    entry = spool.add("clip-1", [clip(tmp_path, "1.mp4")], {"blob_name": "1.mp4"})
+    spool.mark_uploaded(entry)
+    restarted = ClipSpool(str(tmp_path / "spool"))
+    assert restarted.recover() == 0
+    assert os.listdir(tmp_path / "spool") == []
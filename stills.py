@@ -0,0 +1,85 @@
+"""
+Poster and thumbnail sprite images for each clip.
+
+Viewers that only need a picture of the latest capture shouldn't have to fetch
+a multi-megabyte mp4. The capture's own FFmpeg run writes the stills as extra
+outputs next to the clip, so they come from frames FFmpeg decodes anyway
+rather than from a second pass over the file. With stream copy FFmpeg decodes
+only what the stills need: a poster of the first frame costs a single frame,
+a later poster or a sprite sheet costs decoding up to that point.
+
+Stills are uploaded next to the clip (<clip>.jpg, <clip>-sprite.jpg) with a
+long immutable Cache-Control, and the poster is also copied to
+<camera prefix>latest.<ext> with a short one for "latest image" consumers.
+"""
+from dataclasses import dataclass
+import math
+import os
+
+# jpg or webp; empty disables stills
+POSTER_FORMAT = os.getenv("POSTER_FORMAT", "jpg")
+# Offset of the poster frame in the clip; 0 takes the first frame, the cheapest with stream copy
+POSTER_AT_SECONDS = float(os.getenv("POSTER_AT_SECONDS", "0"))
+# One sprite sheet thumbnail every this many seconds; 0 disables the sprite sheet
+SPRITE_INTERVAL_SECONDS = float(os.getenv("SPRITE_INTERVAL_SECONDS", "0"))
+SPRITE_COLUMNS = int(os.getenv("SPRITE_COLUMNS", "5"))
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "160"))
+STILL_CACHE_CONTROL = os.getenv("STILL_CACHE_CONTROL", "public, max-age=31536000, immutable")
+LATEST_POSTER_CACHE_CONTROL = os.getenv("LATEST_POSTER_CACHE_CONTROL", "public, max-age=60")
+
+CONTENT_TYPES = {"jpg": "image/jpeg", "webp": "image/webp"}
+ENCODER_ARGS = {"jpg": ["-q:v", "3"], "webp": ["-c:v", "libwebp", "-quality", "75"]}
+if POSTER_FORMAT and POSTER_FORMAT not in CONTENT_TYPES:
+    raise ValueError(f"POSTER_FORMAT must be one of {tuple(CONTENT_TYPES)} or empty, got {POSTER_FORMAT!r}")
+
+
+@dataclass(frozen=True)
+class Still:
+    kind: str  # "poster" or "sprite"
+    path: str
+    image_format: str
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.image_format]
+
+    def blob_name(self, clip_blob_name: str) -> str:
+        """Where the still of the clip stored at clip_blob_name goes: beside it, named after it."""
+        suffix = "" if self.kind == "poster" else f"-{self.kind}"
+        return f"{os.path.splitext(clip_blob_name)[0]}{suffix}.{self.image_format}"
+
+
+def plan_stills(clip_path: str, image_format: str = POSTER_FORMAT,
+                sprite_interval: float = SPRITE_INTERVAL_SECONDS) -> list[Still]:
+    """The stills to write beside a clip captured to clip_path."""
+    if not image_format:
+        return []
+    base = os.path.splitext(clip_path)[0]
+    stills = [Still("poster", f"{base}.{image_format}", image_format)]
+    if sprite_interval > 0:
+        stills.append(Still("sprite", f"{base}-sprite.{image_format}", image_format))
+    return stills
+
+
+def still_output_args(stills: list[Still], duration: float, poster_at: float = POSTER_AT_SECONDS,
+                      sprite_interval: float = SPRITE_INTERVAL_SECONDS, columns: int = SPRITE_COLUMNS,
+                      width: int = THUMBNAIL_WIDTH) -> list[str]:
+    """
+    FFmpeg output options writing each still from the first input's video, to go after the clip's
+    own output. Each is a single image, so FFmpeg stops feeding it once it is written. The sprite
+    sheet is only written once its grid is full, which from a live stream a clip whose thumbnails
+    don't fill the last row only gets after it has ended. So its frames are trimmed to the clip
+    inside the filter chain, and at the end of the trim the tile filter writes the partial sheet;
+    an output -t is applied after the filters and wouldn't end the tile's input.
+    """
+    args = []
+    for still in stills:
+        if still.kind == "poster":
+            filters = f"trim=start={min(poster_at, duration / 2):g}" if poster_at > 0 else "null"
+        else:
+            thumbnails = max(1, math.ceil(duration / sprite_interval))
+            rows = math.ceil(thumbnails / columns)
+            filters = (f"trim=duration={duration:g},fps=1/{sprite_interval:g},scale={width}:-2,"
+                       f"tile={min(columns, thumbnails)}x{rows}")
+        args += ["-map", "0:v:0", "-vf", filters, "-frames:v", "1", *ENCODER_ARGS[still.image_format], still.path]
+    return args
@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from stills import plan_stills, still_output_args
+
+
+def test_plan_stills_beside_clip():
+    """Test that stills are named after the clip and stored next to its blob."""
+    poster, sprite = plan_stills("/clips/job/seacliff-t.mp4", "webp", sprite_interval=3)
+    assert (poster.path, sprite.path) == ("/clips/job/seacliff-t.webp", "/clips/job/seacliff-t-sprite.webp")
+    assert poster.content_type == "image/webp"
+    assert poster.blob_name("2025/01/seacliff-t.mp4") == "2025/01/seacliff-t.webp"
+    assert sprite.blob_name("pier/2025/01/pier-t.mp4") == "pier/2025/01/pier-t-sprite.webp"
+    assert plan_stills("/clips/job/seacliff-t.mp4", "jpg", sprite_interval=0)[0].kind == "poster"
+    assert plan_stills("/clips/job/seacliff-t.mp4", "") == []
+
+
+def test_still_output_args():
+    """Test that each still is one frame from the first input's video; the sprite tiles the whole clip."""
+    stills = plan_stills("/clips/c.mp4", "jpg", sprite_interval=2)
+    args = still_output_args(stills, duration=15, poster_at=0, sprite_interval=2, columns=5, width=160)
+    assert args.count("-frames:v") == 2
+    assert args[:4] == ["-map", "0:v:0", "-vf", "null"]
+    assert "trim=duration=15,fps=1/2,scale=160:-2,tile=5x2" in args
+    args = still_output_args(stills[:1], duration=15, poster_at=60)
+    assert "trim=start=7.5" in args
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg")
+def test_stills_written_by_capture_run(tmp_path):
+    """Test that FFmpeg writes the poster and sprite sheet in the same run as the clip."""
+    clip = str(tmp_path / "clip.mp4")
+    stills = plan_stills(clip, "jpg", sprite_interval=1)
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10",
+                    "-t", "3", "-c:v", "libx264", clip, *still_output_args(stills, 3, sprite_interval=1)],
+                   check=True)
+    for still in stills:
+        with open(still.path, "rb") as f:
+            assert f.read(2) == b"\xff\xd8"
+    assert os.path.getsize(clip) > 0
+
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg")
+def test_partial_sprite_sheet_ends_with_the_clip_on_an_endless_source(tmp_path):
+    """Test that a sprite sheet whose last row isn't filled is written at the end of the clip, not after it."""
+    clip = str(tmp_path / "clip.mp4")
+    sprite = plan_stills(clip, "jpg", sprite_interval=2)[1]
+    # 15 s at one thumbnail every 2 s is 8 thumbnails on a 5x2 grid, which would take 18 s of stream to fill
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=size=320x240:rate=10",
+                    "-t", "15", "-c:v", "libx264", clip,
+                    *still_output_args([sprite], 15, sprite_interval=2, columns=5, width=32)],
+                   check=True, timeout=30)
+    pixels = subprocess.run(["ffmpeg", "-loglevel", "error", "-i", sprite.path, "-f", "rawvideo", "-pix_fmt", "gray",
+                             "-"], check=True, capture_output=True).stdout
+    assert len(pixels) == 160 * 48
+    rows = [pixels[y * 160:(y + 1) * 160] for y in range(48)]
+    # The last two cells, for thumbnails 9 and 10, are left black
+    assert max(max(row[96:]) for row in rows[26:]) < 32
+    assert max(max(row[:96]) for row in rows[26:]) > 128
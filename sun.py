@@ -1,42 +1,33 @@
 #!/usr/local/bin/python3
+"""
+Print the sun event captures the API will schedule for the next few days.
+
+Scheduling itself now happens inside the API process (sun_schedule.py); this
+script only shows the plan, computed the same way, for the camera registry
+the API loads from CAMERAS_FILE. Lines go to stdout and SUN_LOG_FILE through
+the shared logging setup (logs.py).
+"""
 
 from datetime import datetime, timedelta
-from astral import LocationInfo
-from astral.sun import sun
-import pytz
+import logging
 import os
-
-def log(message):
-    print(message)
-    with open("/var/log/camera-collector", "a") as f:
-        t = datetime.now(pytz.timezone(os.getenv("TZ", "America/Los_Angeles")))
-        timestamp = t.strftime("[%a %b %d %H:%M:%S PST %Y]")
-        f.write(f"{timestamp} {message}\n")
-
-def as_local_time(t):
-    return t.astimezone(pytz.timezone(os.getenv("TZ", "America/Los_Angeles")))
-
-def run_script(run_time):
-    local_run_time = as_local_time(run_time)
-    if datetime.now(pytz.timezone('US/Pacific')) > local_run_time:
-        log(f"past {run_time} not scheduling today")
-        return
-    command = f"/usr/bin/echo '(/usr/local/bin/python3 /app/start_collection.py 2>&1 </dev/null) >> /var/log/video' | /usr/bin/at {local_run_time.strftime('%I:%M %p')}"
-    log(command)
-    os.system(command)
-
-log("starting collection scheduling")
-
-location = LocationInfo("Seacliff", "USA", "America/Los_Angeles", 36.9741, -121.9158)
-local_tz = pytz.timezone(location.timezone)
-
-today = datetime.now(local_tz)
-s = sun(location.observer, date=today)
-
-sunset_local = as_local_time(s['sunset'])
-sunrise_local = as_local_time(s['sunrise'])
-
-run_script(sunrise_local)
-run_script(sunset_local - timedelta(minutes=15))
-run_script(sunset_local)
-os.system("/usr/bin/atq")
+import sys
+
+from cameras import CAMERAS_FILE, DEFAULT_CAMERA, CameraRegistry
+from logs import setup_logging
+from sun_schedule import SUN_EVENTS, SUN_PLAN_DAYS, parse_events, sun_events
+
+SUN_LOG_FILE = os.getenv("SUN_LOG_FILE", "/var/log/camera-collector")
+
+if __name__ == "__main__":
+    setup_logging(filename=SUN_LOG_FILE, stream=sys.stdout)
+    events = parse_events(SUN_EVENTS)
+    for camera in CameraRegistry.load(CAMERAS_FILE, default=DEFAULT_CAMERA):
+        if camera.latitude is None or camera.longitude is None:
+            logging.info(f"{camera.id}: no location, no sun event captures", extra={"camera": camera.id})
+            continue
+        today = datetime.now(camera.tz).date()
+        for day in (today + timedelta(days=n) for n in range(SUN_PLAN_DAYS)):
+            for due, reason in sun_events(camera, day, events):
+                logging.info(f"{camera.id}: {reason} capture at {datetime.fromtimestamp(due, camera.tz).isoformat()}",
+                             extra={"camera": camera.id, "stage": reason})
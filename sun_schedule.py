@@ -0,0 +1,186 @@
+"""
+Sunrise/sunset captures for every camera, planned inside the API process.
+
+This replaces the daily cron run of sun.py, which queued one `at` job per
+event, each starting a fresh interpreter to POST back to the API. The planner
+computes each located camera's sun events with astral for the next
+SUN_PLAN_DAYS days, caches them per camera and local date, and hands them to
+the CaptureScheduler, which starts them within the capture budget.
+
+Events are planned at startup and again every SUN_REPLAN_SECONDS. Planning
+includes events that are already due but still within the scheduler's max
+delay, unless a completed job for the event is in the history, so a restart
+just after sunset still gets its capture and one after the capture finished
+doesn't repeat it.
+
+With SUN_SESSION_CLIPS above 1, each event is captured as a session of that
+many clips SUN_SESSION_INTERVAL_SECONDS apart (0 for back to back) from one
+stream connection.
+"""
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable
+import asyncio
+import logging
+import os
+import time
+
+import astral.sun
+from astral import Observer
+
+from cameras import Camera
+from session import Session
+
+# Comma-separated astral events (dawn, sunrise, noon, sunset, dusk) with optional minute offsets
+SUN_EVENTS = os.getenv("SUN_EVENTS", "sunrise,sunset-15,sunset")
+SUN_PLAN_DAYS = int(os.getenv("SUN_PLAN_DAYS", "2"))
+SUN_REPLAN_SECONDS = float(os.getenv("SUN_REPLAN_SECONDS", "3600"))
+# Clips per event, and seconds from one clip's start to the next
+SUN_SESSION_CLIPS = int(os.getenv("SUN_SESSION_CLIPS", "1"))
+SUN_SESSION_INTERVAL_SECONDS = float(os.getenv("SUN_SESSION_INTERVAL_SECONDS", "0"))
+SUN_SCHEDULER_ENABLED = os.getenv("SUN_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+ASTRAL_EVENTS = ("dawn", "sunrise", "noon", "sunset", "dusk")
+
+
+def parse_events(spec: str) -> list[tuple[str, str, int]]:
+    """
+    "sunrise,sunset-15" -> [("sunrise", "sunrise", 0), ("sunset-15", "sunset", -15)]:
+    the reason a capture is recorded with, the astral event and the offset in minutes.
+    """
+    events = []
+    for item in (item.strip() for item in spec.split(",")):
+        if not item:
+            continue
+        name, sign, minutes = item.partition("+") if "+" in item else item.partition("-")
+        if name not in ASTRAL_EVENTS or (sign and not minutes.isdigit()):
+            raise ValueError(f"Bad sun event {item!r}; expected one of {ASTRAL_EVENTS} with an optional +/-minutes")
+        events.append((item, name, int(minutes or 0) * (-1 if sign == "-" else 1)))
+    return events
+
+
+def event_key(camera_id: str, reason: str, due: float) -> str:
+    """Identifies one planned capture, across restarts and replicas."""
+    return f"{camera_id}:{reason}:{int(due)}"
+
+
+def sun_events(camera: Camera, day: date, events: list[tuple[str, str, int]]) -> list[tuple[float, str]]:
+    """
+    (unix time, reason) of each event on the camera's local date day. Events the sun doesn't
+    reach that day (polar day or night) are left out.
+    """
+    observer = Observer(camera.latitude, camera.longitude)
+    times = []
+    for reason, name, offset in events:
+        try:
+            when = getattr(astral.sun, name)(observer, date=day, tzinfo=camera.tz)
+        except ValueError:
+            continue
+        times.append(((when + timedelta(minutes=offset)).timestamp(), reason))
+    return times
+
+
+class SunEventPlanner:
+    def __init__(self, cameras: Iterable[Camera], scheduler, events: str = SUN_EVENTS, days: int = SUN_PLAN_DAYS,
+                 replan_interval: float = SUN_REPLAN_SECONDS, session_clips: int = SUN_SESSION_CLIPS,
+                 session_interval: float = SUN_SESSION_INTERVAL_SECONDS,
+                 completed: Callable[[float], set[str]] = lambda since: set(), clock: Callable[[], float] = time.time):
+        self.cameras = cameras
+        self.scheduler = scheduler
+        self.events = parse_events(events)
+        self.days = days
+        self.replan_interval = replan_interval
+        self.session_clips = session_clips
+        self.session_interval = session_interval
+        self.completed = completed
+        self.clock = clock
+        self.planned: dict[str, float] = {}
+        self.planned_total = 0
+        self.last_planned_at = None
+        self._cache: dict[tuple[str, date], list[tuple[float, str]]] = {}
+        self._task = None
+
+    def events_for(self, camera: Camera, day: date):
+        key = (camera.id, day)
+        if key not in self._cache:
+            self._cache[key] = sun_events(camera, day, self.events)
+        return self._cache[key]
+
+    def session_for(self, camera: Camera):
+        if self.session_clips <= 1:
+            return None
+        return Session(self.session_clips, camera.capture_seconds, self.session_interval)
+
+    def due_events(self) -> tuple[float, list[tuple[Camera, float, str, str]]]:
+        """
+        The time now and the (camera, due, reason, key) of every event from max delay ago to
+        SUN_PLAN_DAYS ahead not planned or captured yet. Only computes; blocking, so the planner
+        runs it in a thread.
+        """
+        now = self.clock()
+        earliest = now - self.scheduler.max_delay
+        latest = now + self.days * 86400
+        completed = self.completed(earliest)
+        events = []
+        for camera in self.cameras:
+            if camera.latitude is None or camera.longitude is None:
+                continue
+            today = datetime.fromtimestamp(now, camera.tz).date()
+            for offset in range(-1, self.days + 1):
+                for due, reason in self.events_for(camera, today + timedelta(days=offset)):
+                    key = event_key(camera.id, reason, due)
+                    if earliest <= due <= latest and key not in self.planned and key not in completed:
+                        events.append((camera, due, reason, key))
+        oldest_day = datetime.fromtimestamp(now).date() - timedelta(days=2)
+        self._cache = {key: times for key, times in self._cache.items() if key[1] >= oldest_day}
+        return now, events
+
+    def schedule(self, now: float, events: list[tuple[Camera, float, str, str]]) -> int:
+        """Hand events from due_events() to the scheduler. Must run on the scheduler's event loop."""
+        added = 0
+        for camera, due, reason, key in events:
+            if key in self.planned:
+                continue
+            self.scheduler.schedule(camera.id, due, reason, key=key, session=self.session_for(camera))
+            self.planned[key] = due
+            added += 1
+        # Forget what can no longer be scheduled
+        earliest = now - self.scheduler.max_delay
+        self.planned = {key: due for key, due in self.planned.items() if due >= earliest}
+        self.planned_total += added
+        self.last_planned_at = datetime.fromtimestamp(now).astimezone().isoformat()
+        if added:
+            latest = datetime.fromtimestamp(now + self.days * 86400).isoformat()
+            logging.info(f"Planned {added} sun event capture(s) through {latest}.")
+        return added
+
+    def plan(self) -> int:
+        """Schedule every event not planned or captured yet, on the calling thread."""
+        return self.schedule(*self.due_events())
+
+    async def _run(self):
+        while True:
+            try:
+                # Sun times and the history lookup in a thread; the scheduler is only touched on the loop
+                self.schedule(*await asyncio.to_thread(self.due_events))
+            except Exception as e:
+                logging.error(f"Sun event planning failed: {e}")
+            await asyncio.sleep(self.replan_interval)
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "events": [reason for reason, _, _ in self.events],
+            "days": self.days,
+            "session_clips": self.session_clips,
+            "planned": len(self.planned),
+            "planned_total": self.planned_total,
+            "last_planned_at": self.last_planned_at,
+        }
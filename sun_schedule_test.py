@@ -0,0 +1,123 @@
+from datetime import date, datetime
+import asyncio
+import threading
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from cameras import Camera
+from scheduler import CaptureScheduler
+from sun_schedule import SunEventPlanner, event_key, parse_events, sun_events
+
+SEACLIFF = Camera(id="seacliff", url="https://example.com/seacliff", latitude=36.9741, longitude=-121.9158)
+TROMSO = Camera(id="tromso", url="https://example.com/tromso", latitude=69.6492, longitude=18.9553,
+                timezone="Europe/Oslo")
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+async def launch(capture):
+    return f"job-{capture.key}"
+
+
+def local_time(camera: Camera, *args):
+    return datetime(*args, tzinfo=ZoneInfo(camera.timezone)).timestamp()
+
+
+def test_parse_events():
+    """Test that events parse with their offsets and unknown events are rejected."""
+    assert parse_events("sunrise, sunset-15,dusk+5") == [
+        ("sunrise", "sunrise", 0), ("sunset-15", "sunset", -15), ("dusk+5", "dusk", 5)]
+    with pytest.raises(ValueError):
+        parse_events("moonrise")
+    with pytest.raises(ValueError):
+        parse_events("sunset-soon")
+
+
+def test_sun_events_in_camera_timezone():
+    """Test that events fall on the camera's local date, offsets applied, and polar days skip sunset."""
+    events = parse_events("sunrise,sunset-15,sunset")
+    times = {reason: due for due, reason in sun_events(SEACLIFF, date(2025, 6, 21), events)}
+    sunrise = datetime.fromtimestamp(times["sunrise"], SEACLIFF.tz)
+    assert (sunrise.date(), sunrise.hour) == (date(2025, 6, 21), 5)
+    assert times["sunset"] - times["sunset-15"] == 15 * 60
+    assert sun_events(TROMSO, date(2025, 6, 21), parse_events("sunset")) == []
+
+
+def test_plan_schedules_upcoming_events_once():
+    """Test that planning covers the next days for every located camera, and replanning adds nothing new."""
+    clock = Clock(local_time(SEACLIFF, 2025, 3, 1, 12))
+    scheduler = CaptureScheduler(launch, budget=1, max_delay=600, clock=clock)
+    unlocated = Camera(id="indoor", url="https://example.com/indoor")
+    planner = SunEventPlanner([SEACLIFF, unlocated], scheduler, events="sunrise,sunset", days=2, clock=clock)
+    assert planner.plan() == 4
+    assert [(c.camera_id, c.reason) for c in sorted(scheduler.pending)] == [
+        ("seacliff", "sunset"), ("seacliff", "sunrise"), ("seacliff", "sunset"), ("seacliff", "sunrise")]
+    assert all(c.key == event_key(c.camera_id, c.reason, c.due) for c in scheduler.pending)
+    assert planner.plan() == 0
+
+    clock.now += 86400
+    assert planner.plan() == 2
+    assert planner.stats()["planned"] == 4
+
+
+def test_restart_recovers_missed_events_still_valid():
+    """Test that after a restart an event due within max delay is planned unless its capture completed."""
+    sunset = sun_events(SEACLIFF, date(2025, 3, 1), parse_events("sunset"))[0][0]
+    clock = Clock(sunset + 300)
+    key = event_key("seacliff", "sunset", sunset)
+
+    scheduler = CaptureScheduler(launch, budget=1, max_delay=600, clock=clock)
+    SunEventPlanner([SEACLIFF], scheduler, events="sunset", days=1, clock=clock).plan()
+    assert min(scheduler.pending).key == key
+
+    scheduler = CaptureScheduler(launch, budget=1, max_delay=600, clock=clock)
+    planner = SunEventPlanner([SEACLIFF], scheduler, events="sunset", days=1, clock=clock,
+                              completed=lambda since: {key} if since <= sunset else set())
+    planner.plan()
+    assert scheduler.pending and all(c.due > clock.now for c in scheduler.pending)
+
+    clock.now = sunset + 700
+    scheduler = CaptureScheduler(launch, budget=1, max_delay=600, clock=clock)
+    SunEventPlanner([SEACLIFF], scheduler, events="sunset", days=1, clock=clock).plan()
+    assert scheduler.pending and all(c.due > clock.now for c in scheduler.pending)
+
+
+@pytest.mark.asyncio
+async def test_planned_event_launches_with_its_key():
+    """Test that a planned event that is due is launched by the scheduler with its event key."""
+    sunrise = sun_events(SEACLIFF, date(2025, 3, 1), parse_events("sunrise"))[0][0]
+    clock = Clock(sunrise + 1)
+    scheduler = CaptureScheduler(launch, budget=1, max_delay=600, clock=clock)
+    SunEventPlanner([SEACLIFF], scheduler, events="sunrise", days=1, clock=clock).plan()
+    await scheduler.launch_due()
+    assert list(scheduler.running) == [f"job-{event_key('seacliff', 'sunrise', sunrise)}"]
+
+
+@pytest.mark.asyncio
+async def test_background_planning_schedules_on_the_event_loop():
+    """Test that the planner's task hands events to a running scheduler from the loop, not its thread."""
+    asyncio.get_running_loop().set_debug(True)
+    clock = Clock(local_time(SEACLIFF, 2025, 3, 1, 12))
+    scheduler = CaptureScheduler(launch, budget=1, clock=clock)
+    scheduler.start()
+    planner = SunEventPlanner([SEACLIFF], scheduler, events="sunset", days=1, clock=clock)
+    scheduled_on = []
+    schedule = scheduler.schedule
+    scheduler.schedule = lambda *args, **kwargs: scheduled_on.append(threading.get_ident()) or schedule(
+        *args, **kwargs)
+    planner.start()
+    for _ in range(100):
+        if scheduled_on:
+            break
+        await asyncio.sleep(0.01)
+    await planner.stop()
+    await scheduler.stop()
+    assert scheduled_on and set(scheduled_on) == {threading.get_ident()}
+    assert [capture.reason for capture in scheduler.pending] == ["sunset"] * len(scheduled_on)
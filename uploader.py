@@ -0,0 +1,252 @@
+"""
+GCS upload subsystem shared by every collection job.
+
+One storage client with a tuned HTTP connection pool and a cached bucket handle
+serve all uploads. Large clips are split into parts uploaded in parallel and
+composed server-side, transient failures are retried with exponential backoff,
+and each upload's throughput and CRC32C checksum are recorded.
+
+google-cloud-storage and the auth libraries take a good share of the app's
+import time, so they are imported when the client is first built: by the
+startup warmup, or by the first upload if that comes sooner.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import base64
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+
+# Resumable upload chunk size, must be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Connections kept open per host, shared by concurrent jobs and composite part uploads
+UPLOAD_HTTP_POOL_SIZE = int(os.getenv("UPLOAD_HTTP_POOL_SIZE", "32"))
+# Clips at least this big are uploaded as parallel parts and composed
+COMPOSITE_UPLOAD_THRESHOLD = int(os.getenv("COMPOSITE_UPLOAD_THRESHOLD", str(32 * 1024 * 1024)))
+COMPOSITE_UPLOAD_PARTS = min(int(os.getenv("COMPOSITE_UPLOAD_PARTS", "4")), 32)  # compose takes at most 32 sources
+UPLOAD_RETRY_INITIAL_SECONDS = float(os.getenv("UPLOAD_RETRY_INITIAL_SECONDS", "1"))
+UPLOAD_RETRY_MAX_SECONDS = float(os.getenv("UPLOAD_RETRY_MAX_SECONDS", "30"))
+UPLOAD_RETRY_TIMEOUT_SECONDS = float(os.getenv("UPLOAD_RETRY_TIMEOUT_SECONDS", "300"))
+
+
+def make_storage_client(service_account_file: str, pool_size: int = UPLOAD_HTTP_POOL_SIZE):
+    """
+    Storage client whose HTTP session keeps up to pool_size connections per host.
+    STORAGE_EMULATOR_HOST points it at a local fake server with anonymous credentials.
+    """
+    from google.auth.credentials import AnonymousCredentials
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import storage
+    from google.oauth2 import service_account
+    import requests
+
+    if os.getenv("STORAGE_EMULATOR_HOST"):
+        credentials, project = AnonymousCredentials(), None
+    else:
+        credentials = service_account.Credentials.from_service_account_file(
+            service_account_file, scopes=storage.Client.SCOPE)
+        project = credentials.project_id
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return storage.Client(project=project, credentials=credentials, _http=session)
+
+
+def upload_retry(initial: float = UPLOAD_RETRY_INITIAL_SECONDS, maximum: float = UPLOAD_RETRY_MAX_SECONDS,
+                 timeout: float = UPLOAD_RETRY_TIMEOUT_SECONDS):
+    """
+    Exponential backoff on transient GCS errors (429, 5xx, connection resets).
+    """
+    from google.cloud.storage.retry import DEFAULT_RETRY
+
+    return DEFAULT_RETRY.with_delay(initial=initial, maximum=maximum, multiplier=2).with_timeout(timeout)
+
+
+class StreamingGcsUpload:
+    """
+    File-like sink that uploads to a blob while it is being written, through a GCS resumable
+    upload fed by a background thread so a slow chunk PUT doesn't stall the writer. The thread
+    also checksums what it uploads, since the writer doesn't return the finished object.
+    """
+    def __init__(self, blob, chunk_size: int = UPLOAD_CHUNK_SIZE, content_type: str = "video/mp4", retry=None):
+        import google_crc32c
+
+        self.blob = blob
+        self.bytes_written = 0
+        self.started = time.monotonic()
+        self._writer = blob.open("wb", chunk_size=chunk_size, content_type=content_type,
+                                 retry=retry or upload_retry())
+        self._chunks = queue.Queue(maxsize=64)
+        self._checksum = google_crc32c.Checksum()
+        self._error = None
+        self._thread = threading.Thread(target=self._upload, daemon=True)
+        self._thread.start()
+
+    def _upload(self):
+        while (data := self._chunks.get()) is not None:
+            if self._error:
+                continue  # keep draining so the writer never blocks on a full queue
+            try:
+                self._writer.write(data)
+                self._checksum.update(data)
+            except Exception as e:
+                self._error = e
+
+    def write(self, data: bytes):
+        if self._error:
+            raise self._error
+        self._chunks.put(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def close(self):
+        """Upload whatever is buffered and finalize the object."""
+        self._chunks.put(None)
+        self._thread.join()
+        if self._error:
+            self._writer.terminate()
+            raise self._error
+        self._writer.close()
+
+    @property
+    def crc32c(self) -> str:
+        """Base64 CRC32C of the bytes written so far, as GCS reports it for an object."""
+        return base64.b64encode(self._checksum.digest()).decode()
+
+    def abort(self):
+        """Cancel the upload; nothing is written to the bucket."""
+        self._chunks.put(None)
+        self._thread.join()
+        self._writer.terminate()
+
+
+class GcsUploader:
+    """
+    Uploads clips to one bucket. client is a storage client, or a function returning one that
+    is called on first use (or by warmup()) so building it stays off the import path.
+    """
+    def __init__(self, client, bucket_name: str, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                 composite_threshold: int = COMPOSITE_UPLOAD_THRESHOLD, composite_parts: int = COMPOSITE_UPLOAD_PARTS,
+                 retry=None):
+        self._make_client: Optional[Callable] = client if callable(client) else None
+        self._client = None if callable(client) else client
+        self._bucket = None
+        self._retry = retry
+        self._init_lock = threading.Lock()
+        self.bucket_name = bucket_name
+        self.chunk_size = chunk_size
+        self.composite_threshold = composite_threshold
+        self.composite_parts = composite_parts
+        self.client_init_seconds: Optional[float] = None
+        self.recent = deque(maxlen=50)
+        self._parts_executor = ThreadPoolExecutor(max_workers=composite_parts, thread_name_prefix="gcs-part")
+
+    def warmup(self):
+        """Build the client, bucket handle and retry policy now rather than on the first upload."""
+        if self._bucket is not None:
+            return
+        with self._init_lock:
+            if self._bucket is not None:
+                return
+            started = time.monotonic()
+            if self._client is None:
+                self._client = self._make_client()
+            self._retry = self._retry or upload_retry()
+            self._bucket = self._client.bucket(self.bucket_name)
+            self.client_init_seconds = round(time.monotonic() - started, 3)
+            logging.info(f"GCS client for bucket {self.bucket_name} ready in {self.client_init_seconds}s.")
+
+    @property
+    def ready(self):
+        return self._bucket is not None
+
+    @property
+    def client(self):
+        self.warmup()
+        return self._client
+
+    @property
+    def bucket(self):
+        self.warmup()
+        return self._bucket
+
+    @property
+    def retry(self):
+        self.warmup()
+        return self._retry
+
+    def _record(self, blob_name: str, size: int, started: float, parts: int = 1, crc32c: Optional[str] = None):
+        seconds = time.monotonic() - started
+        stats = {
+            "upload_bytes": size,
+            "upload_seconds": round(seconds, 3),
+            "upload_bytes_per_second": round(size / seconds) if seconds else None,
+            "upload_parts": parts,
+            "upload_crc32c": crc32c,
+        }
+        self.recent.append(stats)
+        logging.info(f"Uploaded {size} bytes to {blob_name} in {seconds:.2f}s ({parts} part(s)).")
+        return stats
+
+    def upload_file(self, path: str, blob_name: str, content_type: str = "video/mp4",
+                    cache_control: Optional[str] = None):
+        """
+        Upload a local file, in parallel composed parts when it is large. Returns upload stats.
+        """
+        size = os.path.getsize(path)
+        started = time.monotonic()
+        blob = self.bucket.blob(blob_name, chunk_size=self.chunk_size)
+        blob.cache_control = cache_control
+        if size < self.composite_threshold or self.composite_parts < 2:
+            blob.upload_from_filename(path, content_type=content_type, retry=self.retry)
+            return self._record(blob_name, size, started, crc32c=blob.crc32c)
+
+        part_size = math.ceil(size / self.composite_parts)
+        part_prefix = f"tmp/composite/{uuid.uuid4()}"
+        parts = [self.bucket.blob(f"{part_prefix}/{n}") for n in range(math.ceil(size / part_size))]
+
+        def upload_part(n):
+            with open(path, "rb") as f:
+                f.seek(n * part_size)
+                parts[n].upload_from_file(f, size=min(part_size, size - n * part_size), retry=self.retry)
+
+        try:
+            list(self._parts_executor.map(upload_part, range(len(parts))))
+            blob.content_type = content_type
+            blob.compose(parts, retry=self.retry)
+        finally:
+            for part in parts:
+                try:
+                    part.delete()
+                except Exception as e:
+                    logging.warning(f"Could not delete composite part {part.name}: {e}")
+        return self._record(blob_name, size, started, parts=len(parts), crc32c=blob.crc32c)
+
+    def open_stream(self, blob_name: str, content_type: str = "video/mp4"):
+        """
+        Start a streaming upload; write to it while the clip is produced, then close() to finalize.
+        """
+        return StreamingGcsUpload(self.bucket.blob(blob_name), self.chunk_size, content_type, self.retry)
+
+    def finish_stream(self, upload: StreamingGcsUpload):
+        """
+        Finalize a streaming upload and return its stats.
+        """
+        upload.close()
+        return self._record(upload.blob.name, upload.bytes_written, upload.started, crc32c=upload.crc32c)
+
+    def stats(self):
+        rates = [u["upload_bytes_per_second"] for u in self.recent if u["upload_bytes_per_second"]]
+        return {
+            "client_ready": self.ready,
+            "client_init_seconds": self.client_init_seconds,
+            "recent_uploads": len(self.recent),
+            "avg_bytes_per_second": round(sum(rates) / len(rates)) if rates else None,
+            "last": self.recent[-1] if self.recent else None,
+        }
@@ -0,0 +1,109 @@
+import os
+import pytest
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+from fake_gcs import FakeGcsServer
+from uploader import GcsUploader, StreamingGcsUpload, upload_retry
+
+BUCKET = "fogcat-webcam"
+
+
+@pytest.fixture
+def fake_gcs():
+    """A local fake GCS server and a storage client pointed at it."""
+    with FakeGcsServer() as server:
+        yield server, storage.Client(project="test", credentials=AnonymousCredentials(),
+                                     client_options={"api_endpoint": server.url})
+
+
+@pytest.fixture
+def clip(tmp_path):
+    data = os.urandom(3 * 256 * 1024 + 1000)
+    path = tmp_path / "seacliff-test.mp4"
+    path.write_bytes(data)
+    return str(path), data
+
+
+def test_upload_file_single_stream(fake_gcs, clip):
+    """Test that clips under the composite threshold are uploaded as one object."""
+    server, gcs = fake_gcs
+    path, data = clip
+    uploader = GcsUploader(gcs, BUCKET, chunk_size=256 * 1024, composite_threshold=len(data) + 1)
+    stats = uploader.upload_file(path, "2025/01/seacliff-test.mp4")
+    assert server.objects[(BUCKET, "2025/01/seacliff-test.mp4")] == data
+    assert stats["upload_bytes"] == len(data)
+    assert stats["upload_parts"] == 1
+    assert stats["upload_bytes_per_second"] > 0
+    assert stats["upload_crc32c"] == server.metadata[(BUCKET, "2025/01/seacliff-test.mp4")]["crc32c"]
+    assert uploader.stats()["recent_uploads"] == 1
+
+
+def test_upload_file_sets_cache_control(fake_gcs, tmp_path):
+    """Test that an upload can carry a content type and Cache-Control header."""
+    server, gcs = fake_gcs
+    poster = tmp_path / "poster.jpg"
+    poster.write_bytes(b"\xff\xd8jpeg")
+    GcsUploader(gcs, BUCKET).upload_file(str(poster), "latest.jpg", "image/jpeg", "public, max-age=60")
+    assert server.metadata[(BUCKET, "latest.jpg")]["contentType"] == "image/jpeg"
+    assert server.metadata[(BUCKET, "latest.jpg")]["cacheControl"] == "public, max-age=60"
+
+
+def test_upload_file_parallel_composite(fake_gcs, clip):
+    """Test that large clips are uploaded as parallel parts, composed, and the parts removed."""
+    server, gcs = fake_gcs
+    path, data = clip
+    uploader = GcsUploader(gcs, BUCKET, chunk_size=256 * 1024, composite_threshold=1024, composite_parts=3)
+    stats = uploader.upload_file(path, "2025/01/seacliff-test.mp4")
+    assert server.objects[(BUCKET, "2025/01/seacliff-test.mp4")] == data
+    assert server.metadata[(BUCKET, "2025/01/seacliff-test.mp4")]["contentType"] == "video/mp4"
+    assert stats["upload_parts"] == 3
+    assert stats["upload_crc32c"] == server.metadata[(BUCKET, "2025/01/seacliff-test.mp4")]["crc32c"]
+    assert list(server.objects) == [(BUCKET, "2025/01/seacliff-test.mp4")]
+
+
+def test_upload_file_retries_transient_errors(fake_gcs, clip):
+    """Test that transient 503s are retried with backoff instead of failing the upload."""
+    server, gcs = fake_gcs
+    path, data = clip
+    uploader = GcsUploader(gcs, BUCKET, chunk_size=256 * 1024, composite_threshold=len(data) + 1,
+                           retry=upload_retry(initial=0.01, maximum=0.05, timeout=10))
+    server.fail_next(2)
+    uploader.upload_file(path, "2025/01/seacliff-test.mp4")
+    assert server.objects[(BUCKET, "2025/01/seacliff-test.mp4")] == data
+
+
+def test_streaming_upload_to_fake_gcs(fake_gcs):
+    """Test that streamed output is uploaded in resumable chunks and finalized on close."""
+    server, gcs = fake_gcs
+    data = os.urandom(3 * 256 * 1024 + 1000)
+    upload = StreamingGcsUpload(gcs.bucket(BUCKET).blob("2025/01/clip.mp4"), chunk_size=256 * 1024)
+    for i in range(0, len(data), 64 * 1024):
+        upload.write(data[i:i + 64 * 1024])
+    upload.close()
+    assert server.objects[(BUCKET, "2025/01/clip.mp4")] == data
+    assert upload.crc32c == server.metadata[(BUCKET, "2025/01/clip.mp4")]["crc32c"]
+    assert server.metadata[(BUCKET, "2025/01/clip.mp4")]["contentType"] == "video/mp4"
+    assert sum(1 for method, _ in server.requests if method == "PUT") == 4
+
+
+def test_streaming_upload_abort(fake_gcs):
+    """Test that an aborted streaming upload leaves no object behind."""
+    server, gcs = fake_gcs
+    upload = StreamingGcsUpload(gcs.bucket(BUCKET).blob("2025/01/partial.mp4"), chunk_size=256 * 1024)
+    upload.write(os.urandom(512 * 1024))
+    upload.abort()
+    assert (BUCKET, "2025/01/partial.mp4") not in server.objects
+
+
+def test_client_built_once_on_first_use(fake_gcs, clip):
+    """Test that a client factory is only called when the uploader is first used, and only once."""
+    server, gcs = fake_gcs
+    path, data = clip
+    calls = []
+    uploader = GcsUploader(lambda: calls.append(1) or gcs, BUCKET, chunk_size=256 * 1024,
+                           composite_threshold=len(data) + 1)
+    assert calls == [] and not uploader.stats()["client_ready"]
+    uploader.upload_file(path, "2025/01/a.mp4")
+    uploader.upload_file(path, "2025/01/b.mp4")
+    assert calls == [1]
+    assert uploader.stats()["client_ready"]